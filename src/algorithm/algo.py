@@ -11,20 +11,31 @@ import time
 import os
 import sys
 import logging
-from typing import Dict, Optional
+from typing import Dict, Optional, Sequence
 from dataclasses import dataclass
 
 # Thêm project root vào sys.path để giải quyết vấn đề import
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from data.intersection_config_manager import IntersectionConfigManager
-from algorithm.solver import solve_green_time_optimization
+from algorithm.async_solver import AsyncSolverPool, PendingSolve
+from algorithm.backends import create_green_time_solver
+from algorithm.checkpoint import MAX_CHECKPOINT_AGE_S, ControllerCheckpoint
+from algorithm.common import LatencyHistogram, RollingProfile, SolverStatus
+from algorithm.plan_store import PlanStore
+from algorithm.plan_table import PlanLookupTable
+from algorithm.problem_spec import ProblemSpec
+from algorithm.snapshot import SnapshotRecorder
 
 # === CONSTANTS ===
 KP_H = 20
 KI_H = 5
 N_HAT = 280.0
 CONTROL_INTERVAL_S = 90
+# Ngưỡng kích hoạt / hủy kích hoạt theo tỉ lệ của n̂
+ACTIVATION_FACTOR = 0.85
+DEACTIVATION_FACTOR = 0.70
+PROFILE_WINDOW = 200
 
 @dataclass
 class ControlStepResult:
@@ -40,38 +51,78 @@ class PerimeterController:
     
     # Thiết lập các tham số cho bộ điều khiển PI
     def __init__(self, kp: float = KP_H, ki: float = KI_H, n_hat: float = N_HAT, 
-                 config_file: str = "src/config/intersection_config.json", shared_dict: Optional[Dict] = None,
-                 control_interval_s: int = CONTROL_INTERVAL_S):
+                 config_file: str = "src/config/intersection_config.json", plan_store: Optional[PlanStore] = None,
+                 control_interval_s: int = CONTROL_INTERVAL_S, solver_pool: Optional[AsyncSolverPool] = None,
+                 snapshot_file: Optional[str] = None, backend: Optional[str] = None,
+                 activation_factor: float = ACTIVATION_FACTOR, deactivation_factor: float = DEACTIVATION_FACTOR,
+                 control_law: str = "pi", mpc_params: Optional[Dict] = None, checkpoint_file: Optional[str] = None):
+        self.control_interval_s = control_interval_s
         control_interval_h = control_interval_s / 3600.0
         self.kp = kp * control_interval_h
         self.ki = ki * control_interval_h
         self.n_hat = n_hat
         
-        self.shared_dict = shared_dict
+        self.plan_store = plan_store
         self.is_active = False
 
         # Ngưỡng kích hoạt và hủy kích hoạt thuật toán
-        self.activation_threshold = 0.85 * self.n_hat
-        self.deactivation_threshold = 0.70 * self.n_hat
+        self.activation_threshold = activation_factor * self.n_hat
+        self.deactivation_threshold = deactivation_factor * self.n_hat
+
+        # Luật tính qg: 'pi' (calculate_target_inflow) hoặc 'mpc' (algorithm/mpc.py, mô phỏng MFD trên chân trời dự báo)
+        if control_law not in ("pi", "mpc"):
+            raise ValueError(f"control_law không hợp lệ: '{control_law}' (chọn 'pi' hoặc 'mpc')")
+        self.control_law = control_law
+        self.mpc_planner = self._create_mpc_planner(mpc_params or {}) if control_law == "mpc" else None
 
         # Đọc file cấu hình các nút giao cần điều khiển
         self.config_manager = IntersectionConfigManager(config_file)
         self.intersection_ids = self.config_manager.get_intersection_ids()
+        # Đặc tả bài toán dạng mảng, biên dịch một lần và dùng chung với bộ giải
+        self.spec = ProblemSpec.compile(self.config_manager)
         
         # Lấy và lưu trữ thời gian đèn xanh ban đầu (chu kỳ cố định)
         self.initial_green_times = self.config_manager.get_initial_green_times()
         self.previous_green_times = self.initial_green_times.copy()
+
+        # Bộ giải (backend theo tham số 'backend', mặc định 'solver_backend' trong cấu hình) được xây dựng một lần
+        # và tái sử dụng qua các bước điều khiển.
+        # Chế độ bất đồng bộ: bộ giải chạy trong solver_pool, phương án được áp dụng tại ranh giới chu kỳ.
+        self.solver_pool = solver_pool
+        self.solver = create_green_time_solver(self.config_manager, backend, spec=self.spec) if solver_pool is None else None
+        self.solver_latency = LatencyHistogram()
+        # Thời gian từng giai đoạn và thống kê của bộ giải (result['profile']) trên cửa sổ trượt
+        self.solver_profile = RollingProfile(window=PROFILE_WINDOW)
+        self.control_step = 0
+        self._pending: Optional[PendingSolve] = None
+        self.async_stats = {'applied': 0, 'late': 0, 'superseded': 0, 'discarded': 0}
+        # Ghi đầu vào của bộ giải ở mỗi bước (tùy chọn) để phát lại bằng tools/replay_solver_snapshots.py
+        self.snapshot_recorder = SnapshotRecorder(snapshot_file, self.spec) if snapshot_file else None
+        # Điểm khôi phục ghi sau mỗi bước (tùy chọn), dùng bởi from_checkpoint khi khởi động lại
+        self.checkpoint_file = checkpoint_file
+        self.last_n = 0.0
+        self.last_qg = 0.0
         
-        # Share dict được sử dụng để chia sẻ trạng thái với các thành phần khác trong chương trình
-        if self.shared_dict is not None:
-            self.shared_dict['is_active'] = self.is_active
-            self.shared_dict['green_times'] = self.initial_green_times
+        # Kho phương án dùng để chia sẻ trạng thái với bộ lập lịch lệnh đèn
+        if self.plan_store is not None:
+            self.plan_store.publish(is_active=self.is_active, green_times=self.initial_green_times)
 
         logging.info("Bộ điều khiển chu vi đã được khởi tạo (hỗ trợ nhiều pha phụ).")
         logging.info(f"Ngưỡng kích hoạt: n(k) > {self.activation_threshold:.0f} xe")
         logging.info(f"Ngưỡng hủy: n(k) < {self.deactivation_threshold:.0f} xe")
         logging.info(f"Số intersection: {len(self.intersection_ids)}")
 
+    def _create_mpc_planner(self, mpc_params: Dict):
+        """MPCPlanner với MFD từ mpc_params ('mfd_g_max', 'mfd_n_crit') và các tham số còn lại của MPCPlanner."""
+        from algorithm.mpc import MPCPlanner
+        from algorithm.tuning import MFDSurrogate
+
+        params = dict(mpc_params)
+        surrogate = MFDSurrogate(g_max=params.pop('mfd_g_max', MFDSurrogate.g_max),
+                                 n_crit=params.pop('mfd_n_crit', self.n_hat),
+                                 control_interval_s=self.control_interval_s)
+        return MPCPlanner(surrogate=surrogate, n_hat=self.n_hat, **params)
+
     def check_activation_status(self, n_k: float):
         if n_k > self.activation_threshold:
             if not self.is_active:
@@ -83,11 +134,14 @@ class PerimeterController:
                 self.is_active = False
                 # Khôi phục lại thời gian đèn xanh ban đầu
                 self.previous_green_times = self.initial_green_times.copy()
-                if self.shared_dict is not None:
-                    self.shared_dict['green_times'] = self.initial_green_times
-        
-        if self.shared_dict is not None:
-            self.shared_dict['is_active'] = self.is_active
+                if self._pending is not None:
+                    self._discard_pending('discarded')
+                if self.plan_store is not None:
+                    self.plan_store.publish(is_active=False, green_times=self.initial_green_times)
+                return
+
+        if self.plan_store is not None and self.plan_store.current.is_active != self.is_active:
+            self.plan_store.publish(is_active=self.is_active)
 
     def calculate_target_inflow(self, n_k: float, n_k_minus_1: float, qg_k_minus_1: float) -> float:
         error = self.n_hat - n_k
@@ -98,47 +152,138 @@ class PerimeterController:
         logging.info(f"PI Output: qg(k) = {qg_k:.2f} xe/giờ")
         return max(0, qg_k)
 
-    def distribute_inflow_to_green_times(self, target_inflow: float, live_queue_lengths: Optional[Dict] = None):
-        result = solve_green_time_optimization(
+    def distribute_inflow_to_green_times(self, target_inflow: float, live_queue_lengths: Optional[Dict] = None) -> Optional[Dict]:
+        solve_start = time.perf_counter()
+        result = self.solver.solve(
             target_inflow=target_inflow,
-            config_manager=self.config_manager,
             previous_green_times=self.previous_green_times,
             live_queue_lengths=live_queue_lengths
         )
+        self.apply_solver_result(result, time.perf_counter() - solve_start)
+        return result
+
+    def apply_solver_result(self, result: Optional[Dict], latency_s: float):
+        """Ghi nhận độ trễ và áp dụng phương án của bộ giải (hoặc giữ nguyên nếu không có nghiệm)."""
+        self.solver_latency.record(latency_s)
+        logging.info(f"Thời gian giải: {latency_s:.3f}s (trung bình {self.solver_latency.mean():.3f}s, "
+                     f"lớn nhất {self.solver_latency.max:.3f}s qua {self.solver_latency.total} bước)")
+        logging.debug(f"Histogram thời gian giải: {self.solver_latency.as_dict()}")
+        if result and result.get('profile'):
+            self.solver_profile.record(result['profile'])
+            logging.debug(f"Profile bộ giải: {result['profile']}")
+            if self.solver_latency.total % PROFILE_WINDOW == 0:
+                logging.info(f"Phân vị profile bộ giải ({PROFILE_WINDOW} bước gần nhất): {self.solver_profile.summary()}")
+        if result and 'cache_hit' in result and self.solver is not None:
+            logging.debug(f"Bộ nhớ đệm bộ giải ({'trúng' if result['cache_hit'] else 'trượt'}): {self.solver.stats()}")
         
-        if result:
+        if result and result['status'] in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE):
+            if result['status'] != SolverStatus.OPTIMAL:
+                logging.warning(f"Dùng nghiệm khả thi tốt nhất ({result.get('backend_status')}), gap={result.get('gap', 0):.2%}")
             logging.info("Thời gian đèn xanh mới:")
-            total_inflow = 0
-            new_green_times = {}
+            G = self.spec.vector_from_variables(result['variables'])
+            inflows = self.spec.primary_inflows(G)
+            new_green_times = self.spec.green_times_from_vector(G)
 
-            for int_id in self.intersection_ids:
-                phase_info = self.config_manager.get_phase_info(int_id)
-                if not phase_info: continue
-
-                G_p = result['variables'][f'G_{int_id}_p']
-                new_green_times[int_id] = {'p': int(G_p), 's': []}
-
-                inflow_p = (G_p * phase_info['p']['saturation_flow'] * phase_info['p']['turn_in_ratio'])
-                total_inflow += inflow_p
-                logging.info(f"  {int_id}: G_p={G_p:.0f}s, inflow={inflow_p:.1f} xe/chu kỳ")
-
-                if 's' in phase_info:
-                    for i, _ in enumerate(phase_info['s']):
-                        G_s = result['variables'][f'G_{int_id}_s_{i}']
-                        new_green_times[int_id]['s'].append(int(G_s))
-                        logging.info(f"    └─ G_s{i}={G_s:.0f}s")
+            for index, int_id in enumerate(self.spec.intersection_ids):
+                start, end = self.spec.phase_offsets[index], self.spec.phase_offsets[index + 1]
+                logging.info(f"  {int_id}: G_p={G[start]:.0f}s, inflow={inflows[index]:.1f} xe/chu kỳ")
+                for i, G_s in enumerate(G[start + 1:end]):
+                    logging.info(f"    └─ G_s{i}={G_s:.0f}s")
+            total_inflow = float(inflows.sum())
             
             self.previous_green_times = new_green_times
-            if self.shared_dict is not None:
-                self.shared_dict['green_times'] = new_green_times
+            if self.plan_store is not None:
+                self.plan_store.publish(green_times=new_green_times)
 
             logging.info(f"Tổng lưu lượng dự kiến (từ các pha chính): {total_inflow:.2f} xe/chu kỳ")
+        elif result and result.get('diagnosis'):
+            logging.warning("Bài toán không khả thi (phát hiện khi tiền xử lý), giữ nguyên thời gian đèn xanh:")
+            for message in result['diagnosis']:
+                logging.warning(f"  {message}")
         else:
             logging.warning("Không tìm được nghiệm tối ưu, giữ nguyên thời gian đèn xanh.")
 
-    def run_simulation_step(self, n_current: float, n_previous: float, qg_previous: float, live_queue_lengths: Optional[Dict] = None) -> ControlStepResult:
+    def build_plan_table(self, target_inflows: Sequence[float],
+                         live_queue_lengths: Optional[Dict] = None) -> Optional[PlanLookupTable]:
+        """
+        Bảng tra cứu qg → phương án cho phương án đang áp dụng và hàng đợi hiện tại, dùng cho truy vấn
+        what-if hoặc chỉnh hệ số PI mà không cần giải lại (backend 'dp' cho bảng chính xác với mọi qg).
+        """
+        if self.solver is not None:
+            return self.solver.solve_batch(target_inflows, self.previous_green_times, live_queue_lengths)
+        # Chế độ bất đồng bộ: bộ giải tạm trong tiến trình này
+        solver = create_green_time_solver(self.config_manager, spec=self.spec)
+        try:
+            return solver.solve_batch(target_inflows, self.previous_green_times, live_queue_lengths)
+        finally:
+            solver.close()
+
+    def submit_inflow_distribution(self, target_inflow: float, live_queue_lengths: Optional[Dict] = None,
+                                   sim_time: float = 0.0):
+        """Chế độ bất đồng bộ: gửi bài toán tới tiến trình giải, không chờ kết quả."""
+        if self._pending is not None:
+            # Kết quả của bước trước chưa được áp dụng và đã lỗi thời so với qg mới
+            self._discard_pending('superseded')
+        future = self.solver_pool.submit(target_inflow, self.previous_green_times, live_queue_lengths)
+        self._pending = PendingSolve(future=future, step=self.control_step,
+                                     target_inflow=target_inflow, submitted_at=sim_time)
+        logging.info(f"Đã gửi bài toán của bước {self.control_step} tới tiến trình giải (t={sim_time:.1f}s)")
+
+    def apply_ready_plan(self, sim_time: float) -> bool:
+        """
+        Gọi ở mỗi bước của vòng lặp mô phỏng trong chế độ bất đồng bộ: công bố phương án ngay khi kết quả
+        sẵn sàng (việc chờ ranh giới chu kỳ của từng đèn do bộ lập lịch lệnh đèn đảm nhận). Kết quả chưa có
+        sau một chu kỳ mặc định kể từ lúc gửi được đánh dấu trễ; kết quả tiếp tục chờ trừ khi bị thay thế
+        bởi bước điều khiển mới hoặc bộ điều khiển bị hủy kích hoạt.
+
+        Returns:
+            True nếu một phương án mới đã được áp dụng.
+        """
+        pending = self._pending
+        if pending is None:
+            return False
+        if not pending.future.done():
+            if not pending.late and sim_time >= pending.submitted_at + self.spec.default_cycle_length:
+                pending.late = True
+                self.async_stats['late'] += 1
+                logging.warning(f"Kết quả của bước {pending.step} (gửi lúc t={pending.submitted_at:.1f}s) chưa sẵn sàng "
+                                f"tại t={sim_time:.1f}s, giữ nguyên thời gian đèn xanh")
+            return False
+
+        self._pending = None
+        try:
+            result = pending.future.result()
+        except Exception as e:
+            logging.error(f"Lỗi trong tiến trình giải ở bước {pending.step}: {e}")
+            return False
+        if pending.late:
+            logging.info(f"Áp dụng kết quả trễ của bước {pending.step} tại t={sim_time:.1f}s")
+        latency_s = pending.latency_s
+        self.apply_solver_result(result, latency_s if latency_s is not None else time.perf_counter() - pending.submitted_wall)
+        self.async_stats['applied'] += 1
+        return True
+
+    def _discard_pending(self, reason: str):
+        """Bỏ kết quả đang chờ (reason là khóa trong async_stats)."""
+        pending, self._pending = self._pending, None
+        pending.future.cancel()
+        self.async_stats[reason] += 1
+        logging.warning(f"Bỏ kết quả bộ giải của bước {pending.step} ({reason})")
+
+    def run_simulation_step(self, n_current: float, n_previous: float, qg_previous: float,
+                            live_queue_lengths: Optional[Dict] = None, sim_time: float = 0.0) -> ControlStepResult:
+        result = self._control_step(n_current, n_previous, qg_previous, live_queue_lengths, sim_time)
+        self.last_n, self.last_qg = result.n_current, result.qg_new
+        if self.checkpoint_file:
+            self.save_checkpoint(self.checkpoint_file, sim_time)
+        return result
+
+    def _control_step(self, n_current: float, n_previous: float, qg_previous: float,
+                      live_queue_lengths: Optional[Dict], sim_time: float) -> ControlStepResult:
+        self.control_step += 1
         logging.info(f"{ '='*15} BƯỚC ĐIỀU KHIỂN {'='*15}")
         logging.info(f"Đo lường - Trạng thái hiện tại: n(k) = {n_current:.0f} xe")
+        was_active = self.is_active
         self.check_activation_status(n_current)
 
         if not self.is_active:
@@ -146,11 +291,92 @@ class PerimeterController:
             return ControlStepResult(n_current=n_current, qg_new=qg_previous, is_active=False)
 
         logging.info("Tính toán lưu lượng mục tiêu qg")
-        qg_new = self.calculate_target_inflow(n_k=n_current, n_k_minus_1=n_previous, qg_k_minus_1=qg_previous)
+        if self.mpc_planner is not None:
+            plan_start = time.perf_counter()
+            qg_new = self.mpc_planner.plan(n_current, n_previous, qg_previous, was_active)
+            logging.info(f"MPC Output: qg(k) = {qg_new:.2f} xe/giờ ({(time.perf_counter() - plan_start) * 1000:.1f} ms)")
+        else:
+            qg_new = self.calculate_target_inflow(n_k=n_current, n_k_minus_1=n_previous, qg_k_minus_1=qg_previous)
 
         logging.info("Phân bổ thành thời gian đèn xanh")
-        self.distribute_inflow_to_green_times(qg_new, live_queue_lengths)
+        previous_green_times = self.previous_green_times
+        solver_result = None
+        if self.solver_pool is not None:
+            self.submit_inflow_distribution(qg_new, live_queue_lengths, sim_time)
+        else:
+            solver_result = self.distribute_inflow_to_green_times(qg_new, live_queue_lengths)
+        if self.snapshot_recorder is not None:
+            # Chế độ đồng bộ: ghi kèm kết quả lúc chạy để kiểm tra khi phát lại
+            self.snapshot_recorder.record(self.control_step, sim_time, qg_new, previous_green_times, live_queue_lengths,
+                                          solver_result, self.solver.name if self.solver is not None else None)
         
         return ControlStepResult(n_current=n_current, qg_new=qg_new, is_active=True)
 
+    def checkpoint(self, sim_time: float = 0.0) -> ControllerCheckpoint:
+        """Trạng thái hiện tại (phương án đang áp dụng, n(k), qg(k) và trạng thái kích hoạt của bước cuối)."""
+        return ControllerCheckpoint(
+            step=self.control_step,
+            sim_time=sim_time,
+            n_current=float(self.last_n),
+            qg=float(self.last_qg),
+            is_active=self.is_active,
+            green=self.spec.green_vector(self.previous_green_times),
+            spec_hash=self.spec.fingerprint(),
+            saved_at=time.time()
+        )
+
+    def save_checkpoint(self, path: str, sim_time: float = 0.0):
+        try:
+            self.checkpoint(sim_time).save(path)
+        except OSError as e:
+            logging.error(f"Không ghi được điểm khôi phục {path}: {e}")
+
+    def restore(self, checkpoint: ControllerCheckpoint):
+        """
+        Khôi phục trạng thái từ điểm khôi phục.
+
+        Raises:
+            ValueError: Nếu điểm khôi phục được ghi với mạng lưới/cấu hình pha khác.
+        """
+        if checkpoint.spec_hash != self.spec.fingerprint():
+            raise ValueError("Điểm khôi phục được ghi với cấu hình nút giao khác, không thể khôi phục")
+        self.control_step = checkpoint.step
+        self.is_active = checkpoint.is_active
+        self.last_n, self.last_qg = checkpoint.n_current, checkpoint.qg
+        self.previous_green_times = (self.spec.green_times_from_vector(checkpoint.green) if checkpoint.is_active
+                                     else self.initial_green_times.copy())
+        if self.plan_store is not None:
+            self.plan_store.publish(is_active=self.is_active, green_times=self.previous_green_times)
+        logging.info(f"Khôi phục bộ điều khiển từ bước {checkpoint.step} (t={checkpoint.sim_time:.1f}s, "
+                     f"ghi {checkpoint.age_s:.0f}s trước): n={checkpoint.n_current:.0f} xe, qg={checkpoint.qg:.2f} xe/giờ, "
+                     f"{'đang hoạt động' if checkpoint.is_active else 'không hoạt động'}")
+
+    @classmethod
+    def from_checkpoint(cls, path: str, resume_time: Optional[float] = None,
+                        max_age_s: Optional[float] = MAX_CHECKPOINT_AGE_S, **kwargs) -> 'PerimeterController':
+        """
+        Tạo bộ điều khiển (kwargs như __init__) và khôi phục trạng thái từ file điểm khôi phục.
+        Nếu kwargs không có 'checkpoint_file', bộ điều khiển tiếp tục ghi vào chính file này.
+
+        Args:
+            resume_time: Thời gian mô phỏng [s] tại lúc khởi động lại; nếu có, điểm khôi phục phải được ghi
+                         trong vòng một chu kỳ điều khiển trước thời điểm này và không cũ hơn max_age_s.
+
+        Raises:
+            FileNotFoundError, ValueError: Nếu file không tồn tại, không hợp lệ, không khớp cấu hình
+            hoặc không khớp thời điểm tiếp tục mô phỏng.
+        """
+        checkpoint = ControllerCheckpoint.load(path)
+        if resume_time is not None:
+            checkpoint.check_resume(resume_time, CONTROL_INTERVAL_S, max_age_s)
+        kwargs.setdefault('checkpoint_file', path)
+        controller = cls(**kwargs)
+        controller.restore(checkpoint)
+        return controller
 
+    def close(self):
+        """Đóng bộ giải và file ảnh chụp bài toán (nếu có)."""
+        if self.solver is not None:
+            self.solver.close()
+        if self.snapshot_recorder is not None:
+            self.snapshot_recorder.close()
@@ -0,0 +1,86 @@
+"""
+Chạy bộ giải trong tiến trình riêng (concurrent.futures) để vòng lặp mô phỏng không bị chặn.
+
+Mỗi tiến trình con xây dựng backend một lần (initializer) và tái sử dụng qua các bước điều khiển,
+giống như bộ giải bền vững trong tiến trình chính. Bộ điều khiển gửi bài toán qua submit() và
+nhận Future; phương án chỉ được áp dụng tại ranh giới chu kỳ đèn khi kết quả đã sẵn sàng.
+"""
+
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from algorithm.backends import create_green_time_solver
+from data.intersection_config_manager import IntersectionConfigManager
+
+# Bộ giải của tiến trình con (khởi tạo bởi _init_worker)
+_worker_solver = None
+
+
+def _init_worker(config_file: str, backend: Optional[str]):
+    global _worker_solver
+    _worker_solver = create_green_time_solver(IntersectionConfigManager(config_file), backend)
+
+
+def _solve_in_worker(target_inflow: float, previous_green_times: Dict, live_queue_lengths: Optional[Dict]) -> Optional[Dict]:
+    return _worker_solver.solve(target_inflow, previous_green_times, live_queue_lengths)
+
+
+@dataclass
+class PendingSolve:
+    """Một lần giải đang chạy trong tiến trình con."""
+    future: Future
+    step: int                      # Số thứ tự bước điều khiển đã gửi bài toán
+    target_inflow: float
+    submitted_at: float            # Thời gian mô phỏng lúc gửi [s]
+    submitted_wall: float = field(default_factory=time.perf_counter)
+    completed_wall: Optional[float] = None
+    late: bool = False             # Chưa có kết quả sau một chu kỳ đèn mặc định kể từ lúc gửi
+
+    def __post_init__(self):
+        self.future.add_done_callback(self._mark_completed)
+
+    def _mark_completed(self, _future: Future):
+        self.completed_wall = time.perf_counter()
+
+    @property
+    def latency_s(self) -> Optional[float]:
+        """Thời gian thực từ lúc gửi tới lúc có kết quả (None nếu chưa xong)."""
+        if self.completed_wall is None:
+            return None
+        return self.completed_wall - self.submitted_wall
+
+
+class AsyncSolverPool:
+    """
+    Nhóm tiến trình giải bài toán phân bổ thời gian xanh.
+    """
+
+    def __init__(self, config_file: str, backend: Optional[str] = None, max_workers: int = 1):
+        """
+        Args:
+            config_file: Đường dẫn file cấu hình intersection (mỗi tiến trình con tự đọc).
+            backend: Tên backend; mặc định lấy 'solver_backend' từ cấu hình.
+            max_workers: Số tiến trình con.
+        """
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(config_file, backend)
+        )
+
+    def submit(self, target_inflow: float, previous_green_times: Dict,
+               live_queue_lengths: Optional[Dict] = None) -> Future:
+        """Gửi một bài toán tới tiến trình con, trả về Future chứa kết quả theo định dạng chung của backend."""
+        return self.executor.submit(_solve_in_worker, target_inflow, previous_green_times, live_queue_lengths)
+
+    def shutdown(self):
+        """Dừng các tiến trình con, hủy các bài toán chưa bắt đầu."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
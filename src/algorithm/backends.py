@@ -0,0 +1,173 @@
+"""
+Giao diện chung cho các bộ giải (backend) bài toán phân bổ thời gian đèn xanh.
+
+Mỗi backend nhận cùng một đầu vào (qg, thời gian xanh chu kỳ trước, hàng đợi trực tiếp) và trả về
+cùng một định dạng kết quả:
+    {'status': SolverStatus.*, 'backend_status': str, 'objective_value': float, 'gap': float,
+     'solve_time': float, 'variables': {'G_<id>_p': ..., 'G_<id>_s_<i>': ...}}
+Backend được chọn qua tham số 'solver_backend' trong 'optimization_parameters'.
+Mọi backend dùng chung một ProblemSpec (algorithm/problem_spec.py) được biên dịch một lần từ cấu hình.
+"""
+
+import importlib
+import logging
+import math
+from typing import Dict, Optional, Sequence
+
+from algorithm.common import SolverStatus
+from algorithm.plan_table import PlanLookupTable
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+# Tên backend -> "module:Lớp". Import trễ để các thư viện tùy chọn chỉ cần khi backend được chọn.
+SOLVER_BACKENDS = {
+    'scip': 'algorithm.solver:GreenTimeSolver',
+    'cpsat': 'algorithm.cpsat_solver:CpSatGreenTimeSolver',
+    'dp': 'algorithm.dp_solver:DynamicProgrammingSolver',
+    'relaxation': 'algorithm.relaxation_solver:RelaxationSolver',
+    'decomposition': 'algorithm.decomposition_solver:DecompositionSolver',
+}
+DEFAULT_BACKEND = 'scip'
+
+# Các độ phân giải lưu lượng (đơn vị nguyên / xe) được thử để lượng tử hóa chính xác hệ số a
+_INFLOW_SCALES = (1, 10, 100, 1000, 10000)
+_SCALE_TOLERANCE = 1e-9
+
+
+def quantize_inflow_coefficients(inflow_coefs: Sequence[float]) -> tuple:
+    """
+    Chọn độ phân giải S nhỏ nhất để mọi hệ số lưu lượng a = saturation_flow·turn_in_ratio
+    thỏa a·S nguyên, rồi rút gọn theo ước chung lớn nhất.
+
+    Returns:
+        (S, [w_i], exact) với a_i ≈ w_i / S; exact = False nếu không có S phù hợp và hệ số đã bị làm tròn.
+    """
+    exact = True
+    for scale in _INFLOW_SCALES:
+        scaled = [float(a) * scale for a in inflow_coefs]
+        if all(abs(x - round(x)) < _SCALE_TOLERANCE for x in scaled):
+            break
+    else:
+        exact = False
+        logging.warning(f"Hệ số lưu lượng không biểu diễn chính xác với độ phân giải {scale}; "
+                        "lưu lượng được làm tròn.")
+    weights = [int(round(x)) for x in scaled]
+    divisor = math.gcd(*weights) if any(weights) else 1
+    return scale / divisor, [w // divisor for w in weights], exact
+
+
+def objective_gap(objective_value: float, reference_objective_value: float) -> float:
+    """Gap tương đối của một nghiệm so với nghiệm tham chiếu trên cùng đầu vào."""
+    return (objective_value - reference_objective_value) / max(abs(reference_objective_value), 1e-9)
+
+
+class GreenTimeSolverBackend:
+    """
+    Lớp cơ sở cho các backend giải bài toán phân bổ thời gian xanh.
+    Lớp con cài đặt solve() và giữ trạng thái cần tái sử dụng giữa các bước điều khiển.
+    """
+
+    name = "base"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 spec: Optional[ProblemSpec] = None):
+        """
+        Args:
+            config_manager: Đối tượng quản lý cấu hình intersection.
+            time_limit_s: Ngân sách thời gian thực (giây) cho mỗi bước giải.
+                          Mặc định lấy 'solver_time_limit_s' từ cấu hình.
+            gap_limit: Ngưỡng gap tương đối để dừng sớm. Mặc định lấy 'solver_gap_limit' từ cấu hình.
+            spec: Đặc tả bài toán đã biên dịch. Mặc định biên dịch từ config_manager.
+        """
+        self.config_manager = config_manager
+        self.spec = spec if spec is not None else ProblemSpec.compile(config_manager)
+        global_params = config_manager.get_global_params()
+        self.time_limit_s = time_limit_s if time_limit_s is not None else global_params.get('solver_time_limit_s', 30.0)
+        self.gap_limit = gap_limit if gap_limit is not None else global_params.get('solver_gap_limit', 0.0)
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Phân bổ lưu lượng mục tiêu qg [xe/giờ] thành thời gian xanh cho từng pha.
+
+        Returns:
+            Dict kết quả theo định dạng chung, hoặc None nếu không tìm được nghiệm.
+        """
+        raise NotImplementedError
+
+    def solve_batch(
+        self,
+        target_inflows: Sequence[float],
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[PlanLookupTable]:
+        """
+        Giải cho một lưới giá trị qg [xe/giờ] với cùng phương án chu kỳ trước và hàng đợi, rồi dựng
+        bảng tra cứu qg → phương án. Bảng chính xác tại các điểm lưới giải được tối ưu; giữa các điểm lưới,
+        bảng trả về phương án tốt nhất trong các phương án đã giải (status FEASIBLE).
+
+        Returns:
+            PlanLookupTable, hoặc None nếu bài toán không khả thi (không phụ thuộc qg).
+        """
+        plans, exact_inflows = [], []
+        for target_inflow in target_inflows:
+            result = self.solve(target_inflow, previous_green_times, live_queue_lengths)
+            if result and result['status'] == SolverStatus.INFEASIBLE:
+                return None
+            if result and result['status'] in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE):
+                plans.append(self.spec.vector_from_variables(result['variables']))
+                if result['status'] == SolverStatus.OPTIMAL:
+                    exact_inflows.append(target_inflow)
+        if not plans:
+            return None
+        return PlanLookupTable.from_plans(self.spec, plans, self.spec.queue_vector(live_queue_lengths), exact_inflows)
+
+    def close(self):
+        """Giải phóng tài nguyên giữ giữa các bước (tiến trình con, bộ giải lồng nhau); mặc định không có gì."""
+
+
+def create_green_time_solver(config_manager: IntersectionConfigManager, backend: Optional[str] = None,
+                             cache_size: Optional[int] = None, **kwargs) -> GreenTimeSolverBackend:
+    """
+    Khởi tạo backend theo tên (mặc định lấy 'solver_backend' từ cấu hình).
+
+    Args:
+        cache_size: Số kết quả tối đa của bộ nhớ đệm LRU đặt trước backend (algorithm/solver_cache.py).
+                    Mặc định lấy 'solver_cache_size' từ cấu hình; 0 = không dùng bộ nhớ đệm.
+        kwargs: Tham số bổ sung cho lớp backend (ví dụ spec, time_limit_s).
+
+    Raises:
+        ValueError: Nếu tên backend không được hỗ trợ.
+    """
+    global_params = config_manager.get_global_params()
+    if backend is None:
+        backend = global_params.get('solver_backend', DEFAULT_BACKEND)
+    if backend not in SOLVER_BACKENDS:
+        raise ValueError(f"Backend bộ giải không được hỗ trợ: '{backend}'. Các lựa chọn: {sorted(SOLVER_BACKENDS)}")
+
+    module_name, class_name = SOLVER_BACKENDS[backend].split(':')
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    if cache_size is None:
+        cache_size = global_params.get('solver_cache_size', 0)
+    if not cache_size:
+        return backend_class(config_manager, **kwargs)
+
+    from algorithm.solver_cache import CachedGreenTimeSolver
+    # spec truyền vào chỉ dùng cho lần xây dựng đầu tiên; khi cấu hình thay đổi, spec được biên dịch lại
+    initial_spec = [kwargs.pop('spec', None)]
+
+    def factory() -> GreenTimeSolverBackend:
+        spec, initial_spec[0] = initial_spec[0], None
+        return backend_class(config_manager, spec=spec, **kwargs)
+
+    return CachedGreenTimeSolver(
+        factory,
+        max_entries=cache_size,
+        qg_resolution=global_params.get('solver_cache_qg_resolution', 1.0),
+        queue_resolution=global_params.get('solver_cache_queue_resolution', 0.5)
+    )
@@ -0,0 +1,102 @@
+"""
+Điểm khôi phục (checkpoint) trạng thái của PerimeterController.
+
+Sau mỗi bước điều khiển, bộ điều khiển ghi một file JSON nhỏ:
+    {"step", "sim_time", "n", "qg", "is_active", "green": [...], "spec_hash", "saved_at"}
+với "green" là phương án đang áp dụng theo thứ tự pha của ProblemSpec. File được ghi ra file tạm rồi đổi tên
+(os.replace), nên một lần ghi bị ngắt giữa chừng không làm hỏng điểm khôi phục trước đó.
+Khi khởi động lại, PerimeterController.from_checkpoint tiếp tục điều khiển từ trạng thái này thay vì
+từ chu kỳ cố định với qg = 0. Điểm khôi phục chỉ được dùng nếu mô phỏng tiếp tục đúng tại thời điểm đã ghi
+(check_resume): file còn lại từ một lần chạy đã kết thúc không được áp cho lần chạy mới từ đầu.
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+# Tuổi tối đa [s] (thời gian thực) của điểm khôi phục được chấp nhận khi khởi động lại
+MAX_CHECKPOINT_AGE_S = 3600.0
+
+
+@dataclass
+class ControllerCheckpoint:
+    """Trạng thái của bộ điều khiển sau một bước điều khiển."""
+    step: int
+    sim_time: float
+    n_current: float                  # n(k) của bước cuối
+    qg: float                         # qg(k) [xe/giờ] của bước cuối
+    is_active: bool
+    green: np.ndarray                 # (m,) phương án đang áp dụng
+    spec_hash: str
+    saved_at: float = 0.0             # time.time() lúc ghi
+
+    def to_record(self) -> dict:
+        return {
+            'step': self.step,
+            'sim_time': round(self.sim_time, 3),
+            'n': self.n_current,
+            'qg': self.qg,
+            'is_active': self.is_active,
+            'green': np.rint(self.green).astype(int).tolist(),
+            'spec_hash': self.spec_hash,
+            'saved_at': round(self.saved_at, 3)
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'ControllerCheckpoint':
+        return cls(
+            step=int(record['step']),
+            sim_time=float(record['sim_time']),
+            n_current=float(record['n']),
+            qg=float(record['qg']),
+            is_active=bool(record['is_active']),
+            green=np.asarray(record['green'], dtype=float),
+            spec_hash=record['spec_hash'],
+            saved_at=float(record.get('saved_at', 0.0))
+        )
+
+    def save(self, path: str):
+        """Ghi nguyên tử: ghi ra '<path>.tmp' rồi đổi tên thành path."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_record(), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ControllerCheckpoint':
+        """
+        Raises:
+            FileNotFoundError: Nếu file không tồn tại.
+            ValueError: Nếu nội dung file không hợp lệ.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                return cls.from_record(json.load(f))
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise ValueError(f"File điểm khôi phục không hợp lệ: {path} ({e})") from e
+
+    @property
+    def age_s(self) -> float:
+        """Thời gian [s] kể từ lúc ghi."""
+        return time.time() - self.saved_at
+
+    def check_resume(self, resume_time: float, max_lag_s: float, max_age_s: Optional[float] = MAX_CHECKPOINT_AGE_S):
+        """
+        Kiểm tra điểm khôi phục có dùng được cho mô phỏng tiếp tục tại resume_time [s] hay không.
+
+        Args:
+            resume_time: Thời gian mô phỏng tại lúc khởi động lại.
+            max_lag_s: Độ trễ tối đa [s] giữa bước điều khiển đã ghi và resume_time (thường là một chu kỳ điều khiển).
+            max_age_s: Tuổi tối đa [s] của file (None = không giới hạn).
+
+        Raises:
+            ValueError: Nếu resume_time không khớp thời điểm đã ghi hoặc file quá cũ.
+        """
+        if not self.sim_time <= resume_time <= self.sim_time + max_lag_s:
+            raise ValueError(f"điểm khôi phục ghi tại t={self.sim_time:.1f}s, mô phỏng tiếp tục tại t={resume_time:.1f}s")
+        if max_age_s is not None and self.age_s > max_age_s:
+            raise ValueError(f"điểm khôi phục đã ghi {self.age_s:.0f}s trước (tối đa {max_age_s:.0f}s)")
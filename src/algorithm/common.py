@@ -2,8 +2,12 @@
 Các định nghĩa chung và Enum được sử dụng trong module thuật toán.
 """
 
+import time
+from collections import deque
 from enum import Enum
 
+import numpy as np
+
 class VariableType(Enum):
     """Loại biến"""
     CONTINUOUS = "continuous"
@@ -23,3 +27,91 @@ class SolverStatus:
     UNBOUNDED = "unbounded"
     UNKNOWN = "unknown"
     ERROR = "error"
+
+class LatencyHistogram:
+    """
+    Histogram độ trễ (giây) theo các ngưỡng cố định, dùng để theo dõi thời gian giải mỗi bước.
+    """
+
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Phần tử cuối cùng đếm các giá trị vượt ngưỡng lớn nhất
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, latency_s: float):
+        """Ghi nhận một giá trị độ trễ."""
+        index = len(self.buckets)
+        for i, upper in enumerate(self.buckets):
+            if latency_s <= upper:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += latency_s
+        self.max = max(self.max, latency_s)
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def as_dict(self) -> dict:
+        """Trả về histogram dạng {'<=0.1s': n, ..., '>60s': n}."""
+        result = {f"<={upper:g}s": count for upper, count in zip(self.buckets, self.counts)}
+        result[f">{self.buckets[-1]:g}s"] = self.counts[-1]
+        return result
+
+class StageTimer:
+    """
+    Đo thời gian thực của từng giai đoạn trong một lần giải (presolve, build, objective, optimize, extract, ...).
+    Mỗi lần gọi lap(name) ghi thời gian kể từ lần gọi trước (hoặc từ lúc khởi tạo) vào giai đoạn 'name'.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        """Kết thúc giai đoạn 'name' (cộng dồn nếu giai đoạn đã có)."""
+        now = time.perf_counter()
+        key = f"{name}_s"
+        self.stages[key] = self.stages.get(key, 0.0) + now - self._last
+        self._last = now
+
+    def as_dict(self) -> dict:
+        """Trả về {'<giai đoạn>_s': giây, ...}."""
+        return dict(self.stages)
+
+class RollingProfile:
+    """
+    Cửa sổ trượt các bản ghi profile (result['profile']) của N bước giải gần nhất,
+    tổng hợp thành các phân vị cho từng chỉ số.
+    """
+
+    DEFAULT_PERCENTILES = (50, 90, 99)
+
+    def __init__(self, window: int = 200, percentiles: tuple = DEFAULT_PERCENTILES):
+        self.percentiles = tuple(percentiles)
+        self.records = deque(maxlen=window)
+
+    def record(self, profile: dict):
+        """Ghi nhận một bản ghi (bỏ qua các giá trị không phải số)."""
+        self.records.append({key: float(value) for key, value in profile.items()
+                             if isinstance(value, (int, float)) and not isinstance(value, bool)})
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def summary(self) -> dict:
+        """Trả về {chỉ số: {'p50': ..., 'p90': ..., 'p99': ..., 'max': ...}} trên cửa sổ hiện tại."""
+        keys = sorted({key for record in self.records for key in record})
+        result = {}
+        for key in keys:
+            values = np.asarray([record[key] for record in self.records if key in record])
+            stats = {f"p{q:g}": float(v) for q, v in zip(self.percentiles, np.percentile(values, self.percentiles))}
+            stats['max'] = float(values.max())
+            result[key] = stats
+        return result
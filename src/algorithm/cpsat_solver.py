@@ -0,0 +1,209 @@
+"""
+Backend OR-Tools CP-SAT cho bài toán phân bổ thời gian đèn xanh.
+
+Miền của mỗi biến G là [prev - max_change, prev + max_change] ∩ [min_green, cycle - min_green], nên:
+- Thành phần sử dụng đèn xanh θ2·(1 - c·G)² được lập bảng chính xác trên từng giá trị nguyên (AddElement).
+- Thành phần độ lệch θ1·(Σ a·G_p - qg')² được tính qua tổng nguyên X = Σ w·G_p với a = w/S
+  (quantize_inflow_coefficients) và tích D·D (AddMultiplicationEquality), với D = X - round(qg'·S).
+Hàm mục tiêu được nhân với một hệ số đủ lớn rồi làm tròn để có hệ số nguyên; hệ số nhân được chọn để hệ số
+của D² là số nguyên chính xác, sai số làm tròn còn lại (bảng chi phí, hệ số của D) được ghi trong profile.
+Nếu hệ số lưu lượng đã bị làm tròn (không có S phù hợp), nghiệm chỉ tối ưu cho bài toán xấp xỉ và được báo
+FEASIBLE với backend_status 'rounded_inflow', như backend 'dp'.
+Nút giao chỉ có một pha phụ được khử G_s qua tiền xử lý (algorithm/presolve.py).
+"""
+
+import math
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from algorithm.common import SolverStatus, StageTimer
+from algorithm.backends import GreenTimeSolverBackend, quantize_inflow_coefficients
+from algorithm.presolve import infeasible_result, presolve_green_time_windows
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+# Hệ số nhân tối thiểu của hàm mục tiêu trước khi làm tròn thành số nguyên
+OBJECTIVE_SCALE = 1_000_000
+# Hệ số nguyên tối thiểu của D² để phần làm tròn thành phần độ lệch không đáng kể
+MIN_DEVIATION_COEF = 1000
+
+
+class CpSatGreenTimeSolver(GreenTimeSolverBackend):
+    """
+    Backend 'cpsat': giải bài toán bằng bộ tìm kiếm đa luồng CP-SAT.
+    """
+
+    name = "cpsat"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 num_workers: Optional[int] = None, spec: Optional[ProblemSpec] = None):
+        """
+        Args:
+            config_manager: Đối tượng quản lý cấu hình intersection.
+            time_limit_s: Ngân sách thời gian thực (giây) cho mỗi bước giải.
+            gap_limit: Ngưỡng gap tương đối để dừng sớm.
+            num_workers: Số luồng tìm kiếm. Mặc định lấy 'solver_num_workers' từ cấu hình.
+            spec: Đặc tả bài toán đã biên dịch (dùng chung với bộ điều khiển).
+        """
+        super().__init__(config_manager, time_limit_s=time_limit_s, gap_limit=gap_limit, spec=spec)
+        global_params = config_manager.get_global_params()
+        self.num_workers = num_workers if num_workers is not None else global_params.get('solver_num_workers', 8)
+        self.inflow_scale, self.inflow_weights, self.exact = quantize_inflow_coefficients(self.spec.inflow_coefs.tolist())
+        # Hệ số nguyên của D²: θ1·objective_scale/S² (không nhỏ hơn MIN_DEVIATION_COEF)
+        self.deviation_coef = max(math.ceil(self.spec.theta_1 * OBJECTIVE_SCALE / self.inflow_scale ** 2), MIN_DEVIATION_COEF)
+        self.objective_scale = self.deviation_coef * self.inflow_scale ** 2 / self.spec.theta_1
+
+    def _utilization_costs(self, greens: np.ndarray, c: float) -> np.ndarray:
+        """Chi phí θ2·(1 - c·G)² cho từng giá trị G trong 'greens'."""
+        return self.spec.theta_2 * (1 - c * greens) ** 2
+
+    def _add_cost_table(self, model: cp_model.CpModel, G, lb: int, costs: np.ndarray, objective_terms: List):
+        """Gắn bảng chi phí (theo G = lb, lb+1, ...) vào hàm mục tiêu qua AddElement."""
+        scaled = np.rint(self.objective_scale * costs).astype(np.int64).tolist()
+        cost_var = model.NewIntVar(min(scaled), max(scaled), f'{G.Name()}_cost')
+        model.AddElement(G - lb, scaled, cost_var)
+        objective_terms.append(cost_var)
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Giải bài toán phân bổ bằng CP-SAT.
+
+        Args:
+            target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
+            previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+
+        Returns:
+            Dict kết quả theo định dạng chung (status INFEASIBLE kèm 'diagnosis' nếu tiền xử lý phát hiện
+            bài toán không khả thi), hoặc None nếu không tìm được nghiệm.
+        """
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        spec = self.spec
+        qg_prime = spec.qg_prime(target_inflow)
+        print(f"🔧 Giải bài toán (CP-SAT) với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
+        print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {spec.default_cycle_length}s])")
+
+        previous_green = spec.green_vector(previous_green_times)
+        presolved = presolve_green_time_windows(spec, previous_green)
+        timer.lap('presolve')
+        if not presolved.feasible:
+            print("  Không tìm được nghiệm: tiền xử lý phát hiện bài toán không khả thi")
+            return infeasible_result(presolved)
+
+        queues = spec.queue_vector(live_queue_lengths)
+        c = spec.utilization_coefs(queues)
+        lower, upper = presolved.lower.tolist(), presolved.upper.tolist()
+        hints = np.clip(previous_green, presolved.lower, presolved.upper).astype(np.int64).tolist()
+        model = cp_model.CpModel()
+        G_vars = {}
+        objective_terms = []
+        inflow_terms = []
+        inflow_min = inflow_max = 0
+
+        for index, weight in enumerate(self.inflow_weights):
+            start, end = spec.phase_offsets[index], spec.phase_offsets[index + 1]
+            cycle = int(spec.cycle_lengths[index])
+
+            # Pha chính
+            lb, ub = lower[start], upper[start]
+            G_p = model.NewIntVar(lb, ub, spec.phase_names[start])
+            model.AddHint(G_p, hints[start])
+            G_vars[start] = G_p
+            costs = self._utilization_costs(np.arange(lb, ub + 1), c[start])
+
+            inflow_terms.append(weight * G_p)
+            inflow_min += weight * lb
+            inflow_max += weight * ub
+
+            if spec.single_secondary[index]:
+                # G_s = cycle - G_p: chi phí của pha phụ được gộp vào bảng chi phí của G_p
+                costs = costs + self._utilization_costs(cycle - np.arange(lb, ub + 1), c[start + 1])
+                self._add_cost_table(model, G_p, lb, costs, objective_terms)
+                continue
+            self._add_cost_table(model, G_p, lb, costs, objective_terms)
+
+            # Các pha phụ
+            phase_vars = [G_p]
+            for phase in range(start + 1, end):
+                lb, ub = lower[phase], upper[phase]
+                G_s = model.NewIntVar(lb, ub, spec.phase_names[phase])
+                model.AddHint(G_s, hints[phase])
+                G_vars[phase] = G_s
+                phase_vars.append(G_s)
+                self._add_cost_table(model, G_s, lb, self._utilization_costs(np.arange(lb, ub + 1), c[phase]), objective_terms)
+
+            # Tổng thời gian xanh = chu kỳ đèn
+            model.Add(sum(phase_vars) == cycle)
+
+        # Độ lệch lưu lượng: (X/S - qg')² = (D - δ)²/S², với D = X - round(qg'·S), δ = qg'·S - round(qg'·S)
+        target_units = round(qg_prime * self.inflow_scale)
+        delta = qg_prime * self.inflow_scale - target_units
+        D = model.NewIntVar(inflow_min - target_units, inflow_max - target_units, 'inflow_deviation')
+        model.Add(D == sum(inflow_terms) - target_units)
+        max_abs = max(abs(inflow_min - target_units), abs(inflow_max - target_units))
+        D_sq = model.NewIntVar(0, max_abs ** 2, 'inflow_deviation_sq')
+        model.AddMultiplicationEquality(D_sq, [D, D])
+        objective_terms.append(self.deviation_coef * D_sq)
+        objective_terms.append(round(-2 * delta * self.deviation_coef) * D)
+        # Sai số làm tròn tối đa của hàm mục tiêu (đơn vị gốc): 0.5 cho mỗi bảng chi phí và 0.5·|D| cho hệ số của D
+        rounding_bound = 0.5 * (len(objective_terms) - 2 + max_abs) / self.objective_scale
+        model.Minimize(sum(objective_terms))
+        timer.lap('build')
+
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = max(self.time_limit_s - (time.perf_counter() - start_time), 0.01)
+        solver.parameters.relative_gap_limit = self.gap_limit
+        solver.parameters.num_workers = self.num_workers
+        cp_status = solver.Solve(model)
+        timer.lap('optimize')
+
+        if cp_status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            print(f"  Không tìm được nghiệm: {solver.StatusName(cp_status)}")
+            return None
+
+        G_values = np.zeros(spec.num_phases)
+        for phase, var in G_vars.items():
+            G_values[phase] = solver.Value(var)
+        single = np.flatnonzero(spec.single_secondary)
+        G_values[spec.primary_index[single] + 1] = spec.cycle_lengths[single] - G_values[spec.primary_index[single]]
+        scaled_objective = solver.ObjectiveValue()
+        if self.exact:
+            status = SolverStatus.OPTIMAL if cp_status == cp_model.OPTIMAL else SolverStatus.FEASIBLE
+            backend_status = solver.StatusName(cp_status)
+            gap = abs(scaled_objective - solver.BestObjectiveBound()) / max(abs(scaled_objective), 1.0)
+        else:
+            # Cận dưới của CP-SAT chỉ đúng cho bài toán với hệ số lưu lượng đã làm tròn
+            status, backend_status, gap = SolverStatus.FEASIBLE, 'rounded_inflow', float('nan')
+        objective_value = spec.objective(G_values, qg_prime, queues)
+        variables = spec.variables_from_vector(G_values)
+        timer.lap('extract')
+        profile = timer.as_dict()
+        profile.update({
+            'branches': solver.NumBranches(),
+            'conflicts': solver.NumConflicts(),
+            'gap': gap,
+            'rounding_bound': rounding_bound,
+            'cpsat_wall_s': solver.WallTime(),
+            'total_s': time.perf_counter() - start_time
+        })
+        print(f"  Kết quả CP-SAT: {solver.StatusName(cp_status)}, gap={gap:.2%}"
+              + ("" if self.exact else " (hệ số lưu lượng đã làm tròn)"))
+        return {
+            'status': status,
+            'backend_status': backend_status,
+            'objective_value': objective_value,
+            'gap': gap,
+            'solve_time': profile['total_s'],
+            'profile': profile,
+            'variables': variables
+        }
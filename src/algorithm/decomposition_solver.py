@@ -0,0 +1,290 @@
+"""
+Backend phân rã theo vùng (decomposition) cho mạng lưới có hàng trăm nút giao được điều khiển.
+
+Các nút giao chỉ liên kết với nhau qua thành phần độ lệch lưu lượng θ1·(Σ a·G_p - qg')², nên bài toán
+có dạng "sharing": min Σ_k f_k(G_k) + g(Σ_k X_k), với X_k = Σ_{nút thuộc vùng k} a·G_p.
+Bài toán được giải bằng ADMM-sharing (Boyd et al., §7.3):
+1. Mỗi vùng k giải bài toán con f_k(G_k) + (ρ/2)·(X_k - t_k)² với t_k = X_k - X̄ + z̄ - u. Bài toán con có
+   cùng dạng với bài toán gốc (θ1 = ρ/2, qg' = t_k) nên được giải bởi một backend sẵn có trên
+   ProblemSpec của vùng, song song trong các tiến trình con.
+2. Bộ điều phối cập nhật z̄ (nghiệm giải tích của θ1·(K·z̄ - qg')² + (K·ρ/2)·(z̄ - u - X̄)²) và
+   biến đối ngẫu u; λ = ρ·u là giá (multiplier) của ràng buộc lưu lượng dùng chung.
+3. Vòng đánh bóng: lần lượt giải lại từng vùng với θ1 gốc và lưu lượng của các vùng khác cố định
+   (qg'_k = qg' - Σ_{j≠k} X_j); phương án mới chỉ được nhận nếu hàm mục tiêu gốc giảm.
+Vì biến nguyên, ADMM là heuristic và không đảm bảo tối ưu toàn cục: phương án ghép tốt nhất (theo hàm
+mục tiêu gốc) được trả về với status FEASIBLE. Trên cấu hình 8 nút giao đi kèm, ADMM đơn thuần có thể
+cao hơn tối ưu DP vài đơn vị mục tiêu; vòng đánh bóng thu hẹp (nhưng không loại bỏ hoàn toàn) khoảng cách này.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from algorithm.common import SolverStatus, StageTimer
+from algorithm.backends import GreenTimeSolverBackend, create_green_time_solver
+from algorithm.presolve import infeasible_result, presolve_green_time_windows
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+# Trạng thái của tiến trình con: (config_manager, backend, shard_specs) và các bộ giải vùng đã xây dựng
+_worker_setup = None
+_shard_solvers: Dict[int, GreenTimeSolverBackend] = {}
+
+
+def _init_worker(config_manager: IntersectionConfigManager, backend: str, shard_specs: List[ProblemSpec]):
+    global _worker_setup
+    _worker_setup = (config_manager, backend, shard_specs)
+    _shard_solvers.clear()
+
+
+def _solve_shard(shard: int, target_inflow: float, previous_green_times: Dict,
+                 live_queue_lengths: Optional[Dict]) -> Optional[Dict]:
+    """Giải bài toán con của một vùng (bộ giải của vùng được xây dựng lần đầu và tái sử dụng)."""
+    solver = _shard_solvers.get(shard)
+    if solver is None:
+        config_manager, backend, shard_specs = _worker_setup
+        solver = create_green_time_solver(config_manager, backend, cache_size=0, spec=shard_specs[shard])
+        _shard_solvers[shard] = solver
+    return solver.solve(target_inflow, previous_green_times, live_queue_lengths)
+
+
+class DecompositionSolver(GreenTimeSolverBackend):
+    """
+    Backend 'decomposition': ADMM-sharing trên các vùng nút giao, giải song song bằng tiến trình con.
+    """
+
+    name = "decomposition"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 spec: Optional[ProblemSpec] = None):
+        """
+        Args:
+            config_manager: Đối tượng quản lý cấu hình intersection.
+            time_limit_s: Ngân sách thời gian thực (giây) cho toàn bộ các vòng lặp.
+            gap_limit: Không dùng (không có cận dưới chứng nhận).
+            spec: Đặc tả bài toán đã biên dịch (dùng chung với bộ điều khiển).
+
+        Raises:
+            ValueError: Nếu 'decomposition_shards' không phủ đúng mỗi nút giao một lần.
+        """
+        super().__init__(config_manager, time_limit_s=time_limit_s, gap_limit=gap_limit, spec=spec)
+        global_params = config_manager.get_global_params()
+        self.shard_backend = global_params.get('decomposition_shard_backend', 'dp')
+        self.max_iterations = global_params.get('decomposition_max_iterations', 30)
+        self.tolerance = global_params.get('decomposition_tolerance', 0.5)
+        self.polish_sweeps = global_params.get('decomposition_polish_sweeps', 3)
+        self.shards = self._partition(global_params.get('decomposition_shards'),
+                                      global_params.get('decomposition_num_shards', 4))
+        # Mặc định ρ = 2·θ1·K: biến đối ngẫu hội tụ với tỉ lệ 2·θ1·K / (2·θ1·K + ρ) = 1/2 mỗi vòng
+        rho = global_params.get('decomposition_rho')
+        self.rho = rho if rho is not None else 2 * self.spec.theta_1 * len(self.shards)
+        # Vùng của từng nút giao (để cộng lưu lượng theo vùng bằng bincount)
+        self.shard_of = np.empty(self.spec.num_intersections, dtype=np.int64)
+        for k, indices in enumerate(self.shards):
+            self.shard_of[indices] = k
+        self.phase_position = {name: j for j, name in enumerate(self.spec.phase_names)}
+        shard_specs = [self.spec.subset(indices, theta_1=self.rho / 2) for indices in self.shards]
+
+        num_workers = global_params.get('decomposition_num_workers') or len(self.shards)
+        self.executor = None
+        self._local_solvers = None
+        # Bộ giải vùng với θ1 gốc cho vòng đánh bóng (chạy tuần tự, xây dựng lần đầu khi cần)
+        self._polish_solvers = None
+        if num_workers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=min(num_workers, len(self.shards)),
+                initializer=_init_worker,
+                initargs=(config_manager, self.shard_backend, shard_specs)
+            )
+        else:
+            self._local_solvers = [create_green_time_solver(config_manager, self.shard_backend, cache_size=0, spec=shard_spec)
+                                   for shard_spec in shard_specs]
+
+    def _partition(self, shard_ids: Optional[List[List[str]]], num_shards: int) -> List[np.ndarray]:
+        """Vị trí nút giao của từng vùng: theo danh sách id trong cấu hình, hoặc chia đều theo thứ tự."""
+        n = self.spec.num_intersections
+        if not shard_ids:
+            return [indices for indices in np.array_split(np.arange(n), max(1, min(num_shards, n))) if indices.size]
+
+        position = {int_id: index for index, int_id in enumerate(self.spec.intersection_ids)}
+        shards = [np.asarray([position[int_id] for int_id in ids if int_id in position], dtype=np.int64)
+                  for ids in shard_ids]
+        covered = np.concatenate(shards) if shards else np.empty(0, dtype=np.int64)
+        if covered.size != n or np.unique(covered).size != n:
+            raise ValueError("'decomposition_shards' phải chứa mỗi nút giao đúng một lần")
+        return [indices for indices in shards if indices.size]
+
+    def _solve_shards(self, targets: np.ndarray, previous_green_times: Dict,
+                      live_queue_lengths: Optional[Dict]) -> List[Optional[Dict]]:
+        """Giải song song các bài toán con với lưu lượng mục tiêu t_k [xe/chu kỳ] của từng vùng."""
+        target_inflows = (targets * 3600.0 / self.spec.default_cycle_length).tolist()
+        if self.executor is None:
+            return [solver.solve(target, previous_green_times, live_queue_lengths)
+                    for solver, target in zip(self._local_solvers, target_inflows)]
+        futures = [self.executor.submit(_solve_shard, k, target, previous_green_times, live_queue_lengths)
+                   for k, target in enumerate(target_inflows)]
+        return [future.result() for future in futures]
+
+    def _shard_inflows(self, G: np.ndarray) -> np.ndarray:
+        """(K,) lưu lượng vào Σ a·G_p [xe/chu kỳ] của từng vùng."""
+        return np.bincount(self.shard_of, weights=self.spec.primary_inflows(G), minlength=len(self.shards))
+
+    def _merge(self, G: np.ndarray, results: List[Dict]) -> np.ndarray:
+        """Ghép phương án của các vùng vào vector thời gian xanh (m,) (bản sao của G)."""
+        G = G.copy()
+        for result in results:
+            for name, value in result['variables'].items():
+                G[self.phase_position[name]] = value
+        return G
+
+    def _polish(self, G: np.ndarray, objective: float, qg_prime: float, queues: np.ndarray,
+                previous_green_times: Dict, live_queue_lengths: Optional[Dict], deadline: float) -> tuple:
+        """
+        Giảm theo khối: giải lại lần lượt từng vùng với θ1 gốc khi lưu lượng các vùng khác cố định.
+        Mỗi bài toán con chính là hàm mục tiêu gốc giới hạn trên vùng đó, nên hàm mục tiêu không tăng.
+
+        Returns:
+            (G, objective, số lượt quét đã chạy)
+        """
+        spec = self.spec
+        if self._polish_solvers is None:
+            self._polish_solvers = [create_green_time_solver(self.config_manager, self.shard_backend, cache_size=0,
+                                                             spec=spec.subset(indices))
+                                    for indices in self.shards]
+        sweeps = 0
+        for sweeps in range(1, self.polish_sweeps + 1):
+            improved = False
+            for k, solver in enumerate(self._polish_solvers):
+                X = self._shard_inflows(G)
+                target = qg_prime - (X.sum() - X[k])
+                result = solver.solve(target * 3600.0 / spec.default_cycle_length, previous_green_times, live_queue_lengths)
+                if not result or result['status'] not in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE):
+                    continue
+                candidate = self._merge(G, [result])
+                candidate_objective = spec.objective(candidate, qg_prime, queues)
+                if candidate_objective < objective - 1e-9:
+                    G, objective, improved = candidate, candidate_objective, True
+            if not improved or time.perf_counter() > deadline:
+                break
+        return G, objective, sweeps
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Giải bài toán phân bổ bằng ADMM-sharing trên các vùng.
+
+        Args:
+            target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
+            previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+
+        Returns:
+            Dict kết quả theo định dạng chung (kèm 'iterations', 'price', 'primal_residual',
+            'admm_objective_value' và 'polish_sweeps'; 'gap' là NaN vì không có cận dưới), status INFEASIBLE kèm 'diagnosis' nếu miền khả thi rỗng,
+            hoặc None nếu một bài toán con không có nghiệm.
+        """
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        spec = self.spec
+        qg_prime = spec.qg_prime(target_inflow)
+        print(f"🔧 Giải bài toán (phân rã {len(self.shards)} vùng) với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
+        print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {spec.default_cycle_length}s])")
+
+        previous_green = spec.green_vector(previous_green_times)
+        presolved = presolve_green_time_windows(spec, previous_green)
+        timer.lap('presolve')
+        if not presolved.feasible:
+            print("  Không tìm được nghiệm: tiền xử lý phát hiện bài toán không khả thi")
+            return infeasible_result(presolved)
+
+        queues = spec.queue_vector(live_queue_lengths)
+        num_shards = len(self.shards)
+
+        # Khởi tạo từ phương án của chu kỳ trước (đã chiếu vào miền khả thi)
+        X = self._shard_inflows(np.clip(previous_green, presolved.lower, presolved.upper))
+        u = 0.0
+        z_bar = (2 * spec.theta_1 * qg_prime + self.rho * X.mean()) / (2 * spec.theta_1 * num_shards + self.rho)
+
+        best_G, best_objective = None, np.inf
+        shard_times = []
+        timer.lap('build')
+        backend_status = 'max_iterations'
+        primal_residual = np.inf
+        iteration = 0
+        for iteration in range(1, self.max_iterations + 1):
+            targets = X - X.mean() + z_bar - u
+            results = self._solve_shards(targets, previous_green_times, live_queue_lengths)
+            timer.lap('shard_solve')
+            if any(result is None or result['status'] not in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE)
+                   for result in results):
+                print("  Không tìm được nghiệm: một bài toán con không có nghiệm")
+                return None
+
+            shard_times.extend(result['solve_time'] for result in results)
+            G = self._merge(np.zeros(spec.num_phases), results)
+            objective = spec.objective(G, qg_prime, queues)
+            if objective < best_objective:
+                best_G, best_objective = G, objective
+
+            # Cập nhật z̄ và biến đối ngẫu u
+            X = self._shard_inflows(G)
+            z_prev = z_bar
+            z_bar = (2 * spec.theta_1 * qg_prime + self.rho * (u + X.mean())) / (2 * spec.theta_1 * num_shards + self.rho)
+            u += X.mean() - z_bar
+            primal_residual = num_shards * abs(X.mean() - z_bar)
+            dual_residual = num_shards * abs(z_bar - z_prev)
+            timer.lap('coordinate')
+            if primal_residual < self.tolerance and dual_residual < self.tolerance:
+                backend_status = 'converged'
+                break
+            if time.perf_counter() - start_time > self.time_limit_s:
+                backend_status = 'time_limit'
+                break
+
+        admm_objective = best_objective
+        best_G, best_objective, polish_sweeps = self._polish(best_G, best_objective, qg_prime, queues, previous_green_times,
+                                                             live_queue_lengths, start_time + self.time_limit_s)
+        timer.lap('polish')
+        print(f"  Phân rã: {backend_status} sau {iteration} vòng, mục tiêu={best_objective:.4f} "
+              f"(ADMM {admm_objective:.4f}, {polish_sweeps} lượt đánh bóng), giá λ={self.rho * u:.4f}")
+        variables = spec.variables_from_vector(best_G)
+        timer.lap('extract')
+        profile = timer.as_dict()
+        profile.update({
+            'iterations': iteration,
+            'shard_solves': len(shard_times),
+            'shard_solve_mean_s': float(np.mean(shard_times)),
+            'shard_solve_max_s': float(np.max(shard_times)),
+            'polish_sweeps': polish_sweeps,
+            'total_s': time.perf_counter() - start_time
+        })
+        return {
+            'status': SolverStatus.FEASIBLE,
+            'backend_status': backend_status,
+            'objective_value': best_objective,
+            'gap': float('nan'),
+            'solve_time': profile['total_s'],
+            'profile': profile,
+            'iterations': iteration,
+            'polish_sweeps': polish_sweeps,
+            'admm_objective_value': admm_objective,
+            'price': self.rho * u,
+            'primal_residual': primal_residual,
+            'variables': variables
+        }
+
+    def close(self):
+        """Dừng các tiến trình con và đóng các bộ giải vùng trong tiến trình này."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        for solver in (self._local_solvers or []) + (self._polish_solvers or []):
+            solver.close()
+        self._local_solvers = self._polish_solvers = None
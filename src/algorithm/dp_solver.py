@@ -0,0 +1,274 @@
+"""
+Backend quy hoạch động (DP) chính xác cho bài toán phân bổ thời gian đèn xanh.
+
+Hàm mục tiêu tách được theo từng nút giao, ngoại trừ thành phần độ lệch dùng chung θ1·(Σ a·G_p - qg')².
+Mỗi biến G chỉ có tối đa 2·max_change + 1 giá trị nguyên, nên:
+1. Với mỗi nút giao, chi phí tốt nhất của các pha phụ ứng với mỗi giá trị G_p được tính bằng
+   phép quét min-plus trên tổng thời gian xanh của các pha phụ (ràng buộc chu kỳ).
+2. Lưu lượng vào Σ a·G_p được coi là tài nguyên rời rạc (a·S nguyên với độ phân giải S) và
+   phép quét knapsack min-plus trên toàn mạng cho chi phí nhỏ nhất ứng với mỗi mức lưu lượng.
+3. Cộng thành phần độ lệch cho từng mức lưu lượng, chọn mức tốt nhất và truy vết phương án.
+Khi mọi hệ số a·S là số nguyên, kết quả là tối ưu toàn cục chính xác. Nếu hệ số phải làm tròn, phương án
+chỉ tối ưu cho bài toán xấp xỉ và được trả về với status FEASIBLE (gap NaN).
+
+Bảng DP có 1 + Σ w·(ub_p - lb_p) mức lưu lượng, tăng theo độ phân giải S (tới 10000 khi hệ số phải làm tròn).
+Nếu số mức trong trường hợp xấu nhất vượt 'dp_max_inflow_levels', backend chuyển sang giải bằng SCIP
+(FALLBACK_BACKEND) để giới hạn bộ nhớ và thời gian giải.
+
+Bảng chi phí ở bước 2 không phụ thuộc qg, nên solve_batch() dựng bảng tra cứu chính xác
+qg → phương án cho mọi qg chỉ từ một lần quét (algorithm/plan_table.py).
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.common import SolverStatus, StageTimer
+from algorithm.backends import GreenTimeSolverBackend, create_green_time_solver, quantize_inflow_coefficients
+from algorithm.plan_table import PlanLookupTable
+from algorithm.presolve import PresolveResult, infeasible_result, presolve_green_time_windows
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+
+# Backend dùng khi bảng DP vượt giới hạn số mức lưu lượng
+FALLBACK_BACKEND = "scip"
+
+
+def min_plus_stage(dp: np.ndarray, weight: int, costs: np.ndarray) -> tuple:
+    """
+    Một bước quét min-plus: new[r + weight·k] = min_k(dp[r] + costs[k]).
+
+    Args:
+        dp: Chi phí nhỏ nhất theo mức tài nguyên hiện tại (np.inf nếu không đạt được).
+        weight: Lượng tài nguyên tiêu thụ cho mỗi đơn vị của lựa chọn k.
+        costs: Chi phí của từng lựa chọn k = 0..K-1.
+
+    Returns:
+        (new_dp, choice) với choice[r] là lựa chọn k tốt nhất dẫn tới mức r (-1 nếu không đạt được).
+    """
+    size = dp.size + weight * (costs.size - 1)
+    new_dp = np.full(size, np.inf)
+    choice = np.full(size, -1, dtype=np.int32)
+    for k, cost in enumerate(costs):
+        if not np.isfinite(cost):
+            continue
+        offset = weight * k
+        candidate = dp + cost
+        window = new_dp[offset:offset + dp.size]
+        better = candidate < window
+        window[better] = candidate[better]
+        choice[offset:offset + dp.size][better] = k
+    return new_dp, choice
+
+
+def backtrack(choices: List[np.ndarray], weights: List[int], level: int) -> List[int]:
+    """Truy vết các lựa chọn k của từng bước quét, bắt đầu từ mức tài nguyên 'level' cuối cùng."""
+    picks = [0] * len(choices)
+    for stage in range(len(choices) - 1, -1, -1):
+        k = int(choices[stage][level])
+        picks[stage] = k
+        level -= weights[stage] * k
+    return picks
+
+
+class DynamicProgrammingSolver(GreenTimeSolverBackend):
+    """
+    Backend 'dp': nghiệm tối ưu chính xác bằng quy hoạch động trên NumPy, không cần bộ giải MIQP.
+    Dùng được như đường giải nhanh trong vận hành và làm tham chiếu để kiểm tra các backend khác.
+    """
+
+    name = "dp"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 spec: Optional[ProblemSpec] = None):
+        super().__init__(config_manager, time_limit_s=time_limit_s, gap_limit=gap_limit, spec=spec)
+        self.inflow_scale, self.inflow_weights, self.exact = quantize_inflow_coefficients(self.spec.inflow_coefs.tolist())
+        self.max_inflow_levels = config_manager.get_global_params().get('dp_max_inflow_levels', 2_000_000)
+        self.fallback_solver: Optional[GreenTimeSolverBackend] = None
+        levels = self.worst_case_levels()
+        if self.max_inflow_levels and levels > self.max_inflow_levels:
+            logging.warning(f"Bảng DP có thể tới {levels} mức lưu lượng (S={self.inflow_scale:g}, "
+                            f"giới hạn {self.max_inflow_levels}); dùng backend '{FALLBACK_BACKEND}' thay cho DP")
+            self.fallback_solver = create_green_time_solver(config_manager, FALLBACK_BACKEND, cache_size=0,
+                                                            time_limit_s=time_limit_s, gap_limit=gap_limit, spec=self.spec)
+
+    def worst_case_levels(self) -> int:
+        """Số mức lưu lượng lớn nhất của bảng DP: miền của G_p rộng tối đa min(2·max_change, max_green - min_green)."""
+        p = self.spec.primary_index
+        widths = np.minimum(2 * self.spec.max_change, self.spec.max_green[p] - self.spec.min_green)
+        return 1 + int(np.dot(self.inflow_weights, np.maximum(widths, 0)))
+
+    def _utilization_costs(self, lb: int, ub: int, c: float) -> np.ndarray:
+        """Chi phí θ2·(1 - c·G)² cho G = lb..ub."""
+        greens = np.arange(lb, ub + 1)
+        return self.spec.theta_2 * (1 - greens * c) ** 2
+
+    def _intersection_table(self, index: int, lower: List[int], upper: List[int], c: np.ndarray) -> tuple:
+        """
+        Chi phí nhỏ nhất của một nút giao theo từng giá trị G_p (đã tối ưu các pha phụ).
+
+        Args:
+            index: Vị trí nút giao trong spec.
+            lower, upper: Miền của các pha sau tiền xử lý (theo thứ tự pha của spec).
+            c: Hệ số sử dụng đèn xanh của các pha.
+
+        Returns:
+            (lb_p, costs, secondary_plan) với secondary_plan(G_p) trả về danh sách G_s tối ưu.
+        """
+        start, end = self.spec.phase_offsets[index], self.spec.phase_offsets[index + 1]
+        cycle = int(self.spec.cycle_lengths[index])
+
+        lb_p, ub_p = lower[start], upper[start]
+        costs = self._utilization_costs(lb_p, ub_p, c[start])
+
+        # Quét min-plus trên tổng thời gian xanh của các pha phụ
+        sec_lbs = []
+        sec_dp = np.zeros(1)
+        sec_choices = []
+        for phase in range(start + 1, end):
+            sec_lbs.append(lower[phase])
+            sec_dp, choice = min_plus_stage(sec_dp, 1, self._utilization_costs(lower[phase], upper[phase], c[phase]))
+            sec_choices.append(choice)
+
+        # Tổng pha phụ phải bằng cycle - G_p
+        sec_base = sum(sec_lbs)
+        levels = cycle - np.arange(lb_p, ub_p + 1) - sec_base
+        valid = (levels >= 0) & (levels < sec_dp.size)
+        sec_costs = np.full(costs.size, np.inf)
+        sec_costs[valid] = sec_dp[levels[valid]]
+        costs = costs + sec_costs
+
+        def secondary_plan(G_p: int) -> List[int]:
+            picks = backtrack(sec_choices, [1] * len(sec_choices), cycle - G_p - sec_base)
+            return [lb + k for lb, k in zip(sec_lbs, picks)]
+
+        return lb_p, costs, secondary_plan
+
+    def _sweep(self, presolved: PresolveResult, queues: np.ndarray) -> tuple:
+        """
+        Quét knapsack trên mức lưu lượng vào (đơn vị 1/S xe/chu kỳ, tính từ Σ w·lb_p).
+
+        Returns:
+            (dp, inflow, plan_of): chi phí sử dụng nhỏ nhất và lưu lượng [xe/chu kỳ] theo từng mức,
+            và hàm truy vết vector thời gian xanh (m,) của một mức.
+        """
+        spec = self.spec
+        c = spec.utilization_coefs(queues)
+        lower, upper = presolved.lower.tolist(), presolved.upper.tolist()
+
+        dp = np.zeros(1)
+        choices, tables = [], []
+        inflow_base = 0
+        for index, weight in enumerate(self.inflow_weights):
+            table = self._intersection_table(index, lower, upper, c)
+            lb_p, costs, _ = table
+            inflow_base += weight * lb_p
+            dp, choice = min_plus_stage(dp, weight, costs)
+            choices.append(choice)
+            tables.append(table)
+
+        def plan_of(level: int) -> np.ndarray:
+            picks = backtrack(choices, self.inflow_weights, level)
+            G_values = np.zeros(spec.num_phases)
+            for index, (lb_p, _, secondary_plan), k in zip(range(spec.num_intersections), tables, picks):
+                start, end = spec.phase_offsets[index], spec.phase_offsets[index + 1]
+                G_values[start] = lb_p + k
+                G_values[start + 1:end] = secondary_plan(lb_p + k)
+            return G_values
+
+        return dp, (inflow_base + np.arange(dp.size)) / self.inflow_scale, plan_of
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Giải chính xác bài toán phân bổ bằng quy hoạch động.
+
+        Args:
+            target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
+            previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+
+        Returns:
+            Dict kết quả theo định dạng chung (status INFEASIBLE kèm 'diagnosis' nếu bài toán không khả thi).
+        """
+        if self.fallback_solver is not None:
+            return self.fallback_solver.solve(target_inflow, previous_green_times, live_queue_lengths)
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        spec = self.spec
+        qg_prime = spec.qg_prime(target_inflow)
+        print(f"🔧 Giải bài toán (DP) với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
+        print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {spec.default_cycle_length}s])")
+
+        presolved = presolve_green_time_windows(spec, spec.green_vector(previous_green_times))
+        timer.lap('presolve')
+        if not presolved.feasible:
+            print("  Không tìm được nghiệm: tiền xử lý phát hiện bài toán không khả thi")
+            return infeasible_result(presolved)
+
+        queues = spec.queue_vector(live_queue_lengths)
+        dp, inflow, plan_of = self._sweep(presolved, queues)
+        total = dp + spec.theta_1 * (inflow - qg_prime) ** 2
+        level = int(np.argmin(total))
+        timer.lap('optimize')
+        if not np.isfinite(total[level]):
+            print("  Không tìm được nghiệm: không có phương án thỏa mãn ràng buộc chu kỳ")
+            return None
+        G_values = plan_of(level)
+        objective_value = spec.objective(G_values, qg_prime, queues)
+        variables = spec.variables_from_vector(G_values)
+        timer.lap('extract')
+        profile = timer.as_dict()
+        profile.update({'inflow_levels': dp.size, 'total_s': time.perf_counter() - start_time})
+
+        if self.exact:
+            print(f"  Tìm được nghiệm tối ưu (DP, {dp.size} mức lưu lượng)")
+        else:
+            print(f"  Tìm được nghiệm tối ưu cho hệ số lưu lượng đã làm tròn (DP, {dp.size} mức lưu lượng)")
+        return {
+            'status': SolverStatus.OPTIMAL if self.exact else SolverStatus.FEASIBLE,
+            'backend_status': 'optimal' if self.exact else 'rounded_inflow',
+            'objective_value': objective_value,
+            'gap': 0.0 if self.exact else float('nan'),
+            'solve_time': profile['total_s'],
+            'profile': profile,
+            'variables': variables
+        }
+
+    def solve_batch(
+        self,
+        target_inflows: Optional[Sequence[float]],
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[PlanLookupTable]:
+        """
+        Bảng tra cứu chính xác qg → phương án từ một lần quét DP (lưới 'target_inflows' không cần thiết
+        vì mọi mức lưu lượng đều là ứng viên; tham số được giữ để tương thích với giao diện chung).
+        Khi đã chuyển sang SCIP vì bảng DP quá lớn, bảng được dựng từ lưới 'target_inflows' (bắt buộc).
+
+        Returns:
+            PlanLookupTable, hoặc None nếu bài toán không khả thi.
+        """
+        if self.fallback_solver is not None:
+            if target_inflows is None:
+                raise ValueError(f"Backend 'dp' đang giải bằng '{FALLBACK_BACKEND}': cần lưới target_inflows cho solve_batch")
+            return self.fallback_solver.solve_batch(target_inflows, previous_green_times, live_queue_lengths)
+        spec = self.spec
+        presolved = presolve_green_time_windows(spec, spec.green_vector(previous_green_times))
+        if not presolved.feasible:
+            return None
+        dp, inflow, plan_of = self._sweep(presolved, spec.queue_vector(live_queue_lengths))
+        table = PlanLookupTable(spec, inflow, dp, plan_of, exact=self.exact)
+        return table if len(table) else None
+
+    def close(self):
+        if self.fallback_solver is not None:
+            self.fallback_solver.close()
@@ -0,0 +1,74 @@
+"""
+Điều khiển chu vi dự báo (MPC): chọn qg(k) bằng cách mô phỏng tích lũy của vùng trên một chân trời
+nhiều khoảng điều khiển với MFD đã khớp (MFDSurrogate).
+
+Chuỗi lưu lượng vào ứng viên có dạng chặn bước (move blocking): mức u_0 ở khoảng đầu tiên và mức u_1 giữ nguyên
+cho phần còn lại của chân trời, lấy từ một lưới L mức, nên có C = L² ứng viên. Mọi ứng viên được mô phỏng
+đồng thời dưới dạng mảng (C,) (mỗi khoảng của chân trời là một phép toán vector):
+    n(h+1) = n(h) + T·(d̂_u + u(h) - G(n(h)))
+với d̂_u là nhu cầu không bị chắn ước lượng từ bước đo trước. Hàm chi phí:
+    J = Σ_h ((n(h) - n̂)/n̂)² + w_over·Σ_h (max(n(h) - n̂, 0)/n̂)² + w_move·Σ_h (Δu(h)/g_max)²
+Chỉ u_0 của ứng viên tốt nhất được áp dụng (receding horizon); kích hoạt/hủy và phân bổ cho bộ giải giữ
+nguyên như luật PI.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from algorithm.tuning import MFDSurrogate
+
+
+@dataclass
+class MPCPlanner:
+    """Bộ chọn qg theo MPC trên mô hình hồ chứa một vùng."""
+    surrogate: MFDSurrogate = field(default_factory=MFDSurrogate)
+    n_hat: float = 280.0
+    horizon: int = 8                      # Số khoảng điều khiển của chân trời dự báo
+    num_levels: int = 41                  # Số mức qg ứng viên cho mỗi khối
+    qg_max: Optional[float] = None        # Mức qg lớn nhất [xe/giờ] (mặc định 2·g_max)
+    gated_share: float = 0.5              # Tỉ lệ nhu cầu qua nút giao chắn (dùng khi bước trước không điều khiển)
+    overshoot_weight: float = 4.0
+    move_weight: float = 0.1
+
+    def __post_init__(self):
+        if self.qg_max is None:
+            self.qg_max = 2 * self.surrogate.g_max
+        levels = np.linspace(0.0, self.qg_max, self.num_levels)
+        first, rest = np.meshgrid(levels, levels, indexing='ij')
+        # (C, H): u_0 ở khoảng đầu, u_1 cho các khoảng còn lại
+        self.candidates = np.concatenate(
+            [first.reshape(-1, 1), np.repeat(rest.reshape(-1, 1), self.horizon - 1, axis=1)], axis=1)
+
+    def estimate_uncontrolled_demand(self, n_current: float, n_previous: float, qg_previous: float,
+                                     was_active: bool) -> float:
+        """
+        d̂_u [xe/giờ] từ cân bằng của bước trước: tổng lưu lượng vào = Δn/T + G(n(k-1)).
+        Nếu bước trước có điều khiển, phần qua cổng chắn xấp xỉ bằng qg(k-1); ngược lại tách theo gated_share.
+        """
+        interval_h = self.surrogate.control_interval_s / 3600.0
+        total = max((n_current - n_previous) / interval_h + float(self.surrogate.outflow(np.asarray(n_previous))), 0.0)
+        if was_active:
+            return max(total - qg_previous, 0.0)
+        return (1 - self.gated_share) * total
+
+    def rollout_costs(self, n_current: float, uncontrolled_demand: float, qg_previous: float) -> np.ndarray:
+        """(C,) chi phí của từng chuỗi ứng viên."""
+        interval_h = self.surrogate.control_interval_s / 3600.0
+        U = self.candidates
+        n = np.full(U.shape[0], float(n_current))
+        cost = np.zeros(U.shape[0])
+        for h in range(self.horizon):
+            n = np.maximum(n + interval_h * (uncontrolled_demand + U[:, h] - self.surrogate.outflow(n)), 0.0)
+            error = (n - self.n_hat) / self.n_hat
+            cost += error ** 2 + self.overshoot_weight * np.maximum(error, 0.0) ** 2
+        moves = np.diff(np.concatenate([np.full((U.shape[0], 1), qg_previous), U], axis=1), axis=1)
+        cost += self.move_weight * np.sum((moves / self.surrogate.g_max) ** 2, axis=1)
+        return cost
+
+    def plan(self, n_current: float, n_previous: float, qg_previous: float, was_active: bool = True) -> float:
+        """qg(k) [xe/giờ] tối ưu theo MPC."""
+        demand = self.estimate_uncontrolled_demand(n_current, n_previous, qg_previous, was_active)
+        costs = self.rollout_costs(n_current, demand, qg_previous)
+        return float(self.candidates[int(np.argmin(costs)), 0])
@@ -0,0 +1,205 @@
+"""
+Bộ điều khiển chu vi nhiều vùng (multi-region perimeter control).
+
+Mỗi vùng MFD r có tích lũy n_r(k), mục tiêu n̂_r, hệ số PI và trạng thái trễ (hysteresis) riêng.
+Toàn bộ trạng thái được lưu dưới dạng mảng NumPy (R,), nên cập nhật PI và chuyển trạng thái kích hoạt
+của mọi vùng được tính trong một lần gọi vector hóa:
+    qg_r(k) = qg_r(k-1) - Kp_r·Δn_r(k) + Ki_r·(n̂_r - n_r(k))
+Lưu lượng mục tiêu qg_r của mỗi vùng được phân bổ cho tập nút giao chắn (gate) vùng đó, bằng một bộ giải
+riêng trên ProblemSpec con (ProblemSpec.subset).
+
+Cấu hình vùng: khóa 'regions' trong 'optimization_parameters' (IntersectionConfigManager.get_regions()), ví dụ
+    "regions": [{"id": "center", "intersections": ["B3", "C3"], "n_hat": 280, "kp": 20, "ki": 5,
+                 "activation_factor": 0.85, "deactivation_factor": 0.70}]
+Nếu không cấu hình, toàn bộ nút giao thuộc một vùng duy nhất với tham số mặc định của PerimeterController.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.algo import ACTIVATION_FACTOR, CONTROL_INTERVAL_S, DEACTIVATION_FACTOR, KI_H, KP_H, N_HAT
+from algorithm.backends import create_green_time_solver
+from algorithm.common import SolverStatus
+from algorithm.plan_store import PlanStore
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+
+def pi_update(n_current: np.ndarray, n_previous: np.ndarray, qg_previous: np.ndarray, n_hat: np.ndarray,
+              kp_h: np.ndarray, ki_h: np.ndarray) -> np.ndarray:
+    """
+    Luật PI vector hóa: qg(k) = qg(k-1) - Kp·Δn(k) + Ki·(n̂ - n(k)), chặn dưới tại 0.
+    Kp, Ki là hệ số theo giờ (KP_H, KI_H), giống PerimeterController.
+    """
+    return np.maximum(qg_previous - kp_h * (n_current - n_previous) + ki_h * (n_hat - n_current), 0.0)
+
+
+def hysteresis_update(n_current: np.ndarray, is_active: np.ndarray, activation_threshold: np.ndarray,
+                      deactivation_threshold: np.ndarray) -> np.ndarray:
+    """Trạng thái kích hoạt mới: bật khi n > ngưỡng kích hoạt, tắt khi n < ngưỡng hủy, ngược lại giữ nguyên."""
+    return np.where(n_current > activation_threshold, True,
+                    np.where(n_current < deactivation_threshold, False, is_active))
+
+
+@dataclass
+class MultiRegionStepResult:
+    """Kết quả của một bước điều khiển, mỗi mảng có độ dài R (số vùng)."""
+    n_current: np.ndarray
+    qg_new: np.ndarray
+    is_active: np.ndarray
+    activated: np.ndarray      # Vùng vừa được kích hoạt ở bước này
+    deactivated: np.ndarray    # Vùng vừa bị hủy kích hoạt ở bước này
+
+
+class MultiRegionPerimeterController:
+    """
+    Bộ điều khiển PI vector hóa cho R vùng, mỗi vùng phân bổ qg cho các nút giao chắn của mình.
+    """
+
+    def __init__(self, config_file: str = "src/config/intersection_config.json", plan_store: Optional[PlanStore] = None,
+                 control_interval_s: int = CONTROL_INTERVAL_S, regions: Optional[List[Dict]] = None,
+                 n_initial: Optional[Sequence[float]] = None):
+        """
+        Args:
+            config_file: Đường dẫn file cấu hình intersection.
+            plan_store: Kho phương án chia sẻ với bộ lập lịch lệnh đèn.
+            control_interval_s: Khoảng điều khiển [s].
+            regions: Danh sách vùng (mặc định lấy từ cấu hình).
+            n_initial: (R,) tích lũy ban đầu n(0) của từng vùng. Mặc định lấy từ lần đo đầu tiên
+                       (Δn = 0 ở bước đầu), tránh thành phần -Kp·n(k) giả khi bắt đầu từ n = 0.
+
+        Raises:
+            ValueError: Nếu một vùng tham chiếu nút giao không tồn tại, hoặc một nút giao thuộc nhiều vùng.
+        """
+        self.config_manager = IntersectionConfigManager(config_file)
+        self.spec = ProblemSpec.compile(self.config_manager)
+        self.plan_store = plan_store
+        self.control_interval_s = control_interval_s
+
+        if regions is None:
+            regions = self.config_manager.get_regions()
+        if not regions:
+            regions = [{'id': 'default', 'intersections': list(self.spec.intersection_ids)}]
+        self.region_ids = [str(region['id']) for region in regions]
+
+        # Tham số theo vùng (R,)
+        control_interval_h = control_interval_s / 3600.0
+        self.n_hat = np.asarray([region.get('n_hat', N_HAT) for region in regions], dtype=float)
+        self.kp = np.asarray([region.get('kp', KP_H) for region in regions], dtype=float) * control_interval_h
+        self.ki = np.asarray([region.get('ki', KI_H) for region in regions], dtype=float) * control_interval_h
+        self.activation_threshold = self.n_hat * np.asarray(
+            [region.get('activation_factor', ACTIVATION_FACTOR) for region in regions], dtype=float)
+        self.deactivation_threshold = self.n_hat * np.asarray(
+            [region.get('deactivation_factor', DEACTIVATION_FACTOR) for region in regions], dtype=float)
+
+        # Trạng thái theo vùng (R,)
+        num_regions = len(regions)
+        self.is_active = np.zeros(num_regions, dtype=bool)
+        self.n_previous: Optional[np.ndarray] = None if n_initial is None else np.asarray(n_initial, dtype=float)
+        self.qg_previous = np.zeros(num_regions)
+
+        # Vùng mà mỗi nút giao chắn (-1 nếu không thuộc vùng nào)
+        position = {int_id: index for index, int_id in enumerate(self.spec.intersection_ids)}
+        self.region_of = np.full(self.spec.num_intersections, -1, dtype=np.int64)
+        for r, region in enumerate(regions):
+            for int_id in region.get('intersections', []):
+                if int_id not in position:
+                    raise ValueError(f"Vùng '{self.region_ids[r]}' tham chiếu nút giao không tồn tại: '{int_id}'")
+                if self.region_of[position[int_id]] >= 0:
+                    raise ValueError(f"Nút giao '{int_id}' thuộc nhiều vùng")
+                self.region_of[position[int_id]] = r
+        self.region_intersections = [np.flatnonzero(self.region_of == r) for r in range(num_regions)]
+
+        # Mỗi vùng có bộ giải riêng trên đặc tả con (xây dựng một lần)
+        self.region_specs = [self.spec.subset(indices) if indices.size else None for indices in self.region_intersections]
+        self.solvers = [create_green_time_solver(self.config_manager, spec=spec) if spec is not None else None
+                        for spec in self.region_specs]
+
+        self.initial_green_times = self.config_manager.get_initial_green_times()
+        self.previous_green_times = self.initial_green_times.copy()
+        if self.plan_store is not None:
+            self.plan_store.publish(is_active=False, green_times=self.initial_green_times)
+
+        logging.info(f"Bộ điều khiển chu vi nhiều vùng: {num_regions} vùng")
+        for r, region_id in enumerate(self.region_ids):
+            logging.info(f"  Vùng {region_id}: n̂={self.n_hat[r]:.0f} xe, {self.region_intersections[r].size} nút giao chắn")
+
+    @property
+    def num_regions(self) -> int:
+        return len(self.region_ids)
+
+    def update(self, n_current: np.ndarray) -> MultiRegionStepResult:
+        """
+        Cập nhật vector hóa trạng thái kích hoạt và luật PI cho mọi vùng (không gọi bộ giải).
+        Vùng không hoạt động giữ nguyên qg của bước trước.
+        """
+        n_current = np.asarray(n_current, dtype=float)
+        if self.n_previous is None:
+            self.n_previous = n_current
+        was_active = self.is_active
+        is_active = hysteresis_update(n_current, was_active, self.activation_threshold, self.deactivation_threshold)
+
+        control_interval_h = self.control_interval_s / 3600.0
+        qg = pi_update(n_current, self.n_previous, self.qg_previous, self.n_hat,
+                       self.kp / control_interval_h, self.ki / control_interval_h)
+        qg_new = np.where(is_active, qg, self.qg_previous)
+
+        result = MultiRegionStepResult(
+            n_current=n_current,
+            qg_new=qg_new,
+            is_active=is_active,
+            activated=is_active & ~was_active,
+            deactivated=was_active & ~is_active
+        )
+        self.is_active = is_active
+        self.n_previous = n_current
+        self.qg_previous = qg_new
+        return result
+
+    def run_simulation_step(self, n_current: np.ndarray, live_queue_lengths: Optional[Dict] = None) -> MultiRegionStepResult:
+        """
+        Một bước điều khiển: cập nhật PI cho mọi vùng, khôi phục chu kỳ cố định cho vùng vừa bị hủy,
+        và phân bổ qg của từng vùng đang hoạt động cho các nút giao chắn của vùng đó.
+
+        Args:
+            n_current: (R,) tích lũy xe hiện tại của từng vùng.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+        """
+        result = self.update(n_current)
+        for r in np.flatnonzero(result.activated):
+            logging.info(f"KÍCH HOẠT vùng {self.region_ids[r]} (n={result.n_current[r]:.0f} > {self.activation_threshold[r]:.0f})")
+        for r in np.flatnonzero(result.deactivated):
+            logging.info(f"HỦY vùng {self.region_ids[r]} (n={result.n_current[r]:.0f} < {self.deactivation_threshold[r]:.0f}). "
+                         f"Khôi phục chu kỳ đèn cố định.")
+            for index in self.region_intersections[r]:
+                int_id = self.spec.intersection_ids[index]
+                if int_id in self.initial_green_times:
+                    self.previous_green_times[int_id] = self.initial_green_times[int_id]
+
+        for r in np.flatnonzero(result.is_active):
+            if self.solvers[r] is None:
+                continue
+            logging.info(f"Vùng {self.region_ids[r]}: qg = {result.qg_new[r]:.2f} xe/giờ")
+            solver_result = self.solvers[r].solve(float(result.qg_new[r]), self.previous_green_times, live_queue_lengths)
+            self._apply_region_result(r, solver_result)
+
+        if self.plan_store is not None:
+            self.plan_store.publish(is_active=bool(result.is_active.any()), green_times=self.previous_green_times)
+        return result
+
+    def _apply_region_result(self, region: int, result: Optional[Dict]):
+        """Áp dụng phương án của bộ giải cho các nút giao của một vùng (hoặc giữ nguyên nếu không có nghiệm)."""
+        if not result or result['status'] not in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE):
+            logging.warning(f"Vùng {self.region_ids[region]}: không tìm được nghiệm, giữ nguyên thời gian đèn xanh.")
+            return
+        spec = self.region_specs[region]
+        self.previous_green_times.update(spec.green_times_from_vector(spec.vector_from_variables(result['variables'])))
+
+    def close(self):
+        """Đóng bộ giải của các vùng."""
+        for solver in self.solvers:
+            if solver is not None:
+                solver.close()
@@ -0,0 +1,63 @@
+"""
+Kho phương án đèn dùng chung giữa bộ điều khiển và bộ lập lịch lệnh đèn (trong cùng một tiến trình).
+
+Mỗi lần bộ điều khiển công bố, một PlanSnapshot bất biến mới (trạng thái kích hoạt + thời gian xanh,
+đánh số phiên bản tăng dần) được tạo và thay thế tham chiếu hiện tại bằng một phép gán duy nhất.
+Gán tham chiếu là nguyên tử trong CPython, nên người đọc (PlanStore.current) không cần khóa và luôn thấy
+một phương án nhất quán; người đọc phát hiện phương án mới bằng cách so sánh số phiên bản.
+"""
+
+import copy
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+
+
+def _freeze(green_times: Dict) -> Mapping[str, Dict]:
+    """Bản sao sâu của green_times, bọc chỉ đọc ở cấp ngoài."""
+    return MappingProxyType(copy.deepcopy(dict(green_times)))
+
+
+@dataclass(frozen=True)
+class PlanSnapshot:
+    """Phương án đèn tại một phiên bản."""
+    version: int
+    is_active: bool
+    green_times: Mapping[str, Dict] = field(default_factory=lambda: MappingProxyType({}))
+    published_at: float = 0.0          # time.monotonic() lúc công bố
+
+
+class PlanStore:
+    """
+    Kho một phương án hiện hành: một người ghi (bộ điều khiển) và nhiều người đọc.
+    """
+
+    def __init__(self, is_active: bool = False, green_times: Optional[Dict] = None):
+        self._snapshot = PlanSnapshot(version=0, is_active=is_active,
+                                      green_times=_freeze(green_times or {}),
+                                      published_at=time.monotonic())
+
+    @property
+    def current(self) -> PlanSnapshot:
+        """Phương án hiện hành (đọc không khóa)."""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def publish(self, is_active: Optional[bool] = None, green_times: Optional[Dict] = None) -> PlanSnapshot:
+        """
+        Công bố phương án mới; trường None giữ nguyên giá trị của phiên bản trước.
+        green_times được sao chép sâu (cả dict của từng nút), nên người gọi có thể tiếp tục sửa dict của mình.
+        """
+        previous = self._snapshot
+        snapshot = PlanSnapshot(
+            version=previous.version + 1,
+            is_active=previous.is_active if is_active is None else bool(is_active),
+            green_times=previous.green_times if green_times is None else _freeze(green_times),
+            published_at=time.monotonic()
+        )
+        self._snapshot = snapshot
+        return snapshot
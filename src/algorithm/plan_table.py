@@ -0,0 +1,125 @@
+"""
+Bảng tra cứu qg → phương án thời gian xanh cho một trạng thái (phương án chu kỳ trước, hàng đợi) cố định.
+
+Với một phương án G cố định, hàm mục tiêu là một parabol theo qg':
+    J_G(qg') = U_G + θ1·(X_G - qg')²,   với X_G = Σ a·G_p và U_G = θ2·Σ (1 - c·G)²
+Mọi parabol có cùng độ cong θ1, nên min_G J_G(qg') - θ1·qg'² là bao dưới của các đường thẳng
+    (U_G + θ1·X_G²) - 2·θ1·X_G·qg'
+Bao dưới được dựng một lần (convex hull trick); mỗi truy vấn qg chỉ cần tìm kiếm nhị phân trên các điểm gãy.
+Bảng là chính xác với mọi qg khi tập ứng viên chứa mọi phương án tối ưu (quét DP); bảng dựng từ các phương án
+giải trên một lưới qg chỉ chính xác tại các điểm lưới, giữa các điểm lưới kết quả có status FEASIBLE.
+"""
+
+import bisect
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.common import SolverStatus
+from algorithm.problem_spec import ProblemSpec
+
+
+class PlanLookupTable:
+    """
+    Đường cong phương án/mục tiêu từng khúc theo qg, trả về phương án cho qg bất kỳ trong O(log n).
+    """
+
+    def __init__(self, spec: ProblemSpec, inflows: np.ndarray, utilization: np.ndarray,
+                 plan_of: Callable[[int], np.ndarray], exact: bool = True,
+                 exact_inflows: Optional[Sequence[float]] = None):
+        """
+        Args:
+            spec: Đặc tả bài toán đã biên dịch.
+            inflows: (L,) lưu lượng vào X_j [xe/chu kỳ] của từng phương án ứng viên.
+            utilization: (L,) chi phí sử dụng đèn xanh U_j (np.inf nếu không khả thi).
+            plan_of: Hàm trả về vector thời gian xanh (m,) của ứng viên j (chỉ gọi cho ứng viên trên bao dưới).
+            exact: True nếu tập ứng viên chứa phương án tối ưu với mọi qg.
+            exact_inflows: Các qg [xe/giờ] mà bảng chính xác khi exact = False (điểm lưới đã giải tối ưu).
+        """
+        self.spec = spec
+        self.exact = exact
+        self.exact_inflows = np.asarray(exact_inflows if exact_inflows is not None else [], dtype=float)
+        self._plan_of = plan_of
+        self._plans: Dict[int, np.ndarray] = {}
+
+        theta_1 = spec.theta_1
+        finite = np.flatnonzero(np.isfinite(utilization))
+        # Độ dốc -2·θ1·X giảm dần khi X tăng: duyệt theo X tăng dần, cùng X giữ hệ số chặn nhỏ nhất
+        intercepts = utilization[finite] + theta_1 * inflows[finite] ** 2
+        order = finite[np.lexsort((intercepts, inflows[finite]))]
+
+        hull: List[int] = []          # Chỉ số ứng viên trên bao dưới, theo X tăng dần
+        starts: List[float] = []      # qg' bắt đầu của từng khúc
+        for j in order.tolist():
+            slope, intercept = -2 * theta_1 * inflows[j], utilization[j] + theta_1 * inflows[j] ** 2
+            if hull and inflows[hull[-1]] == inflows[j]:
+                continue
+            while hull:
+                k = hull[-1]
+                # Điểm cắt giữa đường j và đường cuối trên bao
+                x = (utilization[k] + theta_1 * inflows[k] ** 2 - intercept) / (slope + 2 * theta_1 * inflows[k])
+                if x <= starts[-1]:
+                    hull.pop()
+                    starts.pop()
+                else:
+                    break
+            starts.append(x if hull else -np.inf)
+            hull.append(j)
+
+        self.candidates = np.asarray(hull, dtype=np.int64)
+        self.breakpoints = starts
+        self.inflows = inflows[self.candidates]
+        self.utilization = utilization[self.candidates]
+
+    @classmethod
+    def from_plans(cls, spec: ProblemSpec, plans: Sequence[np.ndarray], queues: np.ndarray,
+                   exact_inflows: Optional[Sequence[float]] = None) -> 'PlanLookupTable':
+        """
+        Bảng tra cứu (không chính xác) từ một tập phương án đã giải, ví dụ trên một lưới qg.
+        exact_inflows là các qg [xe/giờ] mà phương án tương ứng là tối ưu.
+        """
+        plans = [np.asarray(G, dtype=float) for G in plans]
+        c = spec.utilization_coefs(queues)
+        inflows = np.asarray([spec.primary_inflows(G).sum() for G in plans])
+        utilization = np.asarray([spec.theta_2 * np.sum((1 - c * G) ** 2) for G in plans])
+        return cls(spec, inflows, utilization, plans.__getitem__, exact=False, exact_inflows=exact_inflows)
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def _segment(self, qg_prime: float) -> int:
+        return bisect.bisect_right(self.breakpoints, qg_prime) - 1
+
+    def is_exact(self, target_inflow: float) -> bool:
+        """True nếu phương án tra cứu tại qg [xe/giờ] là tối ưu."""
+        return self.exact or bool(np.any(np.isclose(self.exact_inflows, target_inflow)))
+
+    def objective(self, target_inflow: float) -> float:
+        """Giá trị mục tiêu tối ưu (trên tập ứng viên) tại qg [xe/giờ]."""
+        qg_prime = self.spec.qg_prime(target_inflow)
+        segment = self._segment(qg_prime)
+        return float(self.utilization[segment] + self.spec.theta_1 * (self.inflows[segment] - qg_prime) ** 2)
+
+    def plan(self, target_inflow: float) -> np.ndarray:
+        """Vector thời gian xanh (m,) tối ưu tại qg [xe/giờ]."""
+        segment = self._segment(self.spec.qg_prime(target_inflow))
+        if segment not in self._plans:
+            self._plans[segment] = np.asarray(self._plan_of(int(self.candidates[segment])), dtype=float)
+        return self._plans[segment]
+
+    def lookup(self, target_inflow: float) -> Optional[Dict]:
+        """
+        Kết quả theo định dạng chung của backend cho qg [xe/giờ] (None nếu bảng rỗng): status OPTIMAL nếu
+        bảng chính xác tại qg, ngược lại FEASIBLE với gap NaN (không có cận dưới).
+        """
+        if not len(self):
+            return None
+        exact = self.is_exact(target_inflow)
+        return {
+            'status': SolverStatus.OPTIMAL if exact else SolverStatus.FEASIBLE,
+            'backend_status': 'lookup' if exact else 'lookup_between_grid',
+            'objective_value': self.objective(target_inflow),
+            'gap': 0.0 if exact else float('nan'),
+            'solve_time': 0.0,
+            'variables': self.spec.variables_from_vector(self.plan(target_inflow))
+        }
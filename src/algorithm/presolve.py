@@ -0,0 +1,100 @@
+"""
+Tiền xử lý (presolve) bài toán phân bổ thời gian đèn xanh trước khi xây dựng mô hình.
+
+- Nút giao chỉ có một pha phụ: ràng buộc chu kỳ G_p + G_s == cycle xác định hoàn toàn G_s, nên G_s
+  được khử khỏi mô hình (G_s = cycle - G_p) và miền của G_p được giao giải tích với miền của G_s.
+- Cửa sổ [prev ± max_change] ∩ [min_green, cycle - min_green] của từng pha được kiểm tra trước:
+  nếu miền rỗng hoặc không thể đạt tổng bằng chu kỳ, trả về chẩn đoán thay vì gọi bộ giải.
+Các cửa sổ được tính vector hóa trên mảng pha của ProblemSpec.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from algorithm.common import SolverStatus
+from algorithm.problem_spec import ProblemSpec
+
+
+@dataclass
+class PresolveResult:
+    """Kết quả tiền xử lý cho một bước điều khiển."""
+    # (m,) cận dưới/cận trên của từng pha (theo thứ tự pha của ProblemSpec) sau khi đã giao các cửa sổ
+    lower: np.ndarray
+    upper: np.ndarray
+    # Các thông báo chẩn đoán khi bài toán chắc chắn không khả thi
+    diagnosis: List[str] = field(default_factory=list)
+
+    @property
+    def feasible(self) -> bool:
+        return not self.diagnosis
+
+
+def _phase_label(spec: ProblemSpec, phase: int) -> str:
+    owner = spec.phase_owner[phase]
+    k = phase - spec.phase_offsets[owner]
+    return f"{spec.intersection_ids[owner]}/" + ('p' if k == 0 else f's{k - 1}')
+
+
+def presolve_green_time_windows(spec: ProblemSpec, previous_green: np.ndarray) -> PresolveResult:
+    """
+    Tính miền khả thi của từng pha và chẩn đoán các nút giao không khả thi.
+
+    Args:
+        spec: Đặc tả bài toán đã biên dịch.
+        previous_green: (m,) thời gian xanh của chu kỳ trước theo thứ tự pha (ProblemSpec.green_vector).
+
+    Returns:
+        PresolveResult chứa các cửa sổ đã giao và danh sách chẩn đoán (rỗng nếu khả thi).
+    """
+    max_green = spec.max_green
+    previous_green = np.rint(previous_green).astype(np.int64)
+    lower = np.maximum(spec.min_green, previous_green - spec.max_change)
+    upper = np.minimum(max_green, previous_green + spec.max_change)
+    diagnosis = []
+
+    empty = lower > upper
+    for phase in np.flatnonzero(empty):
+        diagnosis.append(
+            f"{_phase_label(spec, phase)}: cửa sổ rỗng [{lower[phase]}, {upper[phase]}] "
+            f"(prev ± {spec.max_change} không giao [{spec.min_green}, {max_green[phase]}])"
+        )
+    # Nút giao đã có cửa sổ rỗng không cần kiểm tra thêm
+    checked = ~np.logical_or.reduceat(empty, spec.primary_index)
+    cycles = spec.cycle_lengths
+
+    # G_s = cycle - G_p: giao miền của G_p với miền suy ra từ G_s
+    single = np.flatnonzero(spec.single_secondary & checked)
+    p, s = spec.primary_index[single], spec.primary_index[single] + 1
+    lb_p = np.maximum(lower[p], cycles[single] - upper[s])
+    ub_p = np.minimum(upper[p], cycles[single] - lower[s])
+    for j in np.flatnonzero(lb_p > ub_p):
+        diagnosis.append(
+            f"{spec.intersection_ids[single[j]]}: không tồn tại G_p + G_s = {cycles[single[j]]} với "
+            f"G_p ∈ [{lower[p[j]]}, {upper[p[j]]}], G_s ∈ [{lower[s[j]]}, {upper[s[j]]}]"
+        )
+    lower[p], upper[p] = lb_p, ub_p
+    lower[s], upper[s] = cycles[single] - ub_p, cycles[single] - lb_p
+
+    # Các nút giao còn lại: tổng các cửa sổ phải chứa chu kỳ
+    group_lower = np.add.reduceat(lower, spec.primary_index)
+    group_upper = np.add.reduceat(upper, spec.primary_index)
+    for index in np.flatnonzero(checked & ~spec.single_secondary & ((group_lower > cycles) | (group_upper < cycles))):
+        diagnosis.append(
+            f"{spec.intersection_ids[index]}: tổng thời gian xanh khả dĩ "
+            f"[{group_lower[index]}, {group_upper[index]}] không chứa chu kỳ {cycles[index]}"
+        )
+    return PresolveResult(lower=lower, upper=upper, diagnosis=diagnosis)
+
+
+def infeasible_result(presolve_result: PresolveResult) -> Dict:
+    """Kết quả theo định dạng chung của backend khi tiền xử lý phát hiện bài toán không khả thi."""
+    for message in presolve_result.diagnosis:
+        print(f"  Presolve: {message}")
+    return {
+        'status': SolverStatus.INFEASIBLE,
+        'backend_status': 'presolve_infeasible',
+        'diagnosis': list(presolve_result.diagnosis),
+        'variables': {}
+    }
@@ -0,0 +1,227 @@
+"""
+Đặc tả bài toán đã biên dịch (ProblemSpec) cho bộ giải và bộ điều khiển.
+
+Thay vì tra cứu các dict lồng nhau qua IntersectionConfigManager.get_phase_info() ở mỗi bước,
+dữ liệu tĩnh của mạng lưới được biên dịch một lần thành các mảng NumPy liền kề:
+- Mảng theo nút giao (độ dài n): chu kỳ, số pha phụ, hệ số lưu lượng của pha chính.
+- Mảng theo pha (độ dài m), trải phẳng kiểu CSR: pha của nút giao i nằm trong
+  [phase_offsets[i], phase_offsets[i + 1]), pha chính đứng đầu.
+"""
+
+import hashlib
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from data.intersection_config_manager import IntersectionConfigManager
+
+
+@dataclass
+class ProblemSpec:
+    """Dữ liệu tĩnh của bài toán phân bổ thời gian xanh, đánh chỉ số theo vị trí nút giao/pha."""
+    intersection_ids: List[str]
+    traffic_light_ids: List[Optional[str]]
+    phase_names: List[str]              # Tên biến 'G_<id>_p' / 'G_<id>_s_<i>' theo thứ tự pha
+    cycle_lengths: np.ndarray           # (n,) chu kỳ đèn của từng nút giao
+    num_secondary: np.ndarray           # (n,) số pha phụ
+    phase_offsets: np.ndarray           # (n + 1,) chỉ số pha đầu tiên của từng nút giao
+    phase_owner: np.ndarray             # (m,) vị trí nút giao sở hữu pha
+    is_primary: np.ndarray              # (m,) True nếu là pha chính
+    saturation_flows: np.ndarray        # (m,)
+    turn_in_ratios: np.ndarray          # (m,)
+    default_queues: np.ndarray          # (m,) hàng đợi mặc định từ cấu hình
+    theta_1: float
+    theta_2: float
+    default_cycle_length: int
+    min_green: int
+    max_change: int
+
+    @classmethod
+    def compile(cls, config_manager: IntersectionConfigManager) -> 'ProblemSpec':
+        """Biên dịch đặc tả từ cấu hình (gọi một lần cho mỗi mạng lưới)."""
+        global_params = config_manager.get_global_params()
+        intersection_ids = list(config_manager.get_intersection_ids())
+
+        traffic_light_ids, phase_names, cycles, num_secondary, offsets = [], [], [], [], [0]
+        owners, is_primary, saturation, turn_in, queues = [], [], [], [], []
+        for index, int_id in enumerate(intersection_ids):
+            phase_info = config_manager.get_phase_info(int_id)
+            secondary = phase_info.get('s', [])
+            traffic_light_ids.append(config_manager.get_traffic_light_id(int_id))
+            cycles.append(config_manager.get_cycle_length(int_id))
+            num_secondary.append(len(secondary))
+            offsets.append(offsets[-1] + 1 + len(secondary))
+
+            phase_names.append(f'G_{int_id}_p')
+            phase_names.extend(f'G_{int_id}_s_{i}' for i in range(len(secondary)))
+            for k, phase in enumerate([phase_info['p']] + list(secondary)):
+                owners.append(index)
+                is_primary.append(k == 0)
+                saturation.append(phase['saturation_flow'])
+                turn_in.append(phase['turn_in_ratio'])
+                queues.append(phase['queue_length'])
+
+        return cls(
+            intersection_ids=intersection_ids,
+            traffic_light_ids=traffic_light_ids,
+            phase_names=phase_names,
+            cycle_lengths=np.asarray(cycles, dtype=np.int64),
+            num_secondary=np.asarray(num_secondary, dtype=np.int64),
+            phase_offsets=np.asarray(offsets, dtype=np.int64),
+            phase_owner=np.asarray(owners, dtype=np.int64),
+            is_primary=np.asarray(is_primary, dtype=bool),
+            saturation_flows=np.asarray(saturation, dtype=float),
+            turn_in_ratios=np.asarray(turn_in, dtype=float),
+            default_queues=np.asarray(queues, dtype=float),
+            theta_1=global_params.get('theta_1', 1.0),
+            theta_2=global_params.get('theta_2', 0.5),
+            default_cycle_length=global_params.get('default_cycle_length', 90),
+            min_green=global_params.get('min_green_time', 15),
+            max_change=global_params.get('max_change', 10),
+        )
+
+    def subset(self, indices: Sequence[int], **overrides) -> 'ProblemSpec':
+        """
+        Đặc tả con gồm các nút giao ở vị trí 'indices' (giữ nguyên thứ tự pha bên trong mỗi nút giao).
+
+        Args:
+            indices: Vị trí các nút giao trong spec hiện tại.
+            overrides: Tham số vô hướng cần thay thế (ví dụ theta_1).
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, ends = self.phase_offsets[indices], self.phase_offsets[indices + 1]
+        phases = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        counts = ends - starts
+        return replace(
+            self,
+            intersection_ids=[self.intersection_ids[i] for i in indices],
+            traffic_light_ids=[self.traffic_light_ids[i] for i in indices],
+            phase_names=[self.phase_names[j] for j in phases],
+            cycle_lengths=self.cycle_lengths[indices],
+            num_secondary=self.num_secondary[indices],
+            phase_offsets=np.concatenate([[0], np.cumsum(counts)]),
+            phase_owner=np.repeat(np.arange(indices.size), counts),
+            is_primary=self.is_primary[phases],
+            saturation_flows=self.saturation_flows[phases],
+            turn_in_ratios=self.turn_in_ratios[phases],
+            default_queues=self.default_queues[phases],
+            **overrides
+        )
+
+    def fingerprint(self) -> str:
+        """
+        Mã băm của toàn bộ dữ liệu đặc tả (dùng để kiểm tra một ảnh chụp bài toán có khớp mạng lưới hiện tại).
+        """
+        digest = hashlib.sha1()
+        for f in fields(self):
+            value = getattr(self, f.name)
+            digest.update(f.name.encode('utf-8'))
+            if isinstance(value, np.ndarray):
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                digest.update(repr(value).encode('utf-8'))
+        return digest.hexdigest()
+
+    # --- Các đại lượng suy ra ---
+
+    @property
+    def num_intersections(self) -> int:
+        return len(self.intersection_ids)
+
+    @property
+    def num_phases(self) -> int:
+        return len(self.phase_names)
+
+    @property
+    def primary_index(self) -> np.ndarray:
+        """(n,) chỉ số pha chính của từng nút giao."""
+        return self.phase_offsets[:-1]
+
+    @property
+    def inflow_coefs(self) -> np.ndarray:
+        """(n,) hệ số lưu lượng vào a = saturation_flow·turn_in_ratio của pha chính."""
+        p = self.primary_index
+        return self.saturation_flows[p] * self.turn_in_ratios[p]
+
+    @property
+    def single_secondary(self) -> np.ndarray:
+        """(n,) True với nút giao có đúng một pha phụ (G_s được khử qua ràng buộc chu kỳ)."""
+        return self.num_secondary == 1
+
+    @property
+    def max_green(self) -> np.ndarray:
+        """(m,) thời gian xanh tối đa của từng pha (chu kỳ - min_green)."""
+        return self.cycle_lengths[self.phase_owner] - self.min_green
+
+    def qg_prime(self, target_inflow: float) -> float:
+        """Quy đổi qg [xe/giờ] sang [xe/chu kỳ]."""
+        return target_inflow * self.default_cycle_length / 3600.0
+
+    # --- Chuyển đổi giữa dict và vector pha ---
+
+    def queue_vector(self, live_queue_lengths: Optional[Dict] = None) -> np.ndarray:
+        """
+        (m,) hàng đợi sẽ sử dụng cho từng pha: giá trị trực tiếp từ mô phỏng nếu có, ngược lại lấy từ cấu hình.
+        """
+        queues = self.default_queues.copy()
+        if not live_queue_lengths:
+            return queues
+        for index, int_id in enumerate(self.intersection_ids):
+            live = live_queue_lengths.get(int_id)
+            if live is None:
+                continue
+            start = self.phase_offsets[index]
+            queues[start] = live['p']
+            count = min(len(live['s']), int(self.num_secondary[index]))
+            queues[start + 1:start + 1 + count] = live['s'][:count]
+        return queues
+
+    def queue_dict(self, queues: np.ndarray) -> Dict[str, Dict]:
+        """Dict hàng đợi {int_id: {'p': ..., 's': [...]}} (định dạng live_queue_lengths) từ vector (m,)."""
+        values = np.asarray(queues, dtype=float).tolist()
+        queue_lengths = {}
+        for index, int_id in enumerate(self.intersection_ids):
+            start, end = self.phase_offsets[index], self.phase_offsets[index + 1]
+            queue_lengths[int_id] = {'p': values[start], 's': values[start + 1:end]}
+        return queue_lengths
+
+    def green_vector(self, green_times: Dict) -> np.ndarray:
+        """(m,) thời gian xanh theo thứ tự pha từ dict {int_id: {'p': ..., 's': [...]}}."""
+        values = []
+        for int_id, num_secondary in zip(self.intersection_ids, self.num_secondary.tolist()):
+            values.append(green_times[int_id]['p'])
+            values.extend(green_times[int_id]['s'][:num_secondary])
+        return np.asarray(values, dtype=float)
+
+    def green_times_from_vector(self, G: np.ndarray) -> Dict[str, Dict]:
+        """Dict {int_id: {'p': int, 's': [int, ...]}} từ vector thời gian xanh."""
+        rounded = np.rint(G).astype(int).tolist()
+        green_times = {}
+        for index, int_id in enumerate(self.intersection_ids):
+            start, end = self.phase_offsets[index], self.phase_offsets[index + 1]
+            green_times[int_id] = {'p': rounded[start], 's': rounded[start + 1:end]}
+        return green_times
+
+    def variables_from_vector(self, G: np.ndarray) -> Dict[str, float]:
+        """Dict {'G_<id>_p': ..., 'G_<id>_s_<i>': ...} theo định dạng kết quả của backend."""
+        return dict(zip(self.phase_names, np.asarray(G, dtype=float).tolist()))
+
+    def vector_from_variables(self, variables: Dict[str, float]) -> np.ndarray:
+        return np.asarray([variables[name] for name in self.phase_names], dtype=float)
+
+    # --- Hàm mục tiêu ---
+
+    def primary_inflows(self, G: np.ndarray) -> np.ndarray:
+        """(n,) lưu lượng vào dự kiến của từng nút giao [xe/chu kỳ]."""
+        return G[self.primary_index] * self.inflow_coefs
+
+    def utilization_coefs(self, queues: np.ndarray) -> np.ndarray:
+        """(m,) hệ số c = saturation_flow / (queue + 1) của thành phần sử dụng đèn xanh."""
+        return self.saturation_flows / (queues + 1)
+
+    def objective(self, G: np.ndarray, qg_prime: float, queues: np.ndarray) -> float:
+        """Giá trị hàm mục tiêu gốc θ1·(Σ a·G_p - qg')² + θ2·Σ (1 - c·G)² cho vector thời gian xanh G."""
+        deviation = float(self.primary_inflows(G).sum()) - qg_prime
+        c = self.utilization_coefs(queues)
+        return self.theta_1 * deviation ** 2 + self.theta_2 * float(np.sum((1 - c * G) ** 2))
@@ -0,0 +1,241 @@
+"""
+Backend nới lỏng liên tục + làm tròn cho mạng lưới rất lớn.
+
+1. Giải bài toán nới lỏng liên tục (QP lồi với ràng buộc chu kỳ và hộp [prev ± max_change]) bằng
+   gradient chiếu có gia tốc (FISTA), vector hóa hoàn toàn trên NumPy. Phép chiếu lên
+   {Σ G = cycle, lb <= G <= ub} của từng nút giao được tính bằng chia đôi song song trên biến đối ngẫu.
+2. Làm tròn theo phần dư lớn nhất để giữ ràng buộc chu kỳ, sau đó sửa cục bộ bằng các bước
+   chuyển 1 giây giữa pha chính và pha phụ trong cùng nút giao.
+3. Cận dưới Frank-Wolfe tại điểm dừng x của FISTA: vì hàm mục tiêu lồi,
+       f* >= f(x) + min_{s ∈ miền nới lỏng} ∇f(x)·(s - x),
+   và bài toán tuyến tính bên phải tách theo nút giao (dồn phần thời gian còn lại vào pha có gradient nhỏ nhất).
+   Cận này hợp lệ kể cả khi FISTA chưa hội tụ, nên 'gap' trong kết quả là gap chứng nhận được.
+Khi cấu hình backend tham chiếu (ví dụ 'scip'), kết quả có thêm 'reference_gap' so với backend đó.
+"""
+
+import time
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+from algorithm.common import SolverStatus, StageTimer
+from algorithm.backends import GreenTimeSolverBackend, create_green_time_solver, objective_gap
+from algorithm.presolve import infeasible_result, presolve_green_time_windows
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-6
+BISECTION_STEPS = 40
+MAX_REPAIR_MOVES = 200
+
+
+class RelaxationSolver(GreenTimeSolverBackend):
+    """
+    Backend 'relaxation': độ trễ gần tuyến tính theo số nút giao, phù hợp cho hàng nghìn nút giao.
+    """
+
+    name = "relaxation"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 reference_backend: Optional[str] = None, spec: Optional[ProblemSpec] = None):
+        """
+        Args:
+            config_manager: Đối tượng quản lý cấu hình intersection.
+            time_limit_s: Ngân sách thời gian thực (giây) cho mỗi bước giải.
+            gap_limit: Không dùng (phương pháp không có tìm kiếm nhánh cận).
+            reference_backend: Backend dùng để đo gap trên cùng đầu vào. Mặc định lấy
+                               'relaxation_reference_backend' từ cấu hình (None = không so sánh).
+            spec: Đặc tả bài toán đã biên dịch (dùng chung với bộ điều khiển).
+        """
+        super().__init__(config_manager, time_limit_s=time_limit_s, gap_limit=gap_limit, spec=spec)
+        if reference_backend is None:
+            reference_backend = config_manager.get_global_params().get('relaxation_reference_backend')
+        self.reference_solver = create_green_time_solver(config_manager, reference_backend, spec=self.spec) \
+            if reference_backend else None
+
+        # Các pha được trải phẳng theo thứ tự của spec, pha chính đứng đầu mỗi nút giao
+        self.theta_1, self.theta_2 = self.spec.theta_1, self.spec.theta_2
+        self.owners = self.spec.phase_owner
+        self.group_starts = self.spec.primary_index
+        self.inflow_coefs = np.where(self.spec.is_primary, self.spec.saturation_flows * self.spec.turn_in_ratios, 0.0)
+        self.cycles = self.spec.cycle_lengths.astype(float)
+        self.is_primary = self.spec.is_primary
+
+    def _group_sum(self, values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, self.group_starts)
+
+    def _project(self, y: np.ndarray, lb: np.ndarray, ub: np.ndarray) -> np.ndarray:
+        """Chiếu y lên {Σ_nút G = cycle, lb <= G <= ub} bằng chia đôi trên τ: G = clip(y - τ, lb, ub)."""
+        low = np.minimum.reduceat(y - ub, self.group_starts)
+        high = np.maximum.reduceat(y - lb, self.group_starts)
+        for _ in range(BISECTION_STEPS):
+            tau = 0.5 * (low + high)
+            excess = self._group_sum(np.clip(y - tau[self.owners], lb, ub)) - self.cycles
+            # Tổng còn lớn hơn chu kỳ -> cần tăng τ
+            low = np.where(excess > 0, tau, low)
+            high = np.where(excess > 0, high, tau)
+        return np.clip(y - (0.5 * (low + high))[self.owners], lb, ub)
+
+    def _objective(self, G: np.ndarray, c: np.ndarray, qg_prime: float) -> float:
+        return float(self.theta_1 * (self.inflow_coefs @ G - qg_prime) ** 2 + self.theta_2 * np.sum((1 - c * G) ** 2))
+
+    def _gradient(self, x: np.ndarray, c: np.ndarray, qg_prime: float) -> np.ndarray:
+        return 2 * self.theta_1 * (self.inflow_coefs @ x - qg_prime) * self.inflow_coefs - 2 * self.theta_2 * c * (1 - c * x)
+
+    def _lower_bound(self, x: np.ndarray, lb: np.ndarray, ub: np.ndarray, c: np.ndarray, qg_prime: float) -> float:
+        """
+        Cận dưới Frank-Wolfe f(x) + min_s ∇f(x)·(s - x) trên {Σ_nút G = cycle, lb <= G <= ub}.
+        Bài toán tuyến tính được giải tham lam trong từng nút giao: bắt đầu từ lb, lần lượt nâng các pha
+        theo gradient tăng dần tới ub cho tới khi đủ chu kỳ.
+        """
+        gradient = self._gradient(x, c, qg_prime)
+        # owners tăng dần nên lexsort giữ các nút giao ở đúng vị trí liền nhau của chúng
+        order = np.lexsort((gradient, self.owners))
+        capacity = (ub - lb)[order]
+        before = np.cumsum(capacity) - capacity
+        before -= before[self.group_starts][self.owners]
+        remaining = (self.cycles - self._group_sum(lb))[self.owners]
+        s = lb.copy()
+        s[order] += np.clip(remaining - before, 0.0, capacity)
+        return self._objective(x, c, qg_prime) + float(gradient @ (s - x))
+
+    def _solve_relaxation(self, lb: np.ndarray, ub: np.ndarray, c: np.ndarray, qg_prime: float,
+                          start: np.ndarray, deadline: float) -> tuple:
+        """FISTA trên bài toán nới lỏng liên tục. Trả về (x, số vòng lặp)."""
+        lipschitz = 2 * self.theta_1 * float(self.inflow_coefs @ self.inflow_coefs) + 2 * self.theta_2 * float(np.max(c ** 2))
+        step = 1.0 / max(lipschitz, 1e-12)
+        x = self._project(start, lb, ub)
+        y, t = x.copy(), 1.0
+        iteration = 0
+        for iteration in range(1, MAX_ITERATIONS + 1):
+            gradient = self._gradient(y, c, qg_prime)
+            x_next = self._project(y - step * gradient, lb, ub)
+            t_next = 0.5 * (1 + np.sqrt(1 + 4 * t * t))
+            y = x_next + ((t - 1) / t_next) * (x_next - x)
+            converged = np.max(np.abs(x_next - x)) < TOLERANCE
+            x, t = x_next, t_next
+            if converged or time.perf_counter() > deadline:
+                break
+        return x, iteration
+
+    def _round(self, x: np.ndarray, lb: np.ndarray, ub: np.ndarray) -> np.ndarray:
+        """Làm tròn theo phần dư lớn nhất trong từng nút giao để giữ Σ G = cycle."""
+        G = np.clip(np.floor(x + 1e-9), lb, ub)
+        remainder = (self.cycles - self._group_sum(G)).astype(int)
+        fraction = np.where(G < ub, x - G, -np.inf)
+        # Xếp hạng phần dư trong từng nút giao (owners tăng dần nên lexsort giữ nhóm liền nhau)
+        order = np.lexsort((-fraction, self.owners))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size) - self.group_starts[self.owners[order]]
+        return G + (rank < remainder[self.owners])
+
+    def _repair(self, G: np.ndarray, lb: np.ndarray, ub: np.ndarray, c: np.ndarray, qg_prime: float) -> np.ndarray:
+        """Cải thiện cục bộ: áp dụng lần lượt bước chuyển 1 giây tốt nhất giữa pha chính và một pha phụ."""
+        primary_index = self.group_starts[self.owners]
+        secondary = ~self.is_primary
+        for _ in range(MAX_REPAIR_MOVES):
+            deviation = self.inflow_coefs @ G - qg_prime
+            best_delta, best_move = -1e-12, None
+            for direction in (1, -1):
+                # direction = 1: pha phụ +1, pha chính -1; direction = -1: ngược lại
+                s_new = G + direction
+                p_new = G[primary_index] - direction
+                feasible = secondary & (s_new >= lb) & (s_new <= ub) & (p_new >= lb[primary_index]) & (p_new <= ub[primary_index])
+                if not feasible.any():
+                    continue
+                d_inflow = -direction * self.inflow_coefs[primary_index]
+                delta = self.theta_1 * ((deviation + d_inflow) ** 2 - deviation ** 2) \
+                    + self.theta_2 * ((1 - c * s_new) ** 2 - (1 - c * G) ** 2) \
+                    + self.theta_2 * ((1 - c[primary_index] * p_new) ** 2 - (1 - c[primary_index] * G[primary_index]) ** 2)
+                delta = np.where(feasible, delta, np.inf)
+                j = int(np.argmin(delta))
+                if delta[j] < best_delta:
+                    best_delta, best_move = delta[j], (j, direction)
+            if best_move is None:
+                break
+            j, direction = best_move
+            G[j] += direction
+            G[primary_index[j]] -= direction
+        return G
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Giải bài toán nới lỏng liên tục rồi làm tròn thành phương án nguyên khả thi.
+
+        Args:
+            target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
+            previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+
+        Returns:
+            Dict kết quả theo định dạng chung (kèm 'relaxed_objective_value', cận dưới 'relaxation_bound'
+            và có thể 'reference_gap'),
+            status INFEASIBLE kèm 'diagnosis' nếu miền khả thi rỗng.
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.time_limit_s
+        timer = StageTimer()
+        spec = self.spec
+        qg_prime = spec.qg_prime(target_inflow)
+        print(f"🔧 Giải bài toán (nới lỏng liên tục) với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
+        print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {spec.default_cycle_length}s])")
+
+        prev = spec.green_vector(previous_green_times)
+        presolved = presolve_green_time_windows(spec, prev)
+        timer.lap('presolve')
+        if not presolved.feasible:
+            print("  Không tìm được nghiệm: tiền xử lý phát hiện bài toán không khả thi")
+            return infeasible_result(presolved)
+
+        queues = spec.queue_vector(live_queue_lengths)
+        lb, ub = presolved.lower.astype(float), presolved.upper.astype(float)
+
+        c = spec.utilization_coefs(queues)
+        timer.lap('build')
+        relaxed, iterations = self._solve_relaxation(lb, ub, c, qg_prime, np.clip(prev, lb, ub), deadline)
+        relaxed_objective = self._objective(relaxed, c, qg_prime)
+        timer.lap('optimize')
+        relaxation_bound = self._lower_bound(relaxed, lb, ub, c, qg_prime)
+        timer.lap('bound')
+        G = self._repair(self._round(relaxed, lb, ub), lb, ub, c, qg_prime)
+        timer.lap('round')
+
+        objective_value = spec.objective(G, qg_prime, queues)
+        gap = max(objective_value - relaxation_bound, 0.0) / max(abs(objective_value), 1e-9)
+        variables = spec.variables_from_vector(G)
+        timer.lap('extract')
+        profile = timer.as_dict()
+        profile.update({'iterations': iterations, 'gap': gap, 'total_s': time.perf_counter() - start_time})
+        print(f"  Nghiệm làm tròn: mục tiêu={objective_value:.4f}, cận dưới={relaxation_bound:.4f}, gap≤{gap:.2%}")
+
+        result = {
+            'status': SolverStatus.OPTIMAL if gap <= TOLERANCE else SolverStatus.FEASIBLE,
+            'backend_status': 'rounded_relaxation',
+            'objective_value': objective_value,
+            'relaxed_objective_value': relaxed_objective,
+            'relaxation_bound': relaxation_bound,
+            'gap': gap,
+            'solve_time': profile['total_s'],
+            'profile': profile,
+            'variables': variables
+        }
+        if self.reference_solver is not None:
+            reference = self.reference_solver.solve(target_inflow, previous_green_times, live_queue_lengths)
+            profile['reference_s'] = time.perf_counter() - start_time - profile['total_s']
+            if reference:
+                result['reference_objective_value'] = reference['objective_value']
+                result['reference_gap'] = objective_gap(objective_value, reference['objective_value'])
+                logging.info(f"Gap so với backend '{self.reference_solver.name}': {result['reference_gap']:.4%}")
+        return result
+
+    def close(self):
+        if self.reference_solver is not None:
+            self.reference_solver.close()
@@ -0,0 +1,182 @@
+"""
+Phát lại (replay) chuỗi đo lường n(k) và hàng đợi qua PerimeterController và bộ giải, không cần SUMO.
+
+Chuỗi đo lường (ControlTrace) được ghi tại mỗi bước điều khiển trong lúc chạy mô phỏng
+(khóa 'control_trace_file' trong simulation.yml) hoặc tạo từ file CSV. Khi phát lại, bộ điều khiển
+chạy liên tiếp các bước với tốc độ tối đa của CPU (không chờ, không in chi tiết bộ giải) và trả về
+quỹ đạo qg(k), trạng thái kích hoạt và thời gian xanh của từng bước.
+"""
+
+import csv
+import logging
+import os
+import time
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from algorithm.algo import PerimeterController
+from algorithm.problem_spec import ProblemSpec
+
+
+@dataclass
+class ControlTrace:
+    """Chuỗi đo lường tại các bước điều khiển."""
+    times: np.ndarray                       # (K,) thời gian mô phỏng [s]
+    n: np.ndarray                           # (K,) tích lũy xe n(k)
+    queues: Optional[np.ndarray] = None     # (K, m) hàng đợi theo thứ tự phase_names (None = dùng cấu hình)
+    phase_names: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.n)
+
+    def queue_matrix(self, spec: ProblemSpec) -> Optional[np.ndarray]:
+        """(K, m) hàng đợi theo thứ tự pha của spec; pha không có trong chuỗi lấy giá trị từ cấu hình."""
+        if self.queues is None:
+            return None
+        matrix = np.tile(spec.default_queues, (len(self), 1))
+        column = {name: j for j, name in enumerate(self.phase_names)}
+        for j, name in enumerate(spec.phase_names):
+            if name in column:
+                matrix[:, j] = self.queues[:, column[name]]
+        return matrix
+
+    def save(self, path: str):
+        """Lưu chuỗi đo lường ra file .npz."""
+        arrays = {'times': self.times, 'n': self.n, 'phase_names': np.asarray(self.phase_names, dtype=str)}
+        if self.queues is not None:
+            arrays['queues'] = self.queues
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'ControlTrace':
+        """
+        Đọc chuỗi đo lường từ file .npz (ControlTrace.save) hoặc .csv với các cột 'time', 'n'
+        và (tùy chọn) một cột hàng đợi cho mỗi pha, đặt tên theo pha (ví dụ 'G_B3_p', 'G_B3_s_0').
+        """
+        if os.path.splitext(path)[1] == '.npz':
+            with np.load(path) as data:
+                return cls(
+                    times=data['times'],
+                    n=data['n'],
+                    queues=data['queues'] if 'queues' in data else None,
+                    phase_names=data['phase_names'].tolist()
+                )
+
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        phase_names = [name for name in (rows[0].keys() if rows else []) if name not in ('time', 'n')]
+        return cls(
+            times=np.asarray([float(row['time']) for row in rows]),
+            n=np.asarray([float(row['n']) for row in rows]),
+            queues=np.asarray([[float(row[name]) for name in phase_names] for row in rows]) if phase_names else None,
+            phase_names=phase_names
+        )
+
+
+class ControlTraceRecorder:
+    """
+    Ghi n(k) và hàng đợi tại mỗi bước điều khiển trong lúc chạy mô phỏng, lưu ra .npz khi kết thúc.
+    """
+
+    def __init__(self, spec: ProblemSpec):
+        self.spec = spec
+        self.times: List[float] = []
+        self.n: List[float] = []
+        self.queues: List[np.ndarray] = []
+
+    def record(self, sim_time: float, n_current: float, live_queue_lengths: Optional[Dict] = None):
+        self.times.append(sim_time)
+        self.n.append(n_current)
+        self.queues.append(self.spec.queue_vector(live_queue_lengths))
+
+    def to_trace(self) -> ControlTrace:
+        return ControlTrace(
+            times=np.asarray(self.times, dtype=float),
+            n=np.asarray(self.n, dtype=float),
+            queues=np.asarray(self.queues).reshape(len(self.times), self.spec.num_phases),
+            phase_names=list(self.spec.phase_names)
+        )
+
+    def save(self, path: str):
+        self.to_trace().save(path)
+        logging.info(f"Đã lưu {len(self.times)} bước đo lường vào {path}")
+
+
+@dataclass
+class ReplayTrajectory:
+    """Quỹ đạo điều khiển thu được khi phát lại."""
+    times: np.ndarray            # (K,)
+    n: np.ndarray                # (K,)
+    qg: np.ndarray               # (K,) qg(k) [xe/giờ]
+    is_active: np.ndarray        # (K,)
+    green: np.ndarray            # (K, m) thời gian xanh áp dụng sau mỗi bước, theo thứ tự pha của spec
+    solve_time: np.ndarray       # (K,) thời gian giải [s] (0 ở bước không hoạt động)
+    phase_names: List[str]
+    wall_time_s: float
+
+    @property
+    def steps_per_second(self) -> float:
+        return len(self.n) / self.wall_time_s if self.wall_time_s > 0 else float('inf')
+
+    def save(self, path: str):
+        """Lưu quỹ đạo ra file .npz."""
+        np.savez_compressed(path, times=self.times, n=self.n, qg=self.qg, is_active=self.is_active,
+                            green=self.green, solve_time=self.solve_time,
+                            phase_names=np.asarray(self.phase_names, dtype=str))
+
+
+def replay_trace(controller: PerimeterController, trace: ControlTrace, quiet: bool = True) -> ReplayTrajectory:
+    """
+    Chạy bộ điều khiển (chế độ đồng bộ) qua toàn bộ chuỗi đo lường.
+
+    Args:
+        controller: Bộ điều khiển đã khởi tạo (không dùng solver_pool).
+        trace: Chuỗi đo lường.
+        quiet: Tắt print của bộ giải và log mức INFO trong lúc phát lại.
+
+    Raises:
+        ValueError: Nếu bộ điều khiển đang ở chế độ bất đồng bộ.
+    """
+    if controller.solver_pool is not None:
+        raise ValueError("Phát lại chỉ hỗ trợ bộ điều khiển ở chế độ đồng bộ (solver_pool=None)")
+
+    spec = controller.spec
+    queues = trace.queue_matrix(spec)
+    num_steps = len(trace)
+    qg = np.zeros(num_steps)
+    is_active = np.zeros(num_steps, dtype=bool)
+    green = np.zeros((num_steps, spec.num_phases))
+    solve_time = np.zeros(num_steps)
+
+    n_previous, qg_previous = (float(trace.n[0]) if num_steps else 0.0), 0.0
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, (redirect_stdout(devnull) if quiet else nullcontext()):
+        if quiet:
+            logging.disable(logging.INFO)
+        try:
+            for k in range(num_steps):
+                live_queue_lengths = spec.queue_dict(queues[k]) if queues is not None else None
+                solve_time_before = controller.solver_latency.sum
+                result = controller.run_simulation_step(float(trace.n[k]), n_previous, qg_previous,
+                                                        live_queue_lengths, sim_time=float(trace.times[k]))
+                qg[k], is_active[k] = result.qg_new, result.is_active
+                green[k] = spec.green_vector(controller.previous_green_times)
+                solve_time[k] = controller.solver_latency.sum - solve_time_before
+                n_previous, qg_previous = result.n_current, result.qg_new
+        finally:
+            if quiet:
+                logging.disable(logging.NOTSET)
+
+    return ReplayTrajectory(
+        times=np.asarray(trace.times, dtype=float),
+        n=np.asarray(trace.n, dtype=float),
+        qg=qg,
+        is_active=is_active,
+        green=green,
+        solve_time=solve_time,
+        phase_names=list(spec.phase_names),
+        wall_time_s=time.perf_counter() - start_time
+    )
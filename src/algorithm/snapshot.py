@@ -0,0 +1,218 @@
+"""
+Ghi lại đầu vào của bộ giải trong lúc chạy mô phỏng và phát lại (replay) qua các backend.
+
+Mỗi bước điều khiển được ghi thành một dòng JSON trong file gzip:
+    {"step", "sim_time", "qg", "previous_green": [...], "queues": [...], "spec_hash"[, "backend", "status", "objective"]}
+với vector theo thứ tự pha của ProblemSpec. Ở chế độ đồng bộ, kết quả của lần giải lúc chạy (backend, trạng thái,
+giá trị mục tiêu) được ghi kèm, nên phát lại kiểm tra được nghiệm có tái lập hay không. Khi phát lại, các ảnh chụp
+có spec_hash khác với mạng lưới hiện tại bị bỏ qua, vì vị trí pha trong vector không còn tương ứng.
+"""
+
+import gzip
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.backends import create_green_time_solver
+from algorithm.common import SolverStatus
+from algorithm.problem_spec import ProblemSpec
+from data.intersection_config_manager import IntersectionConfigManager
+
+
+@dataclass
+class SolverSnapshot:
+    """Đầu vào của bộ giải tại một bước điều khiển."""
+    step: int
+    sim_time: float
+    target_inflow: float              # qg [xe/giờ]
+    previous_green: np.ndarray        # (m,) phương án chu kỳ trước
+    queues: np.ndarray                # (m,) hàng đợi đã dùng (trực tiếp hoặc từ cấu hình)
+    spec_hash: str
+    backend: Optional[str] = None     # Kết quả lúc chạy (None nếu không ghi, ví dụ chế độ bất đồng bộ)
+    status: Optional[str] = None
+    objective_value: Optional[float] = None
+
+    def to_record(self) -> Dict:
+        record = {
+            'step': self.step,
+            'sim_time': round(self.sim_time, 3),
+            'qg': self.target_inflow,
+            'previous_green': np.rint(self.previous_green).astype(int).tolist(),
+            'queues': np.round(self.queues, 2).tolist(),
+            'spec_hash': self.spec_hash
+        }
+        if self.status is not None:
+            record.update({'backend': self.backend, 'status': self.status, 'objective': self.objective_value})
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict) -> 'SolverSnapshot':
+        return cls(
+            step=record['step'],
+            sim_time=record['sim_time'],
+            target_inflow=record['qg'],
+            previous_green=np.asarray(record['previous_green'], dtype=float),
+            queues=np.asarray(record['queues'], dtype=float),
+            spec_hash=record['spec_hash'],
+            backend=record.get('backend'),
+            status=record.get('status'),
+            objective_value=record.get('objective')
+        )
+
+
+class SnapshotRecorder:
+    """
+    Ghi nối tiếp các ảnh chụp bài toán vào file .jsonl.gz (mỗi bản ghi được flush ngay).
+    """
+
+    def __init__(self, path: str, spec: ProblemSpec):
+        self.path = path
+        self.spec = spec
+        self.spec_hash = spec.fingerprint()
+        self.count = 0
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def record(self, step: int, sim_time: float, target_inflow: float, previous_green_times: Dict,
+               live_queue_lengths: Optional[Dict] = None, result: Optional[Dict] = None, backend: Optional[str] = None):
+        """Ghi đầu vào của một lần giải, kèm trạng thái và giá trị mục tiêu nếu có kết quả."""
+        snapshot = SolverSnapshot(
+            step=step,
+            sim_time=sim_time,
+            target_inflow=target_inflow,
+            previous_green=self.spec.green_vector(previous_green_times),
+            queues=self.spec.queue_vector(live_queue_lengths),
+            spec_hash=self.spec_hash
+        )
+        if result is not None:
+            snapshot.backend = backend
+            snapshot.status = result['status']
+            objective_value = result.get('objective_value')
+            snapshot.objective_value = float(objective_value) if objective_value is not None else None
+        self._file.write(json.dumps(snapshot.to_record(), separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            logging.info(f"Đã ghi {self.count} ảnh chụp bài toán vào {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_snapshots(path: str) -> List[SolverSnapshot]:
+    """Đọc các ảnh chụp từ file .jsonl.gz (bỏ qua dòng cuối bị cắt nếu tiến trình ghi dừng đột ngột)."""
+    snapshots = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    snapshots.append(SolverSnapshot.from_record(json.loads(line)))
+        except (EOFError, json.JSONDecodeError) as e:
+            logging.warning(f"File ảnh chụp {path} bị cắt sau {len(snapshots)} bản ghi: {e}")
+    return snapshots
+
+
+@dataclass
+class ReplayReport:
+    """Kết quả phát lại các ảnh chụp qua một backend."""
+    backend: str
+    latencies: List[float] = field(default_factory=list)
+    objectives: List[float] = field(default_factory=list)       # NaN nếu không có nghiệm
+    statuses: List[Optional[str]] = field(default_factory=list)
+    plans: List[Optional[np.ndarray]] = field(default_factory=list)
+    objective_diffs: List[float] = field(default_factory=list)  # So với backend tham chiếu
+    plan_diffs: List[float] = field(default_factory=list)       # max |ΔG| [s] so với backend tham chiếu
+    recorded_diffs: List[float] = field(default_factory=list)   # So với giá trị mục tiêu ghi lúc chạy (NaN nếu không ghi)
+    status_changes: int = 0                                      # Số ảnh chụp có trạng thái khác trạng thái ghi lúc chạy
+
+    def summary(self) -> Dict:
+        latencies = np.asarray(self.latencies)
+        objective_diffs = np.asarray(self.objective_diffs)
+        plan_diffs = np.asarray(self.plan_diffs)
+        compared = np.isfinite(plan_diffs)
+        return {
+            'backend': self.backend,
+            'snapshots': len(self.latencies),
+            'solved': sum(status in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE) for status in self.statuses),
+            'latency_p50_s': float(np.percentile(latencies, 50)) if latencies.size else float('nan'),
+            'latency_p90_s': float(np.percentile(latencies, 90)) if latencies.size else float('nan'),
+            'latency_max_s': float(latencies.max()) if latencies.size else float('nan'),
+            'objective_mean': float(np.nanmean(self.objectives)) if np.isfinite(self.objectives).any() else float('nan'),
+            'objective_diff_max': float(np.nanmax(objective_diffs)) if np.isfinite(objective_diffs).any() else float('nan'),
+            'plans_changed': int(np.count_nonzero(plan_diffs[compared] > 0)),
+            'plan_diff_max_s': float(plan_diffs[compared].max()) if compared.any() else float('nan'),
+            'recorded_diff_max': float(np.nanmax(np.abs(self.recorded_diffs)))
+                                 if np.isfinite(self.recorded_diffs).any() else float('nan'),
+            'status_changes': self.status_changes
+        }
+
+
+def replay_snapshots(
+    snapshots: Sequence[SolverSnapshot],
+    config_manager: IntersectionConfigManager,
+    backends: Sequence[str],
+    reference: Optional[str] = None
+) -> Dict[str, ReplayReport]:
+    """
+    Giải lại từng ảnh chụp (độc lập, với phương án trước đã ghi) bằng mỗi backend.
+
+    Args:
+        snapshots: Các ảnh chụp (load_snapshots).
+        config_manager: Cấu hình của mạng lưới đã ghi.
+        backends: Tên các backend cần so sánh.
+        reference: Backend tham chiếu cho chênh lệch mục tiêu/phương án (mặc định backend đầu tiên).
+
+    Returns:
+        Dict {backend: ReplayReport}.
+    """
+    spec = ProblemSpec.compile(config_manager)
+    spec_hash = spec.fingerprint()
+    matching = [snapshot for snapshot in snapshots if snapshot.spec_hash == spec_hash]
+    if len(matching) < len(snapshots):
+        logging.warning(f"Bỏ qua {len(snapshots) - len(matching)} ảnh chụp không khớp đặc tả bài toán hiện tại")
+
+    reference = reference or backends[0]
+    order = [reference] + [backend for backend in backends if backend != reference]
+    reports = {}
+    for backend in order:
+        solver = create_green_time_solver(config_manager, backend, cache_size=0, spec=spec)
+        report = ReplayReport(backend=backend)
+        for snapshot in matching:
+            start = time.perf_counter()
+            result = solver.solve(snapshot.target_inflow,
+                                  spec.green_times_from_vector(snapshot.previous_green),
+                                  spec.queue_dict(snapshot.queues))
+            report.latencies.append(time.perf_counter() - start)
+            report.statuses.append(result['status'] if result else None)
+            if result and result['status'] in (SolverStatus.OPTIMAL, SolverStatus.FEASIBLE):
+                G = spec.vector_from_variables(result['variables'])
+                report.plans.append(G)
+                report.objectives.append(spec.objective(G, spec.qg_prime(snapshot.target_inflow), snapshot.queues))
+            else:
+                report.plans.append(None)
+                report.objectives.append(float('nan'))
+            if snapshot.status is not None:
+                recorded = snapshot.objective_value if snapshot.objective_value is not None else float('nan')
+                report.recorded_diffs.append(report.objectives[-1] - recorded)
+                report.status_changes += report.statuses[-1] != snapshot.status
+            else:
+                report.recorded_diffs.append(float('nan'))
+        solver.close()
+        reports[backend] = report
+
+    base = reports[reference]
+    for report in reports.values():
+        for index, G in enumerate(report.plans):
+            G_ref = base.plans[index]
+            report.objective_diffs.append(report.objectives[index] - base.objectives[index])
+            report.plan_diffs.append(float(np.abs(G - G_ref).max()) if G is not None and G_ref is not None else float('nan'))
+    return reports
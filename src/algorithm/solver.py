@@ -2,145 +2,307 @@
 Module giải bài toán tối ưu hóa phân bổ thời gian đèn xanh.
 Sử dụng PySCIPOpt để giải bài toán MIQP (Mixed-Integer Quadratic Programming) phi tuyến.
 MODIFIED: Hỗ trợ cấu trúc pha linh hoạt (1 pha chính, nhiều pha phụ).
+MODIFIED: Mô hình SCIP được xây dựng một lần cho mỗi mạng lưới (GreenTimeSolver) và chỉ
+cập nhật dữ liệu thay đổi ở mỗi bước điều khiển, kèm khởi động ấm từ phương án trước.
+MODIFIED: Giải theo ngân sách thời gian/gap, trả về nghiệm khả thi tốt nhất khi chưa chứng minh tối ưu.
+MODIFIED: GreenTimeSolver là backend 'scip' của giao diện trong algorithm/backends.py.
+MODIFIED: Tiền xử lý (algorithm/presolve.py) khử G_s của nút giao chỉ có một pha phụ và
+chẩn đoán cửa sổ thời gian xanh không khả thi trước khi gọi SCIP.
+MODIFIED: Mô hình và hệ số từng bước được lấy từ ProblemSpec (mảng NumPy) thay vì tra cứu cấu hình.
+MODIFIED: Kết quả kèm 'profile': thời gian từng giai đoạn (presolve, build, objective, optimize, extract)
+và thống kê của SCIP (số nút, số vòng lặp LP, gap).
 """
 
+import time
+import numpy as np
 from pyscipopt import Model, quicksum
-from pyscipopt.recipes.nonlinear import set_nonlinear_objective
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
-from algorithm.common import SolverStatus
+from algorithm.common import SolverStatus, StageTimer
+from algorithm.backends import GreenTimeSolverBackend, create_green_time_solver
+from algorithm.presolve import infeasible_result, presolve_green_time_windows
+from algorithm.problem_spec import ProblemSpec
 from data.intersection_config_manager import IntersectionConfigManager
 
+
+class GreenTimeSolver(GreenTimeSolverBackend):
+    """
+    Bộ giải MIQP bền vững: mô hình SCIP (biến, ràng buộc chu kỳ, cấu trúc hàm mục tiêu)
+    được xây dựng một lần cho mỗi mạng lưới.
+
+    Hàm mục tiêu được khai triển thành dạng epigraph:
+        θ1·(Σ a·G_p − qg')² = θ1·D − 2·θ1·qg'·Σ a·G_p + θ1·qg'²,   với (Σ a·G_p)² <= D
+        θ2·(1 − c·G)²       = θ2·c²·V − 2·θ2·c·G + θ2,            với G² <= V
+    trong đó a = saturation_flow·turn_in_ratio và c = saturation_flow / (queue + 1).
+    Các ràng buộc bậc hai không phụ thuộc dữ liệu từng bước, vì vậy mỗi bước chỉ cần cập nhật
+    vế phải của ràng buộc ±max_change và các hệ số tuyến tính của hàm mục tiêu.
+
+    Với nút giao chỉ có một pha phụ, G_s = cycle − G_p được khử và thành phần sử dụng của pha phụ
+    được gộp vào hệ số của G_p và V_p:
+        θ2·(1 − c_s·(C − G_p))² = θ2·c_s²·V_p + 2·θ2·c_s·(1 − c_s·C)·G_p + θ2·(1 − c_s·C)²
+    """
+
+    name = "scip"
+
+    def __init__(self, config_manager: IntersectionConfigManager,
+                 time_limit_s: Optional[float] = None, gap_limit: Optional[float] = None,
+                 spec: Optional[ProblemSpec] = None):
+        """
+        Args:
+            config_manager: Đối tượng quản lý cấu hình intersection.
+            time_limit_s: Ngân sách thời gian thực (giây) cho mỗi bước giải, tính cả thời gian cập nhật mô hình.
+            gap_limit: Ngưỡng gap tương đối để dừng sớm.
+            spec: Đặc tả bài toán đã biên dịch (dùng chung với bộ điều khiển).
+        """
+        super().__init__(config_manager, time_limit_s=time_limit_s, gap_limit=gap_limit, spec=spec)
+        self.model = None
+        build_start = time.perf_counter()
+        self._build_model()
+        self.build_time_s = time.perf_counter() - build_start
+
+    def _build_model(self):
+        """Xây dựng mô hình SCIP từ ProblemSpec (chỉ gọi một lần khi khởi tạo)."""
+        spec = self.spec
+        model = Model("MIQP_PerimeterControl_MultiPhase")
+
+        # Mỗi phần tử: (chỉ số pha trong spec, nhãn hiển thị, biến G, biến V, ràng buộc min, ràng buộc max)
+        self._phase_entries: List[tuple] = []
+        inflow_terms = []
+        max_green = spec.max_green.tolist()
+        inflow_coefs = spec.inflow_coefs.tolist()
+
+        for index, int_id in enumerate(spec.intersection_ids):
+            start, end = spec.phase_offsets[index], spec.phase_offsets[index + 1]
+            if spec.single_secondary[index]:
+                # G_s = cycle − G_p: không cần biến pha phụ và ràng buộc chu kỳ
+                end = start + 1
+
+            phase_vars = []
+            for phase in range(start, end):
+                k = phase - start
+                name = spec.phase_names[phase]
+                suffix = f'{int_id}_p' if k == 0 else f'{int_id}_s{k - 1}'
+                label = f"Intersection {int_id} - " + ("Main Phase (p)" if k == 0 else f"Secondary Phase (s{k - 1})")
+                G = model.addVar(name, vtype='INTEGER', lb=spec.min_green, ub=max_green[phase])
+                phase_vars.append(G)
+                self._phase_entries.append((phase, label, G) + self._add_phase_rows(model, G, suffix, max_green[phase]))
+            inflow_terms.append(phase_vars[0] * inflow_coefs[index])
+
+            if len(phase_vars) > 1 or spec.num_secondary[index] == 0:
+                # Ràng buộc 1: Tổng thời gian xanh = chu kỳ đèn
+                model.addCons(quicksum(phase_vars) == int(spec.cycle_lengths[index]), f"cons_cycle_{int_id}")
+
+        self._model_phases = np.asarray([entry[0] for entry in self._phase_entries], dtype=np.int64)
+
+        # Epigraph của bình phương tổng lưu lượng vào: (Σ a·G_p)² <= D
+        self.inflow_sq_var = model.addVar('inflow_sq', lb=0, ub=None)
+        model.addCons(quicksum(inflow_terms) ** 2 <= self.inflow_sq_var, "cons_inflow_sq")
+
+        model.setMinimize()
+        model.hideOutput()
+        self.model = model
+        self._solved_once = False
+
+    @staticmethod
+    def _add_phase_rows(model: Model, G, suffix: str, int_max_green: int) -> tuple:
+        """Tạo biến epigraph V >= G² và cặp ràng buộc ±max_change (vế phải cập nhật theo từng bước)."""
+        V = model.addVar(f'V_{suffix}', lb=0, ub=int_max_green ** 2)
+        model.addCons(G * G <= V, f"cons_sq_{suffix}")
+        cons_min = model.addCons(G >= 0, f"cons_G_{suffix}_min")
+        cons_max = model.addCons(G <= int_max_green, f"cons_G_{suffix}_max")
+        return V, cons_min, cons_max
+
+    def _objective_coefficients(self, qg_prime: float, queues: np.ndarray) -> tuple:
+        """
+        Hệ số bậc hai (của V), tuyến tính (của G) theo từng pha và hằng số của hàm mục tiêu.
+
+        Returns:
+            (quad_coefs, linear_coefs, constant) với các mảng (m,) theo thứ tự pha của spec.
+        """
+        spec = self.spec
+        theta_1, theta_2 = spec.theta_1, spec.theta_2
+        c = spec.utilization_coefs(queues)
+
+        # Thành phần 2: θ2·c²·V − 2·θ2·c·G + θ2
+        quad_coefs = theta_2 * c ** 2
+        linear_coefs = -2 * theta_2 * c
+        constant = theta_1 * qg_prime ** 2 + theta_2 * self._model_phases.size
+
+        # Thành phần 1 (phần tuyến tính): −2·θ1·qg'·a·G_p
+        primary = spec.primary_index
+        linear_coefs[primary] += -2 * theta_1 * qg_prime * spec.inflow_coefs
+
+        # Thành phần 2 của pha phụ đã khử, với G_s = C − G_p
+        single = np.flatnonzero(spec.single_secondary)
+        p, c_s = primary[single], c[primary[single] + 1]
+        residual = 1 - c_s * spec.cycle_lengths[single]
+        quad_coefs[p] += theta_2 * c_s ** 2
+        linear_coefs[p] += 2 * theta_2 * c_s * residual
+        constant += theta_2 * float(np.sum(residual ** 2))
+        return quad_coefs, linear_coefs, constant
+
+    def _update_bounds(self, previous_green: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> List[tuple]:
+        """
+        Cập nhật miền (cửa sổ đã tiền xử lý) cho bước hiện tại.
+
+        Returns:
+            Danh sách (biến, giá trị) của nghiệm khởi động ấm từ phương án trước.
+        """
+        model = self.model
+        if self._solved_once:
+            model.freeTransform()
+
+        warm_values = np.clip(previous_green, lower, upper)
+        warm_inflow = float(self.spec.primary_inflows(warm_values).sum())
+        warm_start = [(self.inflow_sq_var, warm_inflow ** 2)]
+        for phase, label, G, V, cons_min, cons_max in self._phase_entries:
+            lb, ub = int(lower[phase]), int(upper[phase])
+
+            # Ràng buộc 2: Giới hạn thay đổi so với chu kỳ trước (đã giao với miền biến khi tiền xử lý)
+            model.chgLhs(cons_min, lb)
+            model.chgRhs(cons_max, ub)
+            print(f"  {label}: Previous={previous_green[phase]:.0f}, Bounds=[{lb}, {ub}]")
+
+            warm_start.append((G, warm_values[phase]))
+            warm_start.append((V, warm_values[phase] ** 2))
+        return warm_start
+
+    def _set_objective(self, qg_prime: float, queues: np.ndarray):
+        """Đặt hàm mục tiêu với hệ số của bước hiện tại."""
+        quad_coefs, linear_coefs, constant = self._objective_coefficients(qg_prime, queues)
+        objective_terms = [self.spec.theta_1 * self.inflow_sq_var]
+        for phase, _, G, V, _, _ in self._phase_entries:
+            objective_terms.append(quad_coefs[phase] * V)
+            objective_terms.append(linear_coefs[phase] * G)
+        self.model.setObjective(quicksum(objective_terms) + constant, "minimize")
+
+    def _add_warm_start(self, warm_start: List[tuple]):
+        """Nạp phương án của chu kỳ trước làm nghiệm khởi đầu (SCIP tự loại nếu không khả thi)."""
+        model = self.model
+        sol = model.createSol()
+        for var, value in warm_start:
+            model.setSolVal(sol, var, value)
+        model.addSol(sol)
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Giải bài toán tối ưu hóa để phân bổ lưu lượng mục tiêu (qg) thành thời gian đèn xanh
+        hỗ trợ nhiều pha phụ và sử dụng hàng đợi trực tiếp.
+
+        Args:
+            target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
+            previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
+            live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+
+        Returns:
+            Một dict chứa kết quả nếu tìm thấy nghiệm (tối ưu, hoặc khả thi tốt nhất khi chạm giới hạn
+            thời gian/gap, kèm 'gap' và 'backend_status'); dict với status INFEASIBLE và 'diagnosis'
+            nếu tiền xử lý phát hiện bài toán không khả thi; ngược lại trả về None.
+        """
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        spec = self.spec
+        qg_prime = spec.qg_prime(target_inflow)
+
+        print(f"🔧 Giải bài toán MIQP với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
+        print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {spec.default_cycle_length}s])")
+
+        previous_green = spec.green_vector(previous_green_times)
+        presolved = presolve_green_time_windows(spec, previous_green)
+        timer.lap('presolve')
+        if not presolved.feasible:
+            print("  Không tìm được nghiệm: tiền xử lý phát hiện bài toán không khả thi")
+            return infeasible_result(presolved)
+
+        model = self.model
+        warm_start = self._update_bounds(previous_green, presolved.lower, presolved.upper)
+        timer.lap('build')
+        self._set_objective(qg_prime, spec.queue_vector(live_queue_lengths))
+        self._add_warm_start(warm_start)
+        timer.lap('objective')
+
+        # Phần ngân sách còn lại sau khi cập nhật mô hình dành cho SCIP
+        remaining_s = self.time_limit_s - (time.perf_counter() - start_time)
+        model.setParam('limits/time', max(remaining_s, 0.01))
+        model.setParam('limits/gap', self.gap_limit)
+        model.optimize()
+        timer.lap('optimize')
+        first_solve = not self._solved_once
+        self._solved_once = True
+
+        scip_status = model.getStatus()
+        if model.getNSols() == 0:
+            print(f"  Không tìm được nghiệm: {scip_status}")
+            return None
+
+        best_sol = model.getBestSol()
+        G_values = np.zeros(spec.num_phases)
+        G_values[self._model_phases] = [model.getSolVal(best_sol, G) for _, _, G, _, _, _ in self._phase_entries]
+        single = np.flatnonzero(spec.single_secondary)
+        G_values[spec.primary_index[single] + 1] = spec.cycle_lengths[single] - G_values[spec.primary_index[single]]
+        variables = spec.variables_from_vector(G_values)
+        timer.lap('extract')
+        profile = self._profile(timer, first_solve)
+        profile['total_s'] = time.perf_counter() - start_time
+
+        status = SolverStatus.OPTIMAL if scip_status == "optimal" else SolverStatus.FEASIBLE
+        if status == SolverStatus.OPTIMAL:
+            print(f"  Tìm được nghiệm tối ưu: {scip_status}")
+        else:
+            print(f"  Dừng tại giới hạn ({scip_status}), dùng nghiệm khả thi tốt nhất, gap={model.getGap():.2%}")
+        result = {
+            'status': status,
+            'backend_status': scip_status,
+            'objective_value': model.getSolObjVal(best_sol),
+            'gap': model.getGap(),
+            'solve_time': profile['total_s'],
+            'profile': profile,
+            'variables': variables
+        }
+        return result
+
+    def _profile(self, timer: StageTimer, first_solve: bool) -> Dict:
+        """Thời gian từng giai đoạn và thống kê của SCIP cho lần giải vừa xong."""
+        model = self.model
+        profile = timer.as_dict()
+        if first_solve:
+            profile['model_build_s'] = self.build_time_s
+        profile.update({
+            'nodes': model.getNNodes(),
+            'lp_iterations': model.getNLPIterations(),
+            'gap': model.getGap(),
+            'num_solutions': model.getNSols(),
+            'scip_solving_s': model.getSolvingTime()
+        })
+        return profile
+
+
 def solve_green_time_optimization(
     target_inflow: float, # qg: veh/h duoc tinh toan boi bo dieu khien PC
     config_manager: IntersectionConfigManager, # cac du lieu lien quan den nut giao
     previous_green_times: Dict, # Thong tin thoi gian xanh cua chu ky truoc
-    live_queue_lengths: Optional[Dict] = None
+    live_queue_lengths: Optional[Dict] = None,
+    backend: Optional[str] = None
 ) -> Optional[Dict]:
     """
-    Giải bài toán tối ưu hóa để phân bổ lưu lượng mục tiêu (qg) thành thời gian đèn xanh
-    hỗ trợ nhiều pha phụ và sử dụng hàng đợi trực tiếp.
+    Giải một lần bài toán phân bổ thời gian xanh (khởi tạo backend mới cho mỗi lần gọi).
+    Với vòng điều khiển lặp lại, dùng create_green_time_solver để tái sử dụng mô hình.
 
     Args:
         target_inflow: Lưu lượng vào mục tiêu qg(k) [xe/giờ].
         config_manager: Đối tượng quản lý cấu hình intersection.
         previous_green_times: Dict chứa thời gian xanh của chu kỳ trước.
         live_queue_lengths: Dict chứa độ dài hàng đợi thực tế từ mô phỏng.
+        backend: Tên backend ('scip', 'cpsat', 'dp', 'relaxation', 'decomposition'); mặc định lấy 'solver_backend' từ cấu hình.
 
     Returns:
-        Một dict chứa kết quả nếu tìm thấy nghiệm tối ưu, ngược lại trả về None.
+        Một dict chứa kết quả nếu tìm thấy nghiệm, dict với status INFEASIBLE và 'diagnosis' nếu
+        tiền xử lý phát hiện bài toán không khả thi, ngược lại trả về None.
     """
-    global_params = config_manager.get_global_params()
-    intersection_ids = config_manager.get_intersection_ids()
-
-    cycle_length = global_params.get('default_cycle_length', 90)
-    qg_prime = target_inflow * cycle_length / 3600.0
-    
-    print(f"🔧 Giải bài toán MIQP với mục tiêu qg = {target_inflow:.2f} [xe/giờ]")
-    print(f"   (Tương đương {qg_prime:.2f} [xe / chu kỳ đèn {cycle_length}s])")
-
-    model = Model("MIQP_PerimeterControl_MultiPhase")
-
-    theta_1 = global_params.get('theta_1', 1.0)
-    theta_2 = global_params.get('theta_2', 0.5)
-    min_green = global_params.get('min_green_time', 15)
-    max_change = global_params.get('max_change', 10)
-
-    G_vars = {}
-    for int_id in intersection_ids:
-        G_vars[int_id] = {'p': None, 's': {}}
-        # max_green for each intersection can be different based on its cycle length
-        int_max_green = config_manager.get_cycle_length(int_id) - min_green
-        phase_info = config_manager.get_phase_info(int_id)
-
-        # Tạo biến cho pha chính (primary)
-        G_p = model.addVar(f'G_{int_id}_p', vtype='INTEGER', lb=min_green, ub=int_max_green)
-        G_vars[int_id]['p'] = G_p
-
-        # Tạo biến cho các pha phụ (secondary)
-        if phase_info and 's' in phase_info:
-            for i, _ in enumerate(phase_info['s']):
-                G_s = model.addVar(f'G_{int_id}_s_{i}', vtype='INTEGER', lb=min_green, ub=int_max_green)
-                G_vars[int_id]['s'][i] = G_s
-
-    # Xác định độ dài hàng đợi sẽ sử dụng (trực tiếp hoặc từ config)
-    queue_lengths_to_use = {}
-    for int_id in intersection_ids:
-        phase_info = config_manager.get_phase_info(int_id)
-        queue_lengths_to_use[int_id] = {'p': 0, 's': []}
-        
-        # Pha chính
-        if live_queue_lengths and int_id in live_queue_lengths:
-            queue_lengths_to_use[int_id]['p'] = live_queue_lengths[int_id]['p']
-        else:
-            queue_lengths_to_use[int_id]['p'] = phase_info['p']['queue_length']
-            
-        # Pha phụ
-        if 's' in phase_info:
-            for i, phase in enumerate(phase_info['s']):
-                if live_queue_lengths and int_id in live_queue_lengths and i < len(live_queue_lengths[int_id]['s']):
-                    queue_lengths_to_use[int_id]['s'].append(live_queue_lengths[int_id]['s'][i])
-                else:
-                    queue_lengths_to_use[int_id]['s'].append(phase['queue_length'])
-
-    # Thêm ràng buộc
-    for int_id in intersection_ids:
-        phase_info = config_manager.get_phase_info(int_id)
-        current_cycle = config_manager.get_cycle_length(int_id)
-
-        # Ràng buộc 1: Tổng thời gian xanh = chu kỳ đèn
-        secondary_phases_sum = quicksum(G_vars[int_id]['s'][i] for i in G_vars[int_id]['s'])
-        model.addCons(G_vars[int_id]['p'] + secondary_phases_sum == current_cycle, f"cons_cycle_{int_id}")
-
-        # Ràng buộc 2: Giới hạn thay đổi so với chu kỳ trước
-        prev_p = previous_green_times[int_id]['p']
-        model.addCons(G_vars[int_id]['p'] >= prev_p - max_change, f"cons_G_p_min_{int_id}")
-        model.addCons(G_vars[int_id]['p'] <= prev_p + max_change, f"cons_G_p_max_{int_id}")
-        print(f"  Intersection {int_id} - Main Phase (p): Previous={prev_p}, Bounds=[{prev_p - max_change}, {prev_p + max_change}], Var_Bounds=[{min_green}, {int_max_green}]")
-
-        if phase_info and 's' in phase_info:
-            for i, _ in enumerate(phase_info['s']):
-                prev_s = previous_green_times[int_id]['s'][i]
-                model.addCons(G_vars[int_id]['s'][i] >= prev_s - max_change, f"cons_G_s{i}_min_{int_id}")
-                model.addCons(G_vars[int_id]['s'][i] <= prev_s + max_change, f"cons_G_s{i}_max_{int_id}")
-                print(f"  Intersection {int_id} - Secondary Phase (s{i}): Previous={prev_s}, Bounds=[{prev_s - max_change}, {prev_s + max_change}], Var_Bounds=[{min_green}, {int_max_green}]")
-
-    # Xây dựng hàm mục tiêu phi tuyến
-    # Thành phần 1: Tối thiểu hóa độ lệch so với lưu lượng mục tiêu (chỉ tính trên pha chính)
-    inflow_expr = quicksum(
-        G_vars[int_id]['p'] * config_manager.get_phase_info(int_id)['p']['saturation_flow'] * config_manager.get_phase_info(int_id)['p']['turn_in_ratio']
-        for int_id in intersection_ids
-    )
-    deviation = inflow_expr - qg_prime
-    first_component = theta_1 * (deviation**2)
-
-    # Thành phần 2: Tối đa hóa việc sử dụng đèn xanh (tối thiểu hóa lãng phí)
-    utilization_expr = quicksum(
-        # Lãng phí của pha chính
-        (1 - (G_vars[int_id]['p'] * config_manager.get_phase_info(int_id)['p']['saturation_flow']) / 
-            (queue_lengths_to_use[int_id]['p'] + 1))**2 +
-        # Tổng lãng phí của các pha phụ
-        quicksum(
-            (1 - (G_vars[int_id]['s'][i] * phase['saturation_flow']) / (queue_lengths_to_use[int_id]['s'][i] + 1))**2
-            for i, phase in enumerate(config_manager.get_phase_info(int_id)['s'])
-        )
-        for int_id in intersection_ids
-    )
-    second_component = theta_2 * utilization_expr
-
-    set_nonlinear_objective(model, first_component + second_component, "minimize")
-
-    model.hideOutput()
-    model.optimize()
-
-    if model.getStatus() == "optimal":
-        print(f"  Tìm được nghiệm tối ưu: {model.getStatus()}")
-        result = {
-            'status': SolverStatus.OPTIMAL,
-            'objective_value': model.getObjVal(),
-            'variables': {var.name: model.getVal(var) for var in model.getVars()}
-        }
-        return result
-    else:
-        print(f"  Không tìm được nghiệm: {model.getStatus()}")
-        return None
\ No newline at end of file
+    solver = create_green_time_solver(config_manager, backend)
+    return solver.solve(target_inflow, previous_green_times, live_queue_lengths)
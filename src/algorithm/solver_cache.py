@@ -0,0 +1,134 @@
+"""
+Bộ nhớ đệm LRU đặt trước bộ giải phân bổ thời gian xanh.
+
+Khi giao thông ùn tắc ổn định, các bước liên tiếp thường có đầu vào gần như giống nhau. Khóa của
+bộ nhớ đệm gồm qg và hàng đợi đã lượng tử hóa (theo độ phân giải cấu hình) cùng phương án chu kỳ trước
+(số nguyên, không lượng tử hóa). Bộ nhớ đệm tự xóa và xây dựng lại backend khi cấu hình thay đổi
+(IntersectionConfigManager.fingerprint()).
+"""
+
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from algorithm.backends import GreenTimeSolverBackend
+from algorithm.common import SolverStatus
+from algorithm.plan_table import PlanLookupTable
+
+# Chỉ lưu các kết quả tất định (không phụ thuộc ngân sách thời gian)
+_CACHEABLE_STATUSES = (SolverStatus.OPTIMAL, SolverStatus.INFEASIBLE)
+
+
+class CachedGreenTimeSolver(GreenTimeSolverBackend):
+    """
+    Backend bọc một backend khác bằng bộ nhớ đệm LRU có giới hạn.
+    """
+
+    def __init__(self, factory: Callable[[], GreenTimeSolverBackend], max_entries: int,
+                 qg_resolution: float = 1.0, queue_resolution: float = 0.5):
+        """
+        Args:
+            factory: Hàm tạo backend được bọc (gọi lại khi cấu hình thay đổi).
+            max_entries: Số kết quả tối đa được lưu.
+            qg_resolution: Độ phân giải lượng tử hóa qg [xe/giờ].
+            queue_resolution: Độ phân giải lượng tử hóa hàng đợi [xe].
+        """
+        self.factory = factory
+        self.solver = factory()
+        super().__init__(self.solver.config_manager, time_limit_s=self.solver.time_limit_s,
+                         gap_limit=self.solver.gap_limit, spec=self.solver.spec)
+        self.name = f"cached:{self.solver.name}"
+        self.max_entries = max_entries
+        self.qg_resolution = qg_resolution
+        self.queue_resolution = queue_resolution
+        self.fingerprint = self.config_manager.fingerprint()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_config(self):
+        """Xóa bộ nhớ đệm và xây dựng lại backend nếu cấu hình đã thay đổi."""
+        fingerprint = self.config_manager.fingerprint()
+        if fingerprint == self.fingerprint:
+            return
+        logging.info(f"Cấu hình thay đổi: xóa {len(self._entries)} kết quả trong bộ nhớ đệm bộ giải")
+        self._entries.clear()
+        self.invalidations += 1
+        self.solver.close()
+        self.solver = self.factory()
+        self.spec = self.solver.spec
+        self.fingerprint = fingerprint
+
+    def _key(self, target_inflow: float, previous_green_times: Dict, live_queue_lengths: Optional[Dict]) -> tuple:
+        queues = np.rint(self.spec.queue_vector(live_queue_lengths) / self.queue_resolution).astype(np.int64)
+        previous_green = np.rint(self.spec.green_vector(previous_green_times)).astype(np.int64)
+        return round(target_inflow / self.qg_resolution), previous_green.tobytes(), queues.tobytes()
+
+    def solve(
+        self,
+        target_inflow: float,
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Trả về kết quả đã lưu nếu đầu vào (sau lượng tử hóa) trùng một lần giải trước, ngược lại gọi
+        backend được bọc. Kết quả trả về có thêm khóa 'cache_hit'.
+        """
+        start_time = time.perf_counter()
+        self._check_config()
+        key = self._key(target_inflow, previous_green_times, live_queue_lengths)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = copy.deepcopy(cached)
+            result['cache_hit'] = True
+            result['solve_time'] = time.perf_counter() - start_time
+            result['profile'] = {'cache_lookup_s': result['solve_time'], 'total_s': result['solve_time']}
+            return result
+
+        self.misses += 1
+        result = self.solver.solve(target_inflow, previous_green_times, live_queue_lengths)
+        if result is None:
+            return None
+        if result['status'] in _CACHEABLE_STATUSES:
+            self._entries[key] = copy.deepcopy(result)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        result['cache_hit'] = False
+        return result
+
+    def solve_batch(
+        self,
+        target_inflows: Sequence[float],
+        previous_green_times: Dict,
+        live_queue_lengths: Optional[Dict] = None
+    ) -> Optional[PlanLookupTable]:
+        self._check_config()
+        return self.solver.solve_batch(target_inflows, previous_green_times, live_queue_lengths)
+
+    def clear(self):
+        self._entries.clear()
+
+    def close(self):
+        self._entries.clear()
+        self.solver.close()
+
+    def stats(self) -> Dict:
+        """Bộ đếm của bộ nhớ đệm."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,215 @@
+"""
+Quét tham số bộ điều khiển PI (Kp, Ki, n̂, hệ số ngưỡng kích hoạt/hủy) trên mô hình thay thế MFD.
+
+Thay vì một lần chạy SUMO cho mỗi bộ tham số, vùng được mô phỏng bằng mô hình hồ chứa (store-and-forward):
+    n(k+1) = n(k) + T·(d_u(k) + u(k) - G(n(k)))
+    w(k+1) = w(k) + T·(d_g(k) - u(k))
+trong đó G(n) là MFD dạng parabol (cực đại g_max tại n_crit), d_u là nhu cầu không bị chắn, d_g là nhu cầu
+qua các nút giao chắn, w là hàng đợi tại cổng chắn và u = min(qg, d_g + w/T) khi bộ điều khiển hoạt động
+(u = d_g + w/T khi không hoạt động). Nhu cầu lấy từ hồ sơ giờ cao điểm hoặc suy ra từ chuỗi n(k) đã ghi
+(ControlTrace).
+
+P bộ tham số được mô phỏng đồng thời dưới dạng mảng (P,) với luật PI và trễ của bộ điều khiển nhiều vùng
+(pi_update, hysteresis_update); các lô tham số được chia cho nhiều tiến trình con.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from algorithm.algo import ACTIVATION_FACTOR, CONTROL_INTERVAL_S, DEACTIVATION_FACTOR, KI_H, KP_H, N_HAT
+from algorithm.multi_region import hysteresis_update, pi_update
+from algorithm.replay import ControlTrace
+
+# Các tham số được quét và giá trị mặc định (của PerimeterController)
+PARAMETER_DEFAULTS = {
+    'kp': KP_H,
+    'ki': KI_H,
+    'n_hat': N_HAT,
+    'activation_factor': ACTIVATION_FACTOR,
+    'deactivation_factor': DEACTIVATION_FACTOR
+}
+
+
+@dataclass
+class MFDSurrogate:
+    """Mô hình hồ chứa một vùng với MFD parabol."""
+    g_max: float = 3000.0               # Lưu lượng ra cực đại [xe/giờ]
+    n_crit: float = N_HAT               # Tích lũy tới hạn (tại g_max) [xe]
+    control_interval_s: float = CONTROL_INTERVAL_S
+
+    def outflow(self, n: np.ndarray) -> np.ndarray:
+        """G(n) [xe/giờ]: parabol đi qua 0 tại n = 0 và n = 2·n_crit."""
+        x = np.clip(n / (2 * self.n_crit), 0.0, 1.0)
+        return 4 * self.g_max * x * (1 - x)
+
+    @classmethod
+    def fit(cls, accumulation: np.ndarray, outflow: np.ndarray,
+            control_interval_s: float = CONTROL_INTERVAL_S) -> 'MFDSurrogate':
+        """
+        Khớp MFD parabol G(n) = a·n + b·n² (qua gốc tọa độ) theo bình phương tối thiểu từ các điểm đo
+        (tích lũy [xe], lưu lượng ra [xe/giờ]), ví dụ dữ liệu của tools/mfd_graph.py.
+
+        Raises:
+            ValueError: Nếu đường cong khớp được không có dạng lõm (b >= 0).
+        """
+        n = np.asarray(accumulation, dtype=float)
+        A = np.column_stack([n, n ** 2])
+        (a, b), *_ = np.linalg.lstsq(A, np.asarray(outflow, dtype=float), rcond=None)
+        if b >= 0 or a <= 0:
+            raise ValueError(f"MFD khớp được không có dạng parabol lõm (a={a:.4g}, b={b:.4g})")
+        return cls(g_max=float(-a * a / (4 * b)), n_crit=float(-a / (2 * b)), control_interval_s=control_interval_s)
+
+    def demand_from_trace(self, trace: ControlTrace) -> np.ndarray:
+        """
+        (K-1,) tổng nhu cầu vào vùng [xe/giờ] suy ra từ chuỗi n(k) đã ghi: d(k) = Δn(k)/T + G(n(k)).
+        Chuỗi đã ghi là quỹ đạo có điều khiển, nên nhu cầu suy ra là xấp xỉ (bỏ qua hàng đợi tại cổng chắn).
+        """
+        n = np.asarray(trace.n, dtype=float)
+        interval_h = self.control_interval_s / 3600.0
+        return np.maximum(np.diff(n) / interval_h + self.outflow(n[:-1]), 0.0)
+
+
+def peak_demand_profile(num_steps: int, base: float = 1500.0, peak: float = 3600.0,
+                        ramp_fraction: float = 0.25) -> np.ndarray:
+    """(K,) hồ sơ nhu cầu hình thang [xe/giờ]: tăng từ base lên peak, giữ, rồi giảm về base."""
+    k = np.arange(num_steps) / max(num_steps - 1, 1)
+    ramp = max(ramp_fraction, 1e-9)
+    up = np.clip(k / ramp, 0.0, 1.0)
+    down = np.clip((1 - k) / ramp, 0.0, 1.0)
+    return base + (peak - base) * np.minimum(up, down)
+
+
+def grid_parameter_sets(grid: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """Tích Descartes các giá trị trong grid (tham số không có trong grid lấy giá trị mặc định)."""
+    names = list(grid)
+    return [{**PARAMETER_DEFAULTS, **dict(zip(names, values))} for values in itertools.product(*grid.values())]
+
+
+def random_parameter_sets(bounds: Dict[str, Sequence[float]], num_samples: int,
+                          seed: Optional[int] = None) -> List[Dict[str, float]]:
+    """num_samples bộ tham số lấy mẫu đều trong bounds {tên: (min, max)}."""
+    rng = np.random.default_rng(seed)
+    samples = {name: rng.uniform(low, high, num_samples) for name, (low, high) in bounds.items()}
+    return [{**PARAMETER_DEFAULTS, **{name: float(values[i]) for name, values in samples.items()}}
+            for i in range(num_samples)]
+
+
+def simulate_parameter_sets(parameter_sets: Sequence[Dict[str, float]], surrogate: MFDSurrogate,
+                            demand: np.ndarray, gated_share: float = 0.5, n_initial: float = 0.0,
+                            settling_band: float = 0.05) -> List[Dict[str, float]]:
+    """
+    Mô phỏng đồng thời P bộ tham số trên mô hình thay thế và tính chỉ số đánh giá cho từng bộ.
+
+    Args:
+        parameter_sets: Các bộ tham số (khóa như PARAMETER_DEFAULTS).
+        surrogate: Mô hình hồ chứa.
+        demand: (K,) tổng nhu cầu vào vùng [xe/giờ].
+        gated_share: Tỉ lệ nhu cầu đi qua các nút giao chắn.
+        n_initial: Tích lũy ban đầu [xe].
+        settling_band: Dải ổn định quanh n̂ (tỉ lệ của n̂).
+
+    Returns:
+        Mỗi phần tử là bộ tham số kèm các chỉ số:
+        - settling_time_s: thời gian từ lần kích hoạt đầu tiên tới khi n không còn vượt n̂·(1 + band)
+          (inf nếu vẫn vượt ở cuối chuỗi, 0 nếu không bao giờ kích hoạt);
+        - overshoot: max(n - n̂, 0) / n̂ sau lần kích hoạt đầu tiên;
+        - peak_accumulation: n lớn nhất [xe];
+        - solves: số bước bộ điều khiển hoạt động (mỗi bước là một lần gọi bộ giải);
+        - plan_churn: tổng |Δqg| giữa các bước hoạt động liên tiếp [xe/giờ];
+        - gate_delay_veh_h: tổng thời gian chờ tại cổng chắn [xe·giờ].
+    """
+    params = {name: np.asarray([p[name] for p in parameter_sets], dtype=float) for name in PARAMETER_DEFAULTS}
+    num_sets, num_steps = len(parameter_sets), len(demand)
+    interval_h = surrogate.control_interval_s / 3600.0
+    activation_threshold = params['activation_factor'] * params['n_hat']
+    deactivation_threshold = params['deactivation_factor'] * params['n_hat']
+
+    n = np.full(num_sets, float(n_initial))
+    n_previous = n.copy()
+    qg = np.zeros(num_sets)
+    gate_queue = np.zeros(num_sets)
+    is_active = np.zeros(num_sets, dtype=bool)
+
+    accumulation = np.empty((num_steps, num_sets))
+    active = np.empty((num_steps, num_sets), dtype=bool)
+    targets = np.empty((num_steps, num_sets))
+    gate_delay = np.zeros(num_sets)
+    for k in range(num_steps):
+        is_active = hysteresis_update(n, is_active, activation_threshold, deactivation_threshold)
+        qg = np.where(is_active, pi_update(n, n_previous, qg, params['n_hat'], params['kp'], params['ki']), qg)
+        accumulation[k], active[k], targets[k] = n, is_active, qg
+
+        gated_demand = gated_share * demand[k]
+        available = gated_demand + gate_queue / interval_h
+        inflow = np.where(is_active, np.minimum(qg, available), available)
+        gate_queue = np.maximum(gate_queue + interval_h * (gated_demand - inflow), 0.0)
+        gate_delay += gate_queue * interval_h
+
+        n_previous = n
+        n = np.maximum(n + interval_h * ((1 - gated_share) * demand[k] + inflow - surrogate.outflow(n)), 0.0)
+
+    # Chỉ số đánh giá
+    ever_active = active.any(axis=0)
+    first_active = np.where(ever_active, active.argmax(axis=0), num_steps)
+    steps = np.arange(num_steps)[:, None]
+    after_activation = steps >= first_active
+    excess = np.where(after_activation, accumulation - params['n_hat'], -np.inf)
+    violating = excess > settling_band * params['n_hat']
+    last_violation = np.where(violating.any(axis=0), num_steps - 1 - violating[::-1].argmax(axis=0), first_active - 1)
+    settling_steps = np.where(last_violation >= num_steps - 1, np.inf, last_violation + 1 - first_active)
+    settling_time = np.where(ever_active, settling_steps * surrogate.control_interval_s, 0.0)
+    overshoot = np.maximum(excess.max(axis=0), 0.0) / params['n_hat']
+    churn = np.sum(np.abs(np.diff(targets, axis=0)) * (active[1:] & active[:-1]), axis=0)
+
+    return [{
+        **parameter_sets[i],
+        'settling_time_s': float(settling_time[i]),
+        'overshoot': float(overshoot[i]) if ever_active[i] else 0.0,
+        'peak_accumulation': float(accumulation[:, i].max()),
+        'solves': int(active[:, i].sum()),
+        'plan_churn': float(churn[i]),
+        'gate_delay_veh_h': float(gate_delay[i])
+    } for i in range(num_sets)]
+
+
+def _simulate_batch(args: tuple) -> List[Dict[str, float]]:
+    parameter_sets, surrogate, demand, gated_share, n_initial = args
+    return simulate_parameter_sets(parameter_sets, surrogate, demand, gated_share, n_initial)
+
+
+def rank_results(results: Sequence[Dict[str, float]]) -> List[Dict[str, float]]:
+    """Sắp xếp theo thời gian ổn định, rồi độ vọt lố, rồi tải bộ giải (số lần giải)."""
+    return sorted(results, key=lambda r: (r['settling_time_s'], round(r['overshoot'], 4), r['solves']))
+
+
+def run_sweep(parameter_sets: Sequence[Dict[str, float]], surrogate: Optional[MFDSurrogate] = None,
+              demand: Optional[np.ndarray] = None, gated_share: float = 0.5, n_initial: float = 0.0,
+              num_workers: int = 1, batch_size: int = 256) -> List[Dict[str, float]]:
+    """
+    Đánh giá các bộ tham số (song song theo lô trong tiến trình con) và trả về danh sách đã xếp hạng.
+    Bộ tham số có deactivation_factor >= activation_factor (không có vùng trễ) bị loại.
+
+    Args:
+        parameter_sets: Các bộ tham số (grid_parameter_sets / random_parameter_sets).
+        surrogate: Mô hình hồ chứa (mặc định MFDSurrogate()).
+        demand: (K,) tổng nhu cầu [xe/giờ] (mặc định hồ sơ giờ cao điểm 4 giờ).
+        num_workers: Số tiến trình con (1 = chạy trong tiến trình hiện tại).
+        batch_size: Số bộ tham số mô phỏng đồng thời trong mỗi lô.
+    """
+    surrogate = surrogate or MFDSurrogate()
+    if demand is None:
+        demand = peak_demand_profile(int(4 * 3600 / surrogate.control_interval_s))
+    valid = [p for p in parameter_sets if p['deactivation_factor'] < p['activation_factor']]
+    batches = [(valid[i:i + batch_size], surrogate, demand, gated_share, n_initial)
+               for i in range(0, len(valid), batch_size)]
+
+    if num_workers <= 1 or len(batches) <= 1:
+        results = [r for batch in batches for r in _simulate_batch(batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = [r for batch_results in executor.map(_simulate_batch, batches) for r in batch_results]
+    return rank_results(results)
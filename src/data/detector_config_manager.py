@@ -64,3 +64,12 @@ class DetectorConfigManager:
         """
         return self.config_data.get('mfd_input_flow_detectors', {}).get('detector_ids', {})
 
+    def get_detector_geometry(self) -> Dict:
+        """
+        Lấy tham số hình học của detector e2 dùng để quy đổi độ chiếm dụng thành số xe.
+
+        Returns:
+            Dict: {'vehicle_length': ..., 'detectors': {det_id: {'length', 'num_lanes', 'vehicle_length'}}}
+                  (chiều dài detector mặc định lấy từ mô phỏng).
+        """
+        return self.config_data.get('detector_geometry', {})
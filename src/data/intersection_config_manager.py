@@ -6,6 +6,7 @@ MODIFIED: Hỗ trợ cấu trúc pha linh hoạt (1 pha chính, nhiều pha ph
 
 import json
 import os
+import hashlib
 import logging
 from typing import Dict, List, Optional, Any
 
@@ -58,6 +59,14 @@ class IntersectionConfigManager:
         except Exception as e:
             logging.error(f"Lỗi khi lưu cấu hình: {e}", exc_info=True)
     
+    def fingerprint(self) -> str:
+        """
+        Mã băm của 'optimization_parameters' (toàn bộ dữ liệu định nghĩa bài toán tối ưu hóa).
+        Thay đổi khi cấu hình được nạp lại hoặc chỉnh sửa.
+        """
+        params = self.config_data.get('optimization_parameters', {})
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
     def get_intersection_ids(self) -> List[str]:
         """
         Lấy danh sách ID của các intersection được định nghĩa trong 'optimization_parameters'.
@@ -75,9 +84,45 @@ class IntersectionConfigManager:
             'default_cycle_length': params.get('default_cycle_length', 90),
             'min_green_time': params.get('min_green_time', 15),
             'max_green_time': params.get('max_green_time', 75),
-            'max_change': params.get('max_change', 5)
+            'max_change': params.get('max_change', 5),
+            # Ngân sách thời gian (giây) và ngưỡng gap tương đối cho mỗi lần giải
+            'solver_time_limit_s': params.get('solver_time_limit_s', 30.0),
+            'solver_gap_limit': params.get('solver_gap_limit', 0.0),
+            # Backend bộ giải ('scip', 'cpsat', 'dp', 'relaxation' hoặc 'decomposition') và số luồng tìm kiếm cho CP-SAT
+            'solver_backend': params.get('solver_backend', 'scip'),
+            'solver_num_workers': params.get('solver_num_workers', 8),
+            # Số mức lưu lượng tối đa của bảng DP (vượt quá thì backend 'dp' giải bằng SCIP; 0 = không giới hạn)
+            'dp_max_inflow_levels': params.get('dp_max_inflow_levels', 2_000_000),
+            # Backend tham chiếu để đo gap của 'relaxation' (None = không so sánh)
+            'relaxation_reference_backend': params.get('relaxation_reference_backend'),
+            # Backend 'decomposition': phân vùng (danh sách id hoặc số vùng), backend giải từng vùng,
+            # số tiến trình (1 = giải tuần tự), tham số phạt ρ (None = 2·θ1·số vùng), số vòng lặp, dung sai [xe/chu kỳ]
+            # và số lượt tinh chỉnh theo khối sau ADMM
+            'decomposition_shards': params.get('decomposition_shards'),
+            'decomposition_num_shards': params.get('decomposition_num_shards', 4),
+            'decomposition_shard_backend': params.get('decomposition_shard_backend', 'dp'),
+            'decomposition_num_workers': params.get('decomposition_num_workers'),
+            'decomposition_rho': params.get('decomposition_rho'),
+            'decomposition_max_iterations': params.get('decomposition_max_iterations', 30),
+            'decomposition_tolerance': params.get('decomposition_tolerance', 0.5),
+            'decomposition_polish_sweeps': params.get('decomposition_polish_sweeps', 3),
+            # Bộ nhớ đệm LRU trước bộ giải: số phần tử tối đa (0 = tắt) và độ phân giải lượng tử hóa
+            # của qg [xe/giờ] và hàng đợi [xe] khi tạo khóa
+            'solver_cache_size': params.get('solver_cache_size', 0),
+            'solver_cache_qg_resolution': params.get('solver_cache_qg_resolution', 1.0),
+            'solver_cache_queue_resolution': params.get('solver_cache_queue_resolution', 0.5)
         }
 
+    def get_regions(self) -> List[Dict[str, Any]]:
+        """
+        Lấy danh sách vùng MFD cho bộ điều khiển nhiều vùng (khóa 'regions' trong 'optimization_parameters').
+
+        Returns:
+            List[Dict]: Mỗi phần tử có dạng {'id': ..., 'intersections': [...], 'n_hat': ..., 'kp': ..., 'ki': ...};
+                        các khóa ngoài 'id' và 'intersections' là tùy chọn. Danh sách rỗng nếu không cấu hình.
+        """
+        return self.config_data.get('optimization_parameters', {}).get('regions', [])
+
     def get_intersection_data(self, intersection_id: str) -> Optional[Dict]:
         """
         Lấy toàn bộ dữ liệu của một intersection cụ thể.
@@ -102,6 +147,12 @@ class IntersectionConfigManager:
             return intersection_data.get('traffic_light_id')
         return None
 
+    def get_traffic_light_phases(self, tl_id: str) -> List[Dict[str, Any]]:
+        """
+        Lấy định nghĩa các pha (duration, state) của một đèn từ mục 'traffic_lights'.
+        """
+        return self.config_data.get('traffic_lights', {}).get(tl_id, {}).get('phases', [])
+
     def get_phase_info(self, intersection_id: str) -> Optional[Dict]:
         """
         Lấy thông tin về các pha (chính và phụ) của một intersection.
@@ -129,7 +180,7 @@ class IntersectionConfigManager:
                 continue
 
             # Lấy định nghĩa các pha từ traffic_lights, không phải từ traci
-            traffic_light_phases = self.config_data.get('traffic_lights', {}).get(tl_id, {}).get('phases', [])
+            traffic_light_phases = self.get_traffic_light_phases(tl_id)
             phase_info = self.get_phase_info(int_id)
 
             if not traffic_light_phases or not phase_info:
@@ -0,0 +1,201 @@
+"""
+Lớp lấy mẫu detector dựa trên đăng ký (subscription) TraCI.
+
+Mỗi biến detector cần đọc (độ chiếm dụng của khoảng đo cuối với e2, số xe của khoảng đo cuối với e1) được
+đăng ký một lần. Sau đó SUMO trả giá trị kèm phản hồi của mỗi simulationStep, nên đọc qua
+getAllSubscriptionResults() không tốn thêm lượt gọi socket nào. Thuật toán, bộ giải và công cụ MFD cùng đọc
+từ một bộ đệm, và detector dùng chung bởi nhiều nơi chỉ được truyền một lần.
+
+Độ chiếm dụng e2 của bước gần nhất được giữ trong một vector. Hệ số quy đổi tích lũy của từng detector
+    chiều dài·số làn / (100·chiều dài xe)
+lấy từ DetectorRegistry, xây dựng một lần. Một detector e2 chỉ đo một làn; nó đại diện cho các làn của
+đoạn đường (edge) chứa nó, chia đều cho các detector cùng nhóm nằm trên đoạn đường đó. Tích lũy của một nhóm
+detector là tích vô hướng với vector trọng số tính sẵn, và mọi nhóm của một lần lấy mẫu là một phép nhân
+ma trận-vector.
+"""
+
+import logging
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import traci
+import traci.constants as tc
+
+# Hình học mặc định của e2, dùng khi không biết giá trị của từng detector
+ROAD_LENGTH_M = 80.0
+AVERAGE_VEHICLE_LENGTH_M = 3.0
+NUM_LANES = 1
+
+
+class DetectorRegistry:
+    """
+    Hình học của các detector e2 dưới dạng mảng NumPy, theo thứ tự detector_ids.
+
+    Dict geometry (mục 'detector_geometry' của detector_config.json) có thể đặt 'vehicle_length' mặc định và
+    giá trị ghi đè theo detector {'detectors': {det_id: {'length', 'num_lanes', 'vehicle_length'}}}. num_lanes
+    ghi đè được dùng nguyên giá trị; ngược lại số làn của đoạn đường chứa detector được chia cho các detector
+    cùng nhóm trên đoạn đường đó.
+    """
+
+    def __init__(self, detector_ids: Sequence[str], lengths: Dict[str, float], geometry: Optional[Dict] = None,
+                 edges: Optional[Dict[str, str]] = None, edge_lanes: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            detector_ids: Các detector e2, theo thứ tự của vector độ chiếm dụng.
+            lengths: Chiều dài detector [m] (ROAD_LENGTH_M nếu thiếu).
+            geometry: Mục 'detector_geometry' của detector_config.json.
+            edges: Đoạn đường chứa làn của từng detector (đoạn đường không rõ tính là NUM_LANES làn).
+            edge_lanes: Số làn của từng đoạn đường.
+        """
+        geometry = geometry or {}
+        overrides = geometry.get('detectors', {})
+        default_vehicle_length = geometry.get('vehicle_length', AVERAGE_VEHICLE_LENGTH_M)
+        edges = edges or {}
+        edge_lanes = edge_lanes or {}
+
+        self.detector_ids = list(detector_ids)
+        self.index = {det_id: i for i, det_id in enumerate(self.detector_ids)}
+        self.lengths = np.asarray([overrides.get(det_id, {}).get('length', lengths.get(det_id, ROAD_LENGTH_M))
+                                   for det_id in self.detector_ids], dtype=float)
+        # Đoạn đường dùng chung với các detector khác trong nhóm (None: ghi đè hoặc không rõ, dùng nguyên số làn)
+        self.edges = [None if 'num_lanes' in overrides.get(det_id, {}) else edges.get(det_id)
+                      for det_id in self.detector_ids]
+        self.num_lanes = np.asarray([overrides.get(det_id, {}).get('num_lanes', edge_lanes.get(edges.get(det_id), NUM_LANES))
+                                     for det_id in self.detector_ids], dtype=float)
+        self.vehicle_lengths = np.asarray([overrides.get(det_id, {}).get('vehicle_length', default_vehicle_length)
+                                           for det_id in self.detector_ids], dtype=float)
+        # Số xe trên mỗi phần trăm độ chiếm dụng không gian của một làn
+        self.scale = self.lengths / (100 * self.vehicle_lengths)
+        self._weights: Dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def from_traci(cls, detector_ids: Sequence[str], geometry: Optional[Dict] = None) -> 'DetectorRegistry':
+        """
+        Chiều dài và số làn đọc một lần từ mô phỏng đang chạy
+        (traci.lanearea.getLength, traci.lanearea.getLaneID, traci.lane.getEdgeID, traci.edge.getLaneNumber).
+        """
+        lengths, edges, edge_lanes = {}, {}, {}
+        for det_id in detector_ids:
+            try:
+                lengths[det_id] = traci.lanearea.getLength(det_id)
+                edge_id = traci.lane.getEdgeID(traci.lanearea.getLaneID(det_id))
+                if edge_id not in edge_lanes:
+                    edge_lanes[edge_id] = traci.edge.getLaneNumber(edge_id)
+                edges[det_id] = edge_id
+            except traci.TraCIException as e:
+                logging.warning(f"Không đọc được hình học của detector e2 {det_id}, dùng giá trị mặc định: {e}")
+        return cls(detector_ids, lengths, geometry, edges, edge_lanes)
+
+    @classmethod
+    def from_additional_file(cls, path: str, detector_ids: Optional[Sequence[str]] = None,
+                             geometry: Optional[Dict] = None, net_file: Optional[str] = None) -> 'DetectorRegistry':
+        """
+        Chiều dài và làn đọc từ các phần tử laneAreaDetector của file additional SUMO (không cần mô phỏng).
+        Số làn của đoạn đường lấy từ các phần tử <edge> của net_file; nếu không có, mọi đoạn đường tính là NUM_LANES.
+        """
+        lengths, edges = {}, {}
+        for element in ET.parse(path).getroot().iter('laneAreaDetector'):
+            lengths[element.get('id')] = float(element.get('length', ROAD_LENGTH_M))
+            lane_id = element.get('lane')
+            if lane_id:
+                edges[element.get('id')] = lane_id.rsplit('_', 1)[0]
+        edge_lanes = {}
+        if net_file:
+            edge_lanes = {edge.get('id'): len(edge.findall('lane'))
+                          for edge in ET.parse(net_file).getroot().iter('edge')}
+        return cls(detector_ids if detector_ids is not None else list(lengths), lengths, geometry, edges, edge_lanes)
+
+    def weights(self, detector_ids: Iterable[str]) -> np.ndarray:
+        """Vector trọng số (N,) của một nhóm detector (lưu đệm): tích lũy = weights @ độ chiếm dụng."""
+        key = tuple(detector_ids)
+        weights = self._weights.get(key)
+        if weights is None:
+            indices = [self.index[det_id] for det_id in key if det_id in self.index]
+            # Các detector khác nhau của nhóm trên cùng một đoạn đường chia nhau số làn của đoạn đường đó
+            sharing = Counter(self.edges[i] for i in set(indices) if self.edges[i] is not None)
+            weights = np.zeros(len(self.detector_ids))
+            for i in indices:
+                lanes = self.num_lanes[i] / sharing[self.edges[i]] if self.edges[i] is not None else self.num_lanes[i]
+                weights[i] += self.scale[i] * lanes
+            self._weights[key] = weights
+        return weights
+
+    def weight_matrix(self, groups: Sequence[Iterable[str]]) -> np.ndarray:
+        """Trọng số (G, N) của nhiều nhóm detector: tích lũy = ma trận @ độ chiếm dụng."""
+        return np.vstack([self.weights(group) for group in groups]) if groups else np.zeros((0, len(self.detector_ids)))
+
+
+class DetectorSampler:
+    """
+    Đăng ký độ chiếm dụng e2 (lanearea) và số xe e1 (inductionloop), trả giá trị của bước mô phỏng
+    gần nhất từ bộ đệm cục bộ.
+    """
+
+    def __init__(self, lanearea_ids: Iterable[str] = (), inductionloop_ids: Iterable[str] = (),
+                 geometry: Optional[Dict] = None):
+        """
+        Args:
+            lanearea_ids: Các detector e2 cần đăng ký.
+            inductionloop_ids: Các detector e1 cần đăng ký.
+            geometry: Giá trị ghi đè hình học cho DetectorRegistry (mục 'detector_geometry' của detector_config.json).
+        """
+        # dict.fromkeys bỏ phần tử trùng nhưng giữ thứ tự
+        self.lanearea_ids: List[str] = list(dict.fromkeys(lanearea_ids))
+        self.inductionloop_ids: List[str] = list(dict.fromkeys(inductionloop_ids))
+        self.geometry = geometry
+        self.registry: Optional[DetectorRegistry] = None
+        self._occupancy = np.zeros(len(self.lanearea_ids))
+        self._inductionloop: Dict[str, Dict[int, float]] = {}
+
+    def subscribe(self):
+        """
+        Đăng ký một lần mọi detector và nạp hình học e2
+        (gọi sau traci.start, trước bước mô phỏng đầu tiên).
+        """
+        for det_id in self.lanearea_ids:
+            try:
+                traci.lanearea.subscribe(det_id, [tc.VAR_LAST_INTERVAL_OCCUPANCY])
+            except traci.TraCIException as e:
+                logging.warning(f"Không đăng ký được detector e2 {det_id}: {e}")
+        for det_id in self.inductionloop_ids:
+            try:
+                traci.inductionloop.subscribe(det_id, [tc.VAR_LAST_INTERVAL_NUMBER])
+            except traci.TraCIException as e:
+                logging.warning(f"Không đăng ký được detector e1 {det_id}: {e}")
+        self.registry = DetectorRegistry.from_traci(self.lanearea_ids, self.geometry)
+        logging.info(f"Đã đăng ký {len(self.lanearea_ids)} detector e2 và {len(self.inductionloop_ids)} detector e1")
+
+    def refresh(self):
+        """Lấy kết quả đăng ký trả về cùng bước mô phỏng cuối (không gọi socket)."""
+        results = traci.lanearea.getAllSubscriptionResults()
+        self._occupancy = np.fromiter(
+            (results.get(det_id, {}).get(tc.VAR_LAST_INTERVAL_OCCUPANCY, 0.0) for det_id in self.lanearea_ids),
+            dtype=float, count=len(self.lanearea_ids))
+        self._inductionloop = traci.inductionloop.getAllSubscriptionResults()
+
+    @property
+    def occupancies(self) -> np.ndarray:
+        """Độ chiếm dụng (N,) [%] của khoảng đo cuối của các detector e2, theo thứ tự lanearea_ids."""
+        return self._occupancy
+
+    def occupancy(self, det_id: str) -> float:
+        """Độ chiếm dụng [%] của khoảng đo cuối của một detector e2 (0 nếu detector không có kết quả)."""
+        index = self.registry.index.get(det_id) if self.registry is not None else None
+        return float(self._occupancy[index]) if index is not None else 0.0
+
+    def vehicle_number(self, det_id: str) -> int:
+        """Số xe của khoảng đo cuối của một detector e1 (0 nếu detector không có kết quả)."""
+        return self._inductionloop.get(det_id, {}).get(tc.VAR_LAST_INTERVAL_NUMBER, 0)
+
+    def accumulation(self, detector_ids: Iterable[str]) -> float:
+        """Tích lũy xe ước lượng từ độ chiếm dụng không gian của các detector e2."""
+        return float(self.registry.weights(detector_ids) @ self._occupancy)
+
+    def accumulations(self, weight_matrix: np.ndarray) -> np.ndarray:
+        """Tích lũy (G,) của các nhóm trong DetectorRegistry.weight_matrix."""
+        return weight_matrix @ self._occupancy
+
+    def total_vehicle_number(self, detector_ids: Iterable[str]) -> int:
+        return sum(self.vehicle_number(det_id) for det_id in detector_ids)
@@ -4,36 +4,46 @@
 Chương trình chính để khởi chạy và điều khiển mô phỏng giao thông bằng SUMO.
 
 Kịch bản hoạt động:
-1. Khởi tạo mô phỏng SUMO và các trình quản lý cấu hình.
-2. Chạy một luồng (thread) riêng để cập nhật trạng thái đèn giao thông.
-3. Vòng lặp mô phỏng chính thực hiện 3 bước theo chu kỳ:
+1. Khởi tạo mô phỏng SUMO và các trình quản lý cấu hình, đăng ký detector và chương trình đèn biên dịch sẵn.
+2. Vòng lặp mô phỏng chính thực hiện 4 bước theo chu kỳ:
     - BƯỚC 1: Thu thập dữ liệu thô (số xe, độ dài hàng đợi) từ các detector trong SUMO.
     - BƯỚC 2: Tổng hợp dữ liệu thô thành các giá trị trung bình.
     - BƯỚC 3: Chạy thuật toán điều khiển vành đai (Perimeter Control) và bộ giải (Solver)
               để tính toán thời gian xanh mới cho các đèn tín hiệu.
-4. Luồng điều khiển đèn sẽ nhận thời gian xanh mới và cập nhật vào mô phỏng.
-5. Mô phỏng kết thúc khi hết thời gian hoặc không còn xe.
+    - BƯỚC 4: Bộ lập lịch lệnh đèn (SignalScheduler) nhận phương án mới từ kho phương án và cập nhật
+              từng đèn tại ranh giới chu kỳ của đèn đó, trong cùng luồng với vòng lặp.
+3. Mô phỏng kết thúc khi hết thời gian hoặc không còn xe.
+
+Chế độ điều khiển (khóa 'control_mode' trong simulation.yml):
+- 'sync' (mặc định): vòng lặp chờ bộ giải ở mỗi bước điều khiển.
+- 'async': bộ giải chạy trong tiến trình riêng, vòng lặp tiếp tục mô phỏng; phương án được công bố ngay
+  khi sẵn sàng và áp dụng tại ranh giới chu kỳ kế tiếp của từng đèn.
 """
 
 import traci
 import yaml
-import threading
-import time
 import os
 import sys
 import logging
-from multiprocessing import Manager
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
 
 # Import các thành phần cần thiết từ các module khác trong dự án
 from sumosim import SumoSim
+from detector_sampler import DetectorSampler
+from signal_programs import SignalProgramCache
 from data.intersection_config_manager import IntersectionConfigManager
 from data.detector_config_manager import DetectorConfigManager
+from algorithm.async_solver import AsyncSolverPool
+from algorithm.checkpoint import MAX_CHECKPOINT_AGE_S
+from algorithm.plan_store import PlanStore
+from algorithm.replay import ControlTraceRecorder
 from algorithm.algo import (
     PerimeterController, 
     KP_H, 
     KI_H, 
     N_HAT, 
+    ACTIVATION_FACTOR,
+    DEACTIVATION_FACTOR,
     CONTROL_INTERVAL_S
 )
 
@@ -72,122 +82,112 @@ def load_yaml_config(config_path: str) -> Dict[str, Any]:
             raise ValueError(f"File cấu hình rỗng hoặc không hợp lệ: {config_path}")
 
 # =============================================================================
-# LUỒNG ĐIỀU KHIỂN ĐÈN GIAO THÔNG
+# LẬP LỊCH LỆNH ĐÈN GIAO THÔNG
 # =============================================================================
 
-def update_traffic_light_logic(tl_id: str, new_times: Dict[str, Any], phase_info: Dict[str, Any]):
+def get_next_cycle_boundary(tl_id: str, durations: Sequence[float]) -> float:
     """
-    Cập nhật logic (thời gian xanh) cho một đèn giao thông cụ thể.
-
-    Args:
-        tl_id: ID của đèn giao thông trong SUMO.
-        new_times: Dictionary chứa thời gian xanh mới cho pha chính ('p') và các pha phụ ('s').
-        phase_info: Thông tin về các chỉ số pha chính và phụ.
+    Thời điểm [s] đèn quay lại pha đầu tiên: lần chuyển pha kế tiếp cộng thời lượng các pha còn lại của chu kỳ
+    (durations: thời lượng các pha của chương trình đang chạy, lấy từ SignalProgramCache).
     """
-    try:
-        # Lấy định nghĩa đầy đủ của đèn (bao gồm các pha)
-        logic = traci.trafficlight.getCompleteRedYellowGreenDefinition(tl_id)[0]
-
-        # Cập nhật thời gian xanh cho các pha chính
-        main_phases = phase_info.get('p', {}).get('phase_indices', [])
-        for phase_index in main_phases:
-            if 0 <= phase_index < len(logic.phases):
-                logic.phases[phase_index].duration = new_times['p']
-
-        # Cập nhật thời gian xanh cho các pha phụ
-        secondary_phases = [s_phase['phase_indices'][0] for s_phase in phase_info.get('s', []) if s_phase.get('phase_indices')]
-        for i, phase_index in enumerate(secondary_phases):
-            if 0 <= phase_index < len(logic.phases) and i < len(new_times['s']):
-                logic.phases[phase_index].duration = new_times['s'][i]
-        
-        # Áp dụng logic mới vào mô phỏng
-        traci.trafficlight.setCompleteRedYellowGreenDefinition(tl_id, logic)
-
-    except traci.TraCIException as e:
-        logging.error(f"Lỗi Traci khi cập nhật TLS {tl_id}: {e}")
+    phase_index = traci.trafficlight.getPhase(tl_id)
+    next_switch = traci.trafficlight.getNextSwitch(tl_id)
+    return next_switch + sum(durations[phase_index + 1:])
 
-def traffic_light_controller(shared_dict: Dict, config_manager: IntersectionConfigManager, stop_event: threading.Event):
+class SignalScheduler:
     """
-    Luồng chạy nền để liên tục kiểm tra và cập nhật đèn giao thông.
-    Hàm này hoạt động như một "người tiêu dùng" (consumer), lấy dữ liệu thời gian xanh
-    từ `shared_dict` (do thuật toán chính tạo ra) và áp dụng vào mô phỏng.
-
-    Args:
-        shared_dict: Dictionary được chia sẻ giữa các luồng để truyền dữ liệu.
-        config_manager: Đối tượng quản lý cấu hình giao lộ.
-        stop_event: Sự kiện để báo hiệu dừng luồng.
+    Bộ lập lịch lệnh đèn chạy trong vòng lặp chính (cùng luồng với TraCI).
+    Khi `plan_store` có phiên bản mới, chỉ các giao lộ có thời gian xanh khác với phương án đã áp dụng
+    được đưa vào hàng chờ, và mỗi giao lộ được cập nhật tại ranh giới chu kỳ kế tiếp của đèn đó.
+    Khi thuật toán bị hủy kích hoạt, các giao lộ đang chạy phương án điều khiển được chuyển về chương trình
+    chu kỳ cố định (cũng tại ranh giới chu kỳ).
     """
-    logging.info("Bắt đầu luồng điều khiển đèn.")
-    intersection_ids = config_manager.get_intersection_ids()
-
-    while not stop_event.is_set():
-        try:
-            # Chỉ hoạt động khi thuật toán đã kích hoạt và có dữ liệu mới
-            if shared_dict.get('is_active', False) and 'green_times' in shared_dict:
-                green_times = shared_dict.get('green_times')
-                if green_times:
-                    # Cập nhật từng giao lộ
-                    for int_id in intersection_ids:
-                        if int_id in green_times:
-                            tl_id = config_manager.get_traffic_light_id(int_id)
-                            phase_info = config_manager.get_phase_info(int_id)
-                            if tl_id and phase_info:
-                                update_traffic_light_logic(tl_id, green_times[int_id], phase_info)
-                            else:
-                                logging.warning(f"Bỏ qua giao lộ {int_id} do thiếu tl_id hoặc phase_info.")
-            
-            # Tạm dừng một chút để tránh tiêu tốn CPU
-            time.sleep(1)
 
-        except Exception as e:
-            logging.error(f"Lỗi nghiêm trọng trong luồng điều khiển đèn: {e}", exc_info=True)
-            break
-    
-    logging.info("Dừng luồng điều khiển đèn.")
+    def __init__(self, plan_store: PlanStore, config_manager: IntersectionConfigManager,
+                 program_cache: SignalProgramCache):
+        """
+        Args:
+            plan_store: Kho phương án do bộ điều khiển công bố.
+            config_manager: Đối tượng quản lý cấu hình giao lộ.
+            program_cache: Chương trình đèn đã biên dịch (đã đăng ký với SUMO).
+        """
+        self.plan_store = plan_store
+        self.config_manager = config_manager
+        self.program_cache = program_cache
+        self.intersection_ids = config_manager.get_intersection_ids()
+        self.seen_version = -1
+        self.applied: Dict[str, Dict] = {}                 # Thời gian xanh đã áp dụng vào SUMO
+        self.pending: Dict[str, Optional[Dict]] = {}       # Thời gian xanh chờ ranh giới chu kỳ (None: chu kỳ cố định)
+        self.boundaries: Dict[str, float] = {}             # Ranh giới chu kỳ kế tiếp của giao lộ đang chờ
+        self.stats = {'plans': 0, 'applied': 0, 'restored': 0, 'unchanged': 0}
+
+    def next_event_time(self) -> float:
+        """Ranh giới chu kỳ sớm nhất trong hàng chờ (inf nếu không có), dùng cho vòng lặp hướng sự kiện."""
+        return min(self.boundaries.values(), default=float('inf'))
+
+    def poll(self, current_time: float):
+        """Nhận phương án mới (nếu phiên bản thay đổi) và áp dụng các thay đổi đã tới ranh giới chu kỳ."""
+        plan = self.plan_store.current
+        if plan.version != self.seen_version:
+            self.seen_version = plan.version
+            self._schedule(plan)
+
+        for int_id in [int_id for int_id, boundary in self.boundaries.items() if current_time >= boundary]:
+            new_times = self.pending.pop(int_id)
+            del self.boundaries[int_id]
+            if new_times is None:
+                if self.program_cache.switch_to_fixed(int_id):
+                    self.applied.pop(int_id, None)
+                    self.stats['restored'] += 1
+            elif self.program_cache.apply(int_id, new_times):
+                self.applied[int_id] = new_times
+                self.stats['applied'] += 1
+
+    def _schedule(self, plan):
+        if plan.is_active:
+            self.stats['plans'] += 1
+            targets = {int_id: plan.green_times[int_id] for int_id in self.intersection_ids if plan.green_times.get(int_id)}
+        else:
+            # Hủy kích hoạt: khôi phục chu kỳ cố định cho các giao lộ đang chạy phương án điều khiển
+            targets = {int_id: None for int_id in self.applied}
+
+        # Lệnh đang chờ không còn trong phương án mới bị hủy
+        for int_id in [int_id for int_id in self.pending if int_id not in targets]:
+            del self.pending[int_id]
+            del self.boundaries[int_id]
+
+        for int_id, new_times in targets.items():
+            if self.applied.get(int_id) == new_times:
+                self.pending.pop(int_id, None)
+                self.boundaries.pop(int_id, None)
+                self.stats['unchanged'] += 1
+                continue
+            tl_id = self.config_manager.get_traffic_light_id(int_id)
+            durations = self.program_cache.cycle_durations(tl_id) if tl_id else None
+            if durations is None or not self.config_manager.get_phase_info(int_id):
+                logging.warning(f"Bỏ qua giao lộ {int_id} do thiếu tl_id hoặc phase_info.")
+                continue
+            if int_id not in self.boundaries:
+                try:
+                    self.boundaries[int_id] = get_next_cycle_boundary(tl_id, durations)
+                except traci.TraCIException as e:
+                    logging.error(f"Lỗi Traci khi đọc chu kỳ của TLS {tl_id}: {e}")
+                    continue
+            self.pending[int_id] = new_times
 
 # =============================================================================
 # CÁC HÀM HỖ TRỢ VÒNG LẶP MÔ PHỎNG
 # =============================================================================
 
-# def get_sum_from_traci_detectors(detector_ids: List[str], flow_ids: List[str]) -> int:
-#     """
-#     Lấy số lượng phương tiện từ một danh sách các area detector của Traci.
-#     An toàn trước các lỗi Traci (trả về 0 nếu có lỗi).
-#     """
-#     try:
-#         flow = sum(traci.inductionloop.getLastIntervalVehicleNumber(det_id) for det_id in flow_ids)
-#         sum_of_avg_speed = sum(traci.lanearea.getLastIntervalMeanSpeed(det_id) * traci.lanearea.getLastIntervalVehicleNumber(det_id) for det_id in detector_ids)
-#         if (sum(traci.lanearea.getLastIntervalVehicleNumber(det_id) for det_id in detector_ids)):
-#             avg_speed = sum_of_avg_speed / sum(traci.lanearea.getLastIntervalVehicleNumber(det_id) for det_id in detector_ids)
-#             return (flow / avg_speed) * 80
-#         else: 
-#             avg_speed = 0
-#             return 0
-        
-#     except traci.TraCIException:
-#         return 0
-
-def get_sum_from_traci_detectors(detector_ids: List[str]) -> int:
-    """
-    Lấy số lượng phương tiện (tích lũy) dựa trên độ chiếm dụng theo không gian.
-    An toàn trước các lỗi Traci và lỗi chia cho 0.
-    """
-    try:
-        total_accumulation = 0
-        for det_id in detector_ids:
-            space_occupancy = traci.lanearea.getLastIntervalOccupancy(det_id)
-            road_length = 80.00
-            average_length_of_vehicles = 3
-            num_lane = 1
-            # Tính toán tích lũy tại một detector:
-            accumulation = road_length * (num_lane / (100 * average_length_of_vehicles)) * space_occupancy
-            total_accumulation += accumulation
-        return total_accumulation # Trả về 0 nếu không có xe, tốc độ trung bình hoặc interval bằng 0
-
-    except traci.TraCIException as e:
-        logging.warning(f"Lỗi TraCI trong get_sum_from_traci_detectors: {e}")
-        return 0
-
+def get_queue_detector_ids(solver_detectors: Dict) -> List[str]:
+    """Danh sách detector hàng đợi (pha chính và pha phụ) của mọi giao lộ, dùng để đăng ký với DetectorSampler."""
+    detector_ids = []
+    for details in solver_detectors.values():
+        phases = details.get('phases', {})
+        detector_ids.extend(phases.get('p', {}).get('queue_detectors', []))
+        for s_phase in phases.get('s', []):
+            detector_ids.extend(s_phase.get('queue_detectors', []))
+    return detector_ids
 
 def initialize_queue_samples(solver_detectors: Dict) -> Dict:
     """Khởi tạo cấu trúc dữ liệu để lưu trữ các mẫu hàng đợi."""
@@ -233,6 +233,9 @@ def run_sumo_simulation():
         sampling_interval_s = sim_config.get('sampling_interval_s', 10)
         aggregation_interval_s = sim_config.get('aggregation_interval_s', 50)
         total_simulation_time = sim_config.get('total_simulation_time', 3600)
+        control_mode = sim_config.get('control_mode', 'sync')
+        if control_mode not in ('sync', 'async'):
+            raise ValueError(f"control_mode không hợp lệ: '{control_mode}' (chọn 'sync' hoặc 'async')")
 
         # Lấy ID của các detector cần thiết
         algorithm_detector_ids = detector_config_mgr.get_algorithm_input_detectors()
@@ -242,118 +245,194 @@ def run_sumo_simulation():
         logging.info(f"Tìm thấy {len(solver_detectors)} giao lộ cho bộ giải cục bộ.")
         logging.info(f"Tìm thấy {len(flow_algorithm_detector)} detectors cho flow đầu vào thuật toán.")
 
-        # --- 2. THIẾT LẬP MÔI TRƯỜNG ĐA LUỒNG VÀ SUMO ---
-        with Manager() as manager:
-            shared_dict = manager.dict() # Dict để giao tiếp giữa luồng chính và luồng đèn
-            stop_event = threading.Event() # Event để dừng luồng đèn
-
-            # Khởi động SUMO
-            sumo_sim = SumoSim(sim_config)
-            output_dir = os.path.join(project_root, "output")
-            os.makedirs(output_dir, exist_ok=True)
-            output_files = {"tripinfo": os.path.join(output_dir, "tripinfo.xml")}
-            sumo_sim.start(output_files=output_files)
-
-            # Khởi tạo bộ điều khiển chính
-            controller = PerimeterController(
-                kp=KP_H, ki=KI_H, n_hat=N_HAT, 
-                config_file=intersection_config_path,
-                shared_dict=shared_dict
-            )
-
-            # Bắt đầu luồng điều khiển đèn
-            controller_thread = threading.Thread(
-                target=traffic_light_controller, 
-                args=(shared_dict, intersection_config_mgr, stop_event),
-                name="LightController"
-            )
-            controller_thread.start()
-
-            # --- 3. CHUẨN BỊ CHO VÒNG LẶP CHÍNH ---
-            n_previous = 0
-            qg_previous = 0
-            
-            # Biến lưu trữ dữ liệu thu thập được
-            n_samples = []
-            queue_samples = initialize_queue_samples(solver_detectors)
-            
-            # Biến lưu trữ dữ liệu đã được tổng hợp
-            latest_aggregated_n = 0
-            latest_aggregated_queue_lengths = {}
-
-            # Lấy giá trị ban đầu
-            sumo_sim.step()
-            n_previous = get_sum_from_traci_detectors(algorithm_detector_ids)
-            latest_aggregated_n = n_previous
-
-            # Thiết lập các mốc thời gian cho các hành động
-            next_sampling_time = 0
-            next_aggregation_time = aggregation_interval_s
-            next_control_time = CONTROL_INTERVAL_S
-            next_log_time = 10
-
-            logging.info("Khởi tạo hoàn tất. Bắt đầu vòng lặp mô phỏng chính.")
-
-            # --- 4. VÒNG LẶP MÔ PHỎNG CHÍNH ---
-            while traci.simulation.getMinExpectedNumber() > 0:
-                sumo_sim.step()
-                current_time = traci.simulation.getTime()
-
-                # --- BƯỚC 1: THU THẬP DỮ LIỆU MẪU ---
-                if current_time >= next_sampling_time:
-                    n_samples.append(get_sum_from_traci_detectors(algorithm_detector_ids))
-
-                    for int_id, details in solver_detectors.items():
-                        phases = details.get('phases', {})
-                        # Hàng đợi pha chính
-                        p_detectors = phases.get('p', {}).get('queue_detectors', [])
-                        p2_detectors = phases.get('p', {}).get('queue2_detector', [])
-                        queue_samples[int_id]['p'].append(get_sum_from_traci_detectors(p_detectors))
-                        # Hàng đợi các pha phụ
-                        for i, s_phase in enumerate(phases.get('s', [])):
-                            s_detectors = s_phase.get('queue_detectors', [])
-                            s2_detectors = s_phase.get('queue2_detector', [])
-                            if i < len(queue_samples[int_id]['s']):
-                                queue_samples[int_id]['s'][i].append(get_sum_from_traci_detectors(s_detectors))
-                    
-                    next_sampling_time += sampling_interval_s
-
-                # --- BƯỚC 2: TỔNG HỢP DỮ LIỆU ---
-                if current_time >= next_aggregation_time:
-                    logging.info(f"--- Tổng hợp dữ liệu tại t={current_time:.1f}s ---")
-                    
-                    if n_samples:
-                        latest_aggregated_n = sum(n_samples) / len(n_samples)
-
-                    for int_id, data in queue_samples.items():
-                        avg_p = sum(data['p']) / len(data['p']) if data['p'] else 0
-                        avg_s = [sum(s) / len(s) if s else 0 for s in data['s']]
-                        latest_aggregated_queue_lengths[int_id] = {'p': avg_p, 's': avg_s}
-
-                    logging.info(f"n(k) mới={latest_aggregated_n:.2f}. Xóa {len(n_samples)} mẫu.")
-                    # logging.info(get_sum_from_traci_detectors(algorithm_detector_ids, flow_algorithm_detector))
-                    clear_samples(n_samples, queue_samples)
-                    next_aggregation_time += aggregation_interval_s
-
-                # --- BƯỚC 3: CHẠY THUẬT TOÁN ĐIỀU KHIỂN ---
-                if current_time >= next_control_time:
-                    logging.info(f"--- Chạy điều khiển tại t={current_time:.1f}s ---")
-                    
-                    result = controller.run_simulation_step(
-                        latest_aggregated_n, n_previous, qg_previous, latest_aggregated_queue_lengths
-                    )
-                    qg_previous = result.qg_new
-                    n_previous = latest_aggregated_n
-                    next_control_time += CONTROL_INTERVAL_S
+        # --- 2. THIẾT LẬP SUMO VÀ BỘ ĐIỀU KHIỂN ---
+        plan_store = PlanStore() # Phương án đèn do bộ điều khiển công bố
+
+        # Khởi động SUMO
+        sumo_sim = SumoSim(sim_config)
+        output_dir = os.path.join(project_root, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        output_files = {"tripinfo": os.path.join(output_dir, "tripinfo.xml")}
+        sumo_sim.start(output_files=output_files)
+
+        # Đăng ký một lần mọi detector cần đọc; giá trị được trả về cùng mỗi simulationStep
+        # và thuật toán lẫn bộ giải đều đọc từ cùng bộ đệm này
+        detector_sampler = DetectorSampler(
+            lanearea_ids=algorithm_detector_ids + get_queue_detector_ids(solver_detectors),
+            geometry=detector_config_mgr.get_detector_geometry()
+        )
+        detector_sampler.subscribe()
+
+        # Ghi đầu vào của bộ giải ở mỗi bước điều khiển (tùy chọn, phục vụ phát lại/benchmark)
+        snapshot_file = sim_config.get('solver_snapshot_file')
+        if snapshot_file:
+            snapshot_file = os.path.join(output_dir, snapshot_file)
+            logging.info(f"Ghi ảnh chụp bài toán của bộ giải vào {snapshot_file}")
+
+        # Chế độ bất đồng bộ: bộ giải chạy trong tiến trình riêng
+        solver_pool = None
+        if control_mode == 'async':
+            solver_pool = AsyncSolverPool(intersection_config_path,
+                                          max_workers=sim_config.get('solver_workers', 1))
+            logging.info("Chế độ điều khiển bất đồng bộ: bộ giải chạy trong tiến trình riêng.")
+
+        # Khởi tạo bộ điều khiển chính (tham số PI/ngưỡng có thể ghi đè trong mục 'controller' của simulation.yml,
+        # ví dụ bằng kết quả của tools/sweep_pi_gains.py)
+        controller_params = sim_config.get('controller') or {}
+        controller_kwargs = dict(
+            kp=controller_params.get('kp', KP_H),
+            ki=controller_params.get('ki', KI_H),
+            n_hat=controller_params.get('n_hat', N_HAT),
+            activation_factor=controller_params.get('activation_factor', ACTIVATION_FACTOR),
+            deactivation_factor=controller_params.get('deactivation_factor', DEACTIVATION_FACTOR),
+            control_law=controller_params.get('control_law', 'pi'),
+            mpc_params=controller_params.get('mpc'),
+            config_file=intersection_config_path,
+            plan_store=plan_store,
+            solver_pool=solver_pool,
+            snapshot_file=snapshot_file
+        )
+
+        # Điểm khôi phục ghi sau mỗi bước điều khiển; nếu đã tồn tại và mô phỏng tiếp tục đúng tại thời điểm
+        # đã ghi (khởi động lại giữa chừng), bộ điều khiển tiếp tục từ trạng thái đã ghi thay vì từ chu kỳ cố định.
+        # File còn lại từ lần chạy trước (thời điểm không khớp hoặc quá cũ) bị bỏ qua và ghi đè ở bước đầu tiên
+        checkpoint_file = sim_config.get('controller_checkpoint_file')
+        if checkpoint_file:
+            checkpoint_file = os.path.join(output_dir, checkpoint_file)
+        controller = None
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            try:
+                controller = PerimeterController.from_checkpoint(
+                    checkpoint_file, resume_time=traci.simulation.getTime(),
+                    max_age_s=sim_config.get('controller_checkpoint_max_age_s', MAX_CHECKPOINT_AGE_S),
+                    **controller_kwargs)
+            except ValueError as e:
+                logging.warning(f"Bỏ qua điểm khôi phục {checkpoint_file}: {e}")
+        if controller is None:
+            controller = PerimeterController(checkpoint_file=checkpoint_file, **controller_kwargs)
+
+        # Ghi n(k) và hàng đợi tại mỗi bước điều khiển (tùy chọn, phát lại bằng algorithm/replay.py)
+        control_trace_file = sim_config.get('control_trace_file')
+        trace_recorder = ControlTraceRecorder(controller.spec) if control_trace_file else None
+
+        # Chương trình đèn biên dịch sẵn (chu kỳ cố định và phương án điều khiển) được đăng ký một lần;
+        # lệnh đèn được áp dụng trong vòng lặp chính, tại ranh giới chu kỳ của từng đèn
+        program_cache = SignalProgramCache(intersection_config_mgr)
+        program_cache.register_programs()
+        signal_scheduler = SignalScheduler(plan_store, intersection_config_mgr, program_cache)
+
+        # --- 3. CHUẨN BỊ CHO VÒNG LẶP CHÍNH ---
+        n_previous = 0
+        qg_previous = 0
+        
+        # Biến lưu trữ dữ liệu thu thập được
+        n_samples = []
+        queue_samples = initialize_queue_samples(solver_detectors)
+        
+        # Nhóm detector của mỗi mẫu (hàng 0: vùng điều khiển, các hàng sau: hàng đợi từng pha), quy đổi một lần
+        # thành ma trận trọng số để mỗi lần lấy mẫu chỉ là một phép nhân ma trận-vector
+        sample_groups = [algorithm_detector_ids]
+        queue_sample_lists = []
+        for int_id, details in solver_detectors.items():
+            phases = details.get('phases', {})
+            sample_groups.append(phases.get('p', {}).get('queue_detectors', []))
+            queue_sample_lists.append(queue_samples[int_id]['p'])
+            for i, s_phase in enumerate(phases.get('s', [])):
+                if i < len(queue_samples[int_id]['s']):
+                    sample_groups.append(s_phase.get('queue_detectors', []))
+                    queue_sample_lists.append(queue_samples[int_id]['s'][i])
+        sample_weights = detector_sampler.registry.weight_matrix(sample_groups)
+
+        # Biến lưu trữ dữ liệu đã được tổng hợp
+        latest_aggregated_n = 0
+        latest_aggregated_queue_lengths = {}
+
+        # Lấy giá trị ban đầu
+        sumo_sim.step()
+        detector_sampler.refresh()
+        n_previous = detector_sampler.accumulation(algorithm_detector_ids)
+        latest_aggregated_n = n_previous
+        if controller.control_step > 0:
+            # Tiếp tục từ n(k), qg(k) của bước cuối trong điểm khôi phục
+            n_previous, qg_previous = controller.last_n, controller.last_qg
+
+        # Thiết lập các mốc thời gian cho các hành động
+        next_sampling_time = 0
+        next_aggregation_time = aggregation_interval_s
+        next_control_time = CONTROL_INTERVAL_S
+        next_log_time = 10
+
+        logging.info("Khởi tạo hoàn tất. Bắt đầu vòng lặp mô phỏng chính.")
+
+        # --- 4. VÒNG LẶP MÔ PHỎNG CHÍNH ---
+        # Hướng sự kiện: nhảy thẳng tới mốc hành động gần nhất (lấy mẫu, tổng hợp, điều khiển, ghi log, kết thúc,
+        # ranh giới chu kỳ của đèn có lệnh chờ) bằng một lần traci.simulationStep(t), thay vì gọi sumo_sim.step()
+        # cho từng bước step_length. Mỗi hành động vẫn chạy ở bước đầu tiên có t >= mốc của nó.
+        event_count = 0
+        while traci.simulation.getMinExpectedNumber() > 0:
+            next_event_time = min(next_sampling_time, next_aggregation_time, next_control_time, next_log_time,
+                                  total_simulation_time, signal_scheduler.next_event_time())
+            current_time = sumo_sim.step_to(next_event_time)
+            event_count += 1
+
+            # --- BƯỚC 1: THU THẬP DỮ LIỆU MẪU ---
+            if current_time >= next_sampling_time:
+                detector_sampler.refresh()
+                accumulations = detector_sampler.accumulations(sample_weights).tolist()
+                n_samples.append(accumulations[0])
+                # Hàng đợi pha chính và các pha phụ của từng giao lộ
+                for samples, value in zip(queue_sample_lists, accumulations[1:]):
+                    samples.append(value)
+                
+                next_sampling_time += sampling_interval_s
+
+            # --- BƯỚC 2: TỔNG HỢP DỮ LIỆU ---
+            if current_time >= next_aggregation_time:
+                logging.info(f"--- Tổng hợp dữ liệu tại t={current_time:.1f}s ---")
+                
+                if n_samples:
+                    latest_aggregated_n = sum(n_samples) / len(n_samples)
+
+                for int_id, data in queue_samples.items():
+                    avg_p = sum(data['p']) / len(data['p']) if data['p'] else 0
+                    avg_s = [sum(s) / len(s) if s else 0 for s in data['s']]
+                    latest_aggregated_queue_lengths[int_id] = {'p': avg_p, 's': avg_s}
+
+                logging.info(f"n(k) mới={latest_aggregated_n:.2f}. Xóa {len(n_samples)} mẫu.")
+                clear_samples(n_samples, queue_samples)
+                next_aggregation_time += aggregation_interval_s
+
+            # --- CÔNG BỐ PHƯƠNG ÁN ĐÃ GIẢI XONG (chế độ bất đồng bộ) ---
+            # Kiểm tra ở mọi mốc (tối đa sampling_interval_s sau khi tiến trình giải xong), trước bước điều khiển
+            # để kết quả cũ không bị thay thế ngay tại cùng mốc; ranh giới chu kỳ của từng đèn do signal_scheduler xử lý
+            if solver_pool is not None:
+                controller.apply_ready_plan(current_time)
+
+            # --- BƯỚC 3: CHẠY THUẬT TOÁN ĐIỀU KHIỂN ---
+            if current_time >= next_control_time:
+                logging.info(f"--- Chạy điều khiển tại t={current_time:.1f}s ---")
+                if trace_recorder is not None:
+                    trace_recorder.record(current_time, latest_aggregated_n, latest_aggregated_queue_lengths)
                 
-                # Ghi log tiến độ và kiểm tra điều kiện dừng
-                if current_time >= next_log_time:
-                    logging.info(f"Thời gian: {current_time:.0f}s / {total_simulation_time}s")
-                    next_log_time += 10
+                result = controller.run_simulation_step(
+                    latest_aggregated_n, n_previous, qg_previous, latest_aggregated_queue_lengths,
+                    sim_time=current_time
+                )
+                qg_previous = result.qg_new
+                n_previous = latest_aggregated_n
+                next_control_time += CONTROL_INTERVAL_S
+
+            # --- BƯỚC 4: ÁP DỤNG LỆNH ĐÈN (phương án mới, tại ranh giới chu kỳ của từng đèn) ---
+            signal_scheduler.poll(current_time)
+            
+            # Ghi log tiến độ và kiểm tra điều kiện dừng
+            if current_time >= next_log_time:
+                logging.info(f"Thời gian: {current_time:.0f}s / {total_simulation_time}s")
+                next_log_time += 10
 
-                if current_time >= total_simulation_time:
-                    logging.info(f"Đạt thời gian mô phỏng tối đa. Dừng lại.")
-                    break
+            if current_time >= total_simulation_time:
+                logging.info(f"Đạt thời gian mô phỏng tối đa. Dừng lại.")
+                break
 
     except (traci.TraCIException, traci.FatalTraCIError) as e:
         logging.warning(f"Kết nối Traci bị đóng hoặc mô phỏng kết thúc sớm: {e}")
@@ -361,14 +440,24 @@ def run_sumo_simulation():
         logging.error(f"Lỗi không mong muốn trong quá trình chạy mô phỏng: {e}", exc_info=True)
     finally:
         # --- 5. DỌN DẸP VÀ KẾT THÚC ---
-        logging.info("Dừng luồng điều khiển và đóng mô phỏng.")
-        if 'stop_event' in locals() and stop_event:
-            stop_event.set()
-        if 'controller_thread' in locals() and controller_thread.is_alive():
-            controller_thread.join()
+        logging.info("Đóng mô phỏng.")
+        if 'signal_scheduler' in locals():
+            logging.info(f"Thống kê lệnh đèn: {signal_scheduler.stats}, chương trình đã biên dịch: {program_cache.stats()}")
+        if 'trace_recorder' in locals() and trace_recorder is not None:
+            trace_recorder.save(os.path.join(output_dir, control_trace_file))
+        if 'controller' in locals():
+            controller.close()
+            if len(controller.solver_profile):
+                logging.info(f"Profile bộ giải ({len(controller.solver_profile)} bước gần nhất): {controller.solver_profile.summary()}")
+        if 'solver_pool' in locals() and solver_pool is not None:
+            if 'controller' in locals():
+                logging.info(f"Thống kê chế độ bất đồng bộ: {controller.async_stats}")
+            solver_pool.shutdown()
         if 'sumo_sim' in locals() and sumo_sim.is_running():
             sumo_sim.close()
             logging.info(f"Mô phỏng kết thúc. Tổng số bước: {sumo_sim.get_step_counts()}")
+            if 'event_count' in locals():
+                logging.info(f"Số lần tiến mô phỏng của vòng lặp chính: {event_count}")
 
 if __name__ == "__main__":
     # Mặc định, chương trình sẽ chạy mô phỏng với SUMO.
@@ -0,0 +1,136 @@
+"""
+Chương trình đèn biên dịch sẵn cho từng đèn tín hiệu.
+
+Các pha gốc của mỗi đèn được điều khiển (trạng thái và thời lượng chu kỳ cố định) được đọc một lần khi khởi động
+từ mục 'traffic_lights' của intersection_config.json, hoặc lấy một lần từ SUMO nếu đèn không có trong đó.
+Một phương án {'p': G_p, 's': [G_s, ...]} được biên dịch thành traci.trafficlight.Logic qua một LRU nhỏ, nên
+áp dụng phương án chỉ cần một lệnh setProgramLogic, không cần đọc lại từ SUMO. Mỗi đèn có hai chương trình
+đã đăng ký: FIXED_PROGRAM_ID (chu kỳ cố định) và CONTROLLED_PROGRAM_ID (phương án mới nhất); chuyển giữa
+hai chương trình chỉ thêm một lệnh setProgram.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import traci
+
+from data.intersection_config_manager import IntersectionConfigManager
+
+FIXED_PROGRAM_ID = "fixed"
+CONTROLLED_PROGRAM_ID = "perimeter"
+
+
+class SignalProgramCache:
+    """
+    Pha gốc của từng đèn và LRU các Logic đã biên dịch, khóa theo (đèn, chương trình, thời lượng các pha).
+    """
+
+    def __init__(self, config_manager: IntersectionConfigManager, max_entries: int = 256):
+        """
+        Args:
+            config_manager: Cấu hình giao lộ (id đèn, chỉ số pha, pha gốc).
+            max_entries: Số Logic đã biên dịch tối đa được giữ.
+        """
+        self.config_manager = config_manager
+        self.max_entries = max_entries
+        self._base: Dict[str, List[Tuple[str, float]]] = {}     # tl_id -> [(trạng thái, thời lượng chu kỳ cố định)]
+        self._compiled: OrderedDict = OrderedDict()
+        self.active_program: Dict[str, str] = {}
+        self.active_durations: Dict[str, Tuple[float, ...]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        for int_id in config_manager.get_intersection_ids():
+            tl_id = config_manager.get_traffic_light_id(int_id)
+            if tl_id and tl_id not in self._base:
+                self._base[tl_id] = self._load_base_phases(tl_id)
+
+    def _load_base_phases(self, tl_id: str) -> List[Tuple[str, float]]:
+        phases = self.config_manager.get_traffic_light_phases(tl_id)
+        if phases:
+            return [(phase['state'], float(phase['duration'])) for phase in phases]
+        # Không có trong cấu hình: lấy một lần từ SUMO
+        logic = traci.trafficlight.getCompleteRedYellowGreenDefinition(tl_id)[0]
+        return [(phase.state, float(phase.duration)) for phase in logic.phases]
+
+    def fixed_durations(self, tl_id: str) -> Tuple[float, ...]:
+        return tuple(duration for _, duration in self._base[tl_id])
+
+    def plan_durations(self, int_id: str, green_times: Dict) -> Tuple[float, ...]:
+        """Thời lượng các pha của đèn thuộc giao lộ, với thời gian xanh pha chính và pha phụ của phương án."""
+        tl_id = self.config_manager.get_traffic_light_id(int_id)
+        phase_info = self.config_manager.get_phase_info(int_id) or {}
+        durations = list(self.fixed_durations(tl_id))
+
+        for phase_index in phase_info.get('p', {}).get('phase_indices', []):
+            if 0 <= phase_index < len(durations):
+                durations[phase_index] = float(green_times['p'])
+
+        secondary_phases = [s_phase['phase_indices'][0] for s_phase in phase_info.get('s', []) if s_phase.get('phase_indices')]
+        for i, phase_index in enumerate(secondary_phases):
+            if 0 <= phase_index < len(durations) and i < len(green_times['s']):
+                durations[phase_index] = float(green_times['s'][i])
+        return tuple(durations)
+
+    def compile(self, tl_id: str, durations: Tuple[float, ...], program_id: str = CONTROLLED_PROGRAM_ID):
+        """traci.trafficlight.Logic (tĩnh, bắt đầu từ pha 0) cho thời lượng các pha đã cho."""
+        key = (tl_id, program_id, durations)
+        logic = self._compiled.get(key)
+        if logic is not None:
+            self._compiled.move_to_end(key)
+            self.hits += 1
+            return logic
+
+        self.misses += 1
+        phases = [traci.trafficlight.Phase(duration, state) for (state, _), duration in zip(self._base[tl_id], durations)]
+        logic = traci.trafficlight.Logic(program_id, 0, 0, phases)
+        self._compiled[key] = logic
+        if len(self._compiled) > self.max_entries:
+            self._compiled.popitem(last=False)
+            self.evictions += 1
+        return logic
+
+    def register_programs(self):
+        """Đăng ký chương trình chu kỳ cố định của mọi đèn và đặt làm chương trình đang chạy."""
+        for tl_id in self._base:
+            self._activate(tl_id, FIXED_PROGRAM_ID, self.fixed_durations(tl_id))
+        logging.info(f"Đã đăng ký chương trình '{FIXED_PROGRAM_ID}'/'{CONTROLLED_PROGRAM_ID}' cho {len(self._base)} đèn tín hiệu")
+
+    def _activate(self, tl_id: str, program_id: str, durations: Tuple[float, ...]) -> bool:
+        """Gửi chương trình đã biên dịch (chạy lại từ pha 0) và chuyển sang chương trình đó nếu đèn đang chạy chương trình khác."""
+        try:
+            traci.trafficlight.setProgramLogic(tl_id, self.compile(tl_id, durations, program_id))
+            if self.active_program.get(tl_id) != program_id:
+                traci.trafficlight.setProgram(tl_id, program_id)
+        except traci.TraCIException as e:
+            logging.error(f"Lỗi Traci khi cập nhật TLS {tl_id} (chương trình '{program_id}'): {e}")
+            return False
+        self.active_program[tl_id] = program_id
+        self.active_durations[tl_id] = durations
+        return True
+
+    def apply(self, int_id: str, green_times: Dict) -> bool:
+        """Áp dụng phương án cho đèn của giao lộ qua chương trình điều khiển."""
+        tl_id = self.config_manager.get_traffic_light_id(int_id)
+        if tl_id not in self._base:
+            logging.warning(f"Không có chương trình đèn cho giao lộ {int_id} (đèn {tl_id})")
+            return False
+        return self._activate(tl_id, CONTROLLED_PROGRAM_ID, self.plan_durations(int_id, green_times))
+
+    def switch_to_fixed(self, int_id: str) -> bool:
+        """Chuyển đèn của giao lộ về chương trình chu kỳ cố định đã đăng ký."""
+        tl_id = self.config_manager.get_traffic_light_id(int_id)
+        if tl_id not in self._base:
+            return False
+        return self._activate(tl_id, FIXED_PROGRAM_ID, self.fixed_durations(tl_id))
+
+    def cycle_durations(self, tl_id: str) -> Optional[Tuple[float, ...]]:
+        """Thời lượng các pha của chương trình đang chạy (None nếu đèn không do bộ đệm này quản lý)."""
+        if tl_id in self.active_durations:
+            return self.active_durations[tl_id]
+        return self.fixed_durations(tl_id) if tl_id in self._base else None
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._compiled), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -16,10 +16,44 @@ import numpy as np
 import traci
 import sumolib
 
+# Simulation engines selectable with config['engine']:
+#   "traci":   SUMO runs as a subprocess, every call is a TCP round-trip on config['port']
+#   "libsumo": SUMO runs inside this process (no GUI, no socket)
+ENGINES = ('traci', 'libsumo')
+_TRACI_EXTRA_NAMES = ('TraCIException', 'FatalTraCIError')
+
+
+def use_libsumo() -> bool:
+    """
+    Rebind the public API of the traci module to libsumo, so code that calls traci.* (main.py,
+    tools/mfd_graph.py, SignalProgramCache, DetectorSampler) runs in-process unchanged.
+    Returns False, leaving traci untouched, if libsumo cannot be imported.
+    """
+    try:
+        import libsumo
+    except ImportError as e:
+        logging.warning(f"libsumo is not available ({e}), falling back to TraCI")
+        return False
+    for name in tuple(traci.__all__) + _TRACI_EXTRA_NAMES:
+        if name not in ('constants', 'exceptions') and hasattr(libsumo, name):
+            setattr(traci, name, getattr(libsumo, name))
+    return True
+
+
 class SumoSim:
     def __init__(self, config: dict):
         self.config = config
-        self.sumo_binary = sumolib.checkBinary('sumo-gui' if self.config['gui'] else 'sumo')
+        self.engine = self.config.get('engine', 'traci')
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown SUMO engine '{self.engine}' (choose one of {ENGINES})")
+        if self.engine == 'libsumo' and not use_libsumo():
+            self.engine = 'traci'
+        self.gui = bool(self.config['gui'])
+        if self.engine == 'libsumo' and self.gui:
+            logging.warning("libsumo does not support sumo-gui, running headless")
+            self.gui = False
+        self.sumo_binary = sumolib.checkBinary('sumo-gui' if self.gui else 'sumo')
+        self.step_length = float(self.config['step_length'])
         self.step_count = 0
 
     #start sumo
@@ -40,12 +74,15 @@ class SumoSim:
             if 'vehroute' in output_files:
                 sumo_cmd.extend(["--vehroute-output", output_files['vehroute']])
 
-        if self.config['gui']:
+        if self.gui:
             sumo_cmd.append("--start")
 
         try:
-            traci.start(sumo_cmd, port=self.config['port'])
-            logging.info("SUMO simulation started with command: %s", ' '.join(sumo_cmd))
+            if self.engine == 'libsumo':
+                traci.start(sumo_cmd)
+            else:
+                traci.start(sumo_cmd, port=self.config['port'])
+            logging.info("SUMO simulation started (%s) with command: %s", self.engine, ' '.join(sumo_cmd))
         except Exception as e:
             logging.error(f"Error starting SUMO: {e}", exc_info=True)
             sys.exit(1)
@@ -54,9 +91,23 @@ class SumoSim:
         """Perform a simulation step."""
         traci.simulationStep()
         self.step_count += 1
+
+    def step_to(self, target_time: float) -> float:
+        """
+        Advance the simulation until time >= target_time in a single TraCI call
+        (at least one step, as step() does). Returns the new simulation time.
+        """
+        start_time = traci.simulation.getTime()
+        traci.simulationStep(max(target_time, start_time + self.step_length))
+        current_time = traci.simulation.getTime()
+        self.step_count += max(int(round((current_time - start_time) / self.step_length)), 1)
+        return current_time
     
     def close(self):
         traci.close()
+
+    def is_running(self) -> bool:
+        return traci.isLoaded()
     
     def get_step_counts(self)-> int:
         return self.step_count
@@ -2,12 +2,41 @@ import time
 import os
 import sys
 import logging
+import tempfile
+import types
 
 # Thêm project root vào sys.path để có thể import từ src
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(PROJECT_ROOT)
 
+import numpy as np
+
 from src.algorithm.algo import PerimeterController, N_HAT, CONTROL_INTERVAL_S
+from src.algorithm.backends import create_green_time_solver
+from src.algorithm.checkpoint import MAX_CHECKPOINT_AGE_S, ControllerCheckpoint
+from src.algorithm.common import SolverStatus
+from src.algorithm.mpc import MPCPlanner
+from src.algorithm.multi_region import MultiRegionPerimeterController
+from src.algorithm.plan_store import PlanStore
+from src.algorithm.replay import ControlTrace, replay_trace
+from src.algorithm.snapshot import load_snapshots, replay_snapshots
+from src.algorithm.tuning import MFDSurrogate, grid_parameter_sets, peak_demand_profile, run_sweep
+from src.data.detector_config_manager import DetectorConfigManager
+from src.data.intersection_config_manager import IntersectionConfigManager
+from src.detector_sampler import DetectorRegistry
+
+CONFIG_FILE = "src/config/intersection_config.json"
+# Các trạng thái (qg [xe/giờ], hàng đợi) dùng để so sánh các backend trên cấu hình đi kèm
+SOLVER_CASES = [(0.0, None), (1500.0, None), (3500.0, None), (4200.0, 'queues'), (6000.0, 'queues')]
+
+def live_queues(config_manager, seed: int = 0):
+    """Hàng đợi ngẫu nhiên (định dạng live_queue_lengths) cho mọi nút giao của cấu hình."""
+    rng = np.random.default_rng(seed)
+    queues = {}
+    for int_id in config_manager.get_intersection_ids():
+        num_secondary = len(config_manager.get_phase_info(int_id).get('s', []))
+        queues[int_id] = {'p': float(rng.uniform(0, 30)), 's': [float(rng.uniform(0, 30)) for _ in range(num_secondary)]}
+    return queues
 
 def run_perimeter_control_mock_test():
     print("🚦 BẮT ĐẦU MÔ PHỎNG THỬ NGHIỆM (MOCK TEST)")
@@ -60,5 +89,821 @@ def run_perimeter_control_mock_test():
     print(" KẾT THÚC MÔ PHỎNG THỬ NGHIỆM")
     print("="*70)
 
+def run_perimeter_control_replay_test():
+    print("🚦 PHÁT LẠI CHUỖI ĐO LƯỜNG (KHÔNG CẦN SUMO)")
+    print("="*70)
+
+    controller = PerimeterController(config_file="src/config/intersection_config.json", backend="dp")
+
+    # Một ngày điều khiển (960 bước 90s): tích lũy dao động quanh ngưỡng n̂
+    steps = np.arange(1, 961)
+    trace = ControlTrace(
+        times=steps * float(CONTROL_INTERVAL_S),
+        n=N_HAT + 0.4 * N_HAT * np.sin(steps * 2 * np.pi / 320)
+    )
+    trajectory = replay_trace(controller, trace)
+
+    print(f"   • Số bước: {len(trace)}, số bước hoạt động: {int(trajectory.is_active.sum())}")
+    print(f"   • Thời gian chạy: {trajectory.wall_time_s:.2f}s ({trajectory.steps_per_second:.0f} bước/s)")
+    print(f"   • qg lớn nhất: {trajectory.qg.max():.1f} xe/giờ")
+    print("="*70)
+
+def run_perimeter_control_checkpoint_test():
+    print("🚦 KHÔI PHỤC BỘ ĐIỀU KHIỂN TỪ ĐIỂM KHÔI PHỤC")
+    print("="*70)
+
+    checkpoint_file = os.path.join(tempfile.mkdtemp(), "controller_checkpoint.json")
+    controller = PerimeterController(config_file="src/config/intersection_config.json", backend="dp",
+                                     checkpoint_file=checkpoint_file)
+    n_previous, qg_previous = 0.0, 0.0
+    for k, n_current in enumerate([200.0, 260.0, 320.0, 360.0], start=1):
+        result = controller.run_simulation_step(n_current, n_previous, qg_previous, sim_time=k * CONTROL_INTERVAL_S)
+        n_previous, qg_previous = result.n_current, result.qg_new
+
+    restored = PerimeterController.from_checkpoint(checkpoint_file, config_file="src/config/intersection_config.json",
+                                                   backend="dp")
+    assert restored.is_active == controller.is_active
+    assert restored.control_step == controller.control_step
+    assert (restored.last_n, restored.last_qg) == (n_previous, qg_previous)
+    assert restored.previous_green_times == controller.previous_green_times
+
+    # Chỉ khôi phục khi mô phỏng tiếp tục tại thời điểm đã ghi: lần chạy mới từ t=0 và file quá cũ bị từ chối
+    last_time = 4 * CONTROL_INTERVAL_S
+    resumed = PerimeterController.from_checkpoint(checkpoint_file, resume_time=last_time + 10.0,
+                                                  config_file="src/config/intersection_config.json", backend="dp")
+    assert resumed.control_step == controller.control_step
+    for resume_time in (0.0, last_time - 10.0, last_time + 2 * CONTROL_INTERVAL_S):
+        try:
+            PerimeterController.from_checkpoint(checkpoint_file, resume_time=resume_time,
+                                                config_file="src/config/intersection_config.json", backend="dp")
+            raise AssertionError(f"điểm khôi phục t={last_time}s không được dùng tại t={resume_time}s")
+        except ValueError:
+            pass
+    stale = ControllerCheckpoint.load(checkpoint_file)
+    stale.saved_at -= 2 * MAX_CHECKPOINT_AGE_S
+    stale.save(checkpoint_file)
+    try:
+        PerimeterController.from_checkpoint(checkpoint_file, resume_time=last_time,
+                                            config_file="src/config/intersection_config.json", backend="dp")
+        raise AssertionError("điểm khôi phục quá cũ không được dùng")
+    except ValueError:
+        pass
+
+    print(f"   • Khôi phục tại bước {restored.control_step}: n={restored.last_n:.0f} xe, qg={restored.last_qg:.2f} xe/giờ")
+    print("="*70)
+
+def run_snapshot_replay_test():
+    print("🚦 PHÁT LẠI ẢNH CHỤP BÀI TOÁN ĐÃ GHI")
+    print("="*70)
+
+    snapshot_file = os.path.join(tempfile.mkdtemp(), "solver_snapshots.jsonl.gz")
+    controller = PerimeterController(config_file=CONFIG_FILE, backend="dp", snapshot_file=snapshot_file)
+    n_previous, qg_previous = 0.0, 0.0
+    active_steps = 0
+    for k, n_current in enumerate([200.0, 260.0, 320.0, 360.0, 340.0, 300.0], start=1):
+        # Hàng đợi làm tròn 2 chữ số như khi ghi, để giá trị mục tiêu tái lập chính xác
+        queues = {int_id: {'p': round(q['p'], 2), 's': [round(x, 2) for x in q['s']]}
+                  for int_id, q in live_queues(controller.config_manager, seed=k).items()}
+        result = controller.run_simulation_step(n_current, n_previous, qg_previous, queues, sim_time=k * CONTROL_INTERVAL_S)
+        n_previous, qg_previous = result.n_current, result.qg_new
+        active_steps += result.is_active
+    controller.close()
+
+    snapshots = load_snapshots(snapshot_file)
+    assert len(snapshots) == active_steps > 0
+    assert all(snapshot.status == SolverStatus.OPTIMAL and snapshot.backend == 'dp' for snapshot in snapshots)
+
+    report = replay_snapshots(snapshots, IntersectionConfigManager(CONFIG_FILE), ['dp'])['dp']
+    assert report.statuses == [snapshot.status for snapshot in snapshots]
+    for objective, snapshot in zip(report.objectives, snapshots):
+        assert abs(objective - snapshot.objective_value) <= 1e-9 * max(abs(snapshot.objective_value), 1.0)
+    summary = report.summary()
+    assert summary['status_changes'] == 0 and summary['recorded_diff_max'] < 1e-6
+
+    print(f"   • {len(snapshots)} ảnh chụp tái lập trạng thái và giá trị mục tiêu đã ghi")
+    print("="*70)
+
+def run_solver_backends_test():
+    print("🚦 SO SÁNH CÁC BACKEND BỘ GIẢI (scip, cpsat, dp)")
+    print("="*70)
+
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    previous_green_times = config_manager.get_initial_green_times()
+    # 'scip' là mô hình MIQP gốc của dự án, dùng làm tham chiếu
+    solvers = {backend: create_green_time_solver(config_manager, backend, cache_size=0) for backend in ('scip', 'cpsat', 'dp')}
+    spec = solvers['dp'].spec
+
+    for target_inflow, queue_case in SOLVER_CASES:
+        queues = live_queues(config_manager) if queue_case else None
+        objectives = {}
+        for backend, solver in solvers.items():
+            result = solver.solve(target_inflow, previous_green_times, queues)
+            assert result['status'] == SolverStatus.OPTIMAL, (backend, result['status'])
+            G = spec.vector_from_variables(result['variables'])
+            # Giá trị mục tiêu báo cáo khớp với hàm mục tiêu gốc tính lại từ phương án
+            assert abs(result['objective_value'] - spec.objective(G, spec.qg_prime(target_inflow), spec.queue_vector(queues))) < 1e-6
+            objectives[backend] = result['objective_value']
+        for backend, objective in objectives.items():
+            assert abs(objective - objectives['scip']) < 1e-4 * max(1.0, abs(objectives['scip'])), (target_inflow, objectives)
+        print(f"   • qg={target_inflow:.0f}: " + ", ".join(f"{backend}={value:.4f}" for backend, value in objectives.items()))
+
+    for solver in solvers.values():
+        solver.close()
+    print("="*70)
+
+def run_presolve_infeasibility_test():
+    print("🚦 CHẨN ĐOÁN BÀI TOÁN KHÔNG KHẢ THI KHI TIỀN XỬ LÝ")
+    print("="*70)
+
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    previous_green_times = config_manager.get_initial_green_times()
+    int_id = config_manager.get_intersection_ids()[0]
+    # G_p, G_s ∈ [prev ± max_change] = [65, 75] nên không thể có G_p + G_s = chu kỳ (90s)
+    previous_green_times[int_id] = {'p': 75, 's': [75]}
+
+    for backend in ('scip', 'cpsat', 'dp', 'relaxation', 'decomposition'):
+        solver = create_green_time_solver(config_manager, backend, cache_size=0)
+        result = solver.solve(3000.0, previous_green_times)
+        solver.close()
+        assert result['status'] == SolverStatus.INFEASIBLE, (backend, result and result['status'])
+        assert result['backend_status'] == 'presolve_infeasible'
+        assert len(result['diagnosis']) == 1 and result['diagnosis'][0].startswith(int_id), result['diagnosis']
+        print(f"   • {backend}: {result['diagnosis'][0]}")
+    print("="*70)
+
+def rounded_inflow_config():
+    """Cấu hình có một hệ số lưu lượng không biểu diễn chính xác với mọi độ phân giải S."""
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    int_id = config_manager.get_intersection_ids()[0]
+    config_manager.config_data['optimization_parameters']['intersection_data'][int_id]['phases']['p']['turn_in_ratio'] = 0.712345678
+    return config_manager
+
+def run_rounded_inflow_test():
+    print("🚦 HỆ SỐ LƯU LƯỢNG ĐÃ LÀM TRÒN: CP-SAT KHÔNG BÁO TỐI ƯU")
+    print("="*70)
+
+    config_manager = rounded_inflow_config()
+    previous_green_times = config_manager.get_initial_green_times()
+    queues = live_queues(config_manager, seed=4)
+    reference = create_green_time_solver(config_manager, 'scip', cache_size=0)
+    solver = create_green_time_solver(config_manager, 'cpsat', cache_size=0)
+    assert not solver.exact
+    for target_inflow in (1500.0, 4200.0):
+        expected = reference.solve(target_inflow, previous_green_times, queues)
+        result = solver.solve(target_inflow, previous_green_times, queues)
+        assert result['status'] == SolverStatus.FEASIBLE and result['backend_status'] == 'rounded_inflow'
+        assert np.isnan(result['gap'])
+        G = solver.spec.vector_from_variables(result['variables'])
+        assert abs(solver.spec.objective(G, solver.spec.qg_prime(target_inflow), solver.spec.queue_vector(queues))
+                   - result['objective_value']) < 1e-9
+        assert result['objective_value'] >= expected['objective_value'] - 1e-6 * max(abs(expected['objective_value']), 1.0)
+        print(f"   • qg={target_inflow:.0f}: scip={expected['objective_value']:.4f}, cpsat={result['objective_value']:.4f}")
+    reference.close()
+    solver.close()
+    print("="*70)
+
+def run_dp_fallback_test():
+    print("🚦 BẢNG DP QUÁ LỚN: BACKEND 'dp' CHUYỂN SANG SCIP")
+    print("="*70)
+
+    max_levels = 100_000
+    config_manager = rounded_inflow_config()
+    config_manager.config_data['optimization_parameters']['dp_max_inflow_levels'] = max_levels
+    assert config_manager.get_global_params()['dp_max_inflow_levels'] == max_levels
+    previous_green_times = config_manager.get_initial_green_times()
+    queues = live_queues(config_manager, seed=4)
+    reference = create_green_time_solver(config_manager, 'scip', cache_size=0)
+
+    # Hệ số phải làm tròn (S = 10000): số mức lưu lượng vượt giới hạn → giải bằng SCIP
+    solver = create_green_time_solver(config_manager, 'dp', cache_size=0)
+    assert not solver.exact and solver.worst_case_levels() > max_levels
+    assert solver.fallback_solver is not None
+    for target_inflow in (1500.0, 4200.0):
+        expected = reference.solve(target_inflow, previous_green_times, queues)
+        result = solver.solve(target_inflow, previous_green_times, queues)
+        assert result['status'] == expected['status'] == SolverStatus.OPTIMAL
+        assert abs(result['objective_value'] - expected['objective_value']) <= 1e-6 * max(abs(expected['objective_value']), 1.0)
+        print(f"   • qg={target_inflow:.0f}: scip={expected['objective_value']:.4f}, dp→scip={result['objective_value']:.4f}")
+    table = solver.solve_batch([1500.0, 4200.0], previous_green_times, queues)
+    assert table is not None and table.lookup(4200.0)['status'] == SolverStatus.OPTIMAL
+    try:
+        solver.solve_batch(None, previous_green_times, queues)
+        raise AssertionError("solve_batch(None) phải báo lỗi khi đã chuyển sang SCIP")
+    except ValueError:
+        pass
+    print(f"   • Hệ số làm tròn: {solver.worst_case_levels()} mức > giới hạn {max_levels}, giải bằng SCIP")
+    solver.close()
+    reference.close()
+
+    # 0 = không giới hạn: vẫn giải bằng DP
+    config_manager.config_data['optimization_parameters']['dp_max_inflow_levels'] = 0
+    solver = create_green_time_solver(config_manager, 'dp', cache_size=0)
+    assert solver.fallback_solver is None
+    solver.close()
+
+    # Hệ số chính xác: bảng nhỏ, không chuyển backend với cùng giới hạn
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    config_manager.config_data['optimization_parameters']['dp_max_inflow_levels'] = max_levels
+    solver = create_green_time_solver(config_manager, 'dp', cache_size=0)
+    assert solver.exact and solver.fallback_solver is None
+    result = solver.solve(4200.0, previous_green_times, queues)
+    assert result['status'] == SolverStatus.OPTIMAL and 'profile' in result
+    print(f"   • Hệ số chính xác: {solver.worst_case_levels()} mức, giải bằng DP")
+    solver.close()
+    print("="*70)
+
+def run_decomposition_config_test():
+    print("🚦 THAM SỐ CẤU HÌNH CỦA BACKEND PHÂN RÃ")
+    print("="*70)
+
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    params = config_manager.config_data['optimization_parameters']
+    params.update({'decomposition_polish_sweeps': 0, 'decomposition_num_workers': 1, 'decomposition_num_shards': 2})
+    assert config_manager.get_global_params()['decomposition_polish_sweeps'] == 0
+
+    previous_green_times = config_manager.get_initial_green_times()
+    queues = live_queues(config_manager, seed=5)
+    solver = create_green_time_solver(config_manager, 'decomposition', cache_size=0)
+    assert solver.polish_sweeps == 0 and len(solver.shards) == 2
+    result = solver.solve(4200.0, previous_green_times, queues)
+    solver.close()
+    # Không có lượt đánh bóng: nghiệm trả về chính là nghiệm ADMM
+    assert result['polish_sweeps'] == 0
+    assert result['objective_value'] == result['admm_objective_value']
+
+    params['decomposition_polish_sweeps'] = 2
+    solver = create_green_time_solver(config_manager, 'decomposition', cache_size=0)
+    assert solver.polish_sweeps == 2
+    result = solver.solve(4200.0, previous_green_times, queues)
+    solver.close()
+    assert 1 <= result['polish_sweeps'] <= 2
+    assert result['objective_value'] <= result['admm_objective_value'] + 1e-9
+    print(f"   • ADMM {result['admm_objective_value']:.4f} → {result['objective_value']:.4f} sau {result['polish_sweeps']} lượt")
+    print("="*70)
+
+def run_plan_table_test():
+    print("🚦 BẢNG TRA CỨU qg → PHƯƠNG ÁN SO VỚI GIẢI TRỰC TIẾP (DP)")
+    print("="*70)
+
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    previous_green_times = config_manager.get_initial_green_times()
+    queues = live_queues(config_manager, seed=1)
+    solver = create_green_time_solver(config_manager, 'dp', cache_size=0)
+    spec = solver.spec
+
+    # Bảng chính xác từ một lần quét DP: khớp lời giải trực tiếp với mọi qg
+    table = solver.solve_batch(None, previous_green_times, queues)
+    for target_inflow in np.linspace(0.0, 6000.0, 25):
+        direct = solver.solve(target_inflow, previous_green_times, queues)
+        lookup = table.lookup(target_inflow)
+        G = spec.vector_from_variables(lookup['variables'])
+        assert lookup['status'] == SolverStatus.OPTIMAL
+        assert abs(lookup['objective_value'] - direct['objective_value']) < 1e-6, target_inflow
+        assert abs(spec.objective(G, spec.qg_prime(target_inflow), spec.queue_vector(queues)) - direct['objective_value']) < 1e-6
+
+    # Bảng dựng từ lưới qg (giao diện chung): chính xác tại điểm lưới, FEASIBLE giữa các điểm lưới
+    grid_table = super(type(solver), solver).solve_batch([1000.0, 3000.0, 5000.0], previous_green_times, queues)
+    assert grid_table.lookup(3000.0)['status'] == SolverStatus.OPTIMAL
+    between = grid_table.lookup(2000.0)
+    assert between['status'] == SolverStatus.FEASIBLE and np.isnan(between['gap'])
+    assert between['objective_value'] >= table.objective(2000.0) - 1e-9
+
+    solver.close()
+    print(f"   • {len(table)} phương án trên bao dưới, 25 truy vấn khớp lời giải trực tiếp")
+    print("="*70)
+
+def run_solver_cache_test():
+    print("🚦 BỘ NHỚ ĐỆM BỘ GIẢI: TRÚNG VÀ XÓA KHI CẤU HÌNH THAY ĐỔI")
+    print("="*70)
+
+    config_manager = IntersectionConfigManager(CONFIG_FILE)
+    previous_green_times = config_manager.get_initial_green_times()
+    queues = live_queues(config_manager, seed=2)
+    solver = create_green_time_solver(config_manager, 'dp', cache_size=8)
+
+    first = solver.solve(3500.0, previous_green_times, queues)
+    second = solver.solve(3500.0, previous_green_times, queues)
+    assert first['cache_hit'] is False and second['cache_hit'] is True
+    assert second['variables'] == first['variables']
+    assert abs(second['objective_value'] - first['objective_value']) < 1e-12
+    stats = solver.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['entries'] == 1
+
+    # Kết quả trả về là bản sao: sửa kết quả không làm hỏng bộ nhớ đệm
+    second['variables'].clear()
+    assert solver.solve(3500.0, previous_green_times, queues)['variables'] == first['variables']
+
+    # Đổi tham số tối ưu hóa: bộ nhớ đệm bị xóa, backend cũ được đóng và xây dựng lại
+    old_backend = solver.solver
+    closed = []
+    old_backend.close = lambda: closed.append(True)
+    config_manager.config_data['optimization_parameters']['theta_2'] *= 2
+    third = solver.solve(3500.0, previous_green_times, queues)
+    assert third['cache_hit'] is False
+    assert closed == [True] and solver.solver is not old_backend
+    stats = solver.stats()
+    assert stats['invalidations'] == 1 and stats['entries'] == 1
+    assert abs(third['objective_value'] - first['objective_value']) > 1e-6
+
+    solver.close()
+    print(f"   • {stats}")
+    print("="*70)
+
+def run_plan_store_test():
+    print("🚦 KHO PHƯƠNG ÁN: PHIÊN BẢN VÀ ẢNH CHỤP BẤT BIẾN")
+    print("="*70)
+
+    green_times = {'J1': {'p': 40, 's': [40]}}
+    store = PlanStore(is_active=False, green_times=green_times)
+    initial = store.current
+    assert store.version == 0 and initial.is_active is False
+
+    # Mỗi lần công bố tăng phiên bản đúng 1; trường None giữ giá trị của phiên bản trước
+    activated = store.publish(is_active=True)
+    assert store.version == 1 and store.current is activated
+    assert activated.is_active is True and activated.green_times is initial.green_times
+
+    green_times['J1'] = {'p': 60, 's': [20]}
+    updated = store.publish(green_times=green_times)
+    assert store.version == 2 and updated.is_active is True
+    assert updated.green_times['J1'] == {'p': 60, 's': [20]}
+    assert updated.published_at >= activated.published_at
+
+    # Ảnh chụp không đổi khi người gọi sửa dict của mình, và không thể gán trực tiếp
+    green_times['J1'] = {'p': 30, 's': [50]}
+    green_times['J2'] = {'p': 45, 's': [35]}
+    assert updated.green_times['J1'] == {'p': 60, 's': [20]} and 'J2' not in updated.green_times
+    assert initial.green_times['J1'] == {'p': 40, 's': [40]}
+
+    # Sửa tại chỗ dict bên trong của nguồn đã công bố (như previous_green_times[int_id]) không lan sang ảnh chụp
+    green_times = {'J1': {'p': 50, 's': [30]}}
+    latest = store.publish(green_times=green_times)
+    green_times['J1']['p'] = 70
+    green_times['J1']['s'][0] = 10
+    assert latest.green_times['J1'] == {'p': 50, 's': [30]}
+    assert updated.green_times['J1'] == {'p': 60, 's': [20]}
+    try:
+        updated.green_times['J1'] = {'p': 0, 's': [0]}
+        raise AssertionError("green_times của ảnh chụp phải chỉ đọc")
+    except TypeError:
+        pass
+
+    deactivated = store.publish(is_active=False)
+    assert store.version == 4 and deactivated.is_active is False
+    assert deactivated.green_times is latest.green_times
+
+    print(f"   • phiên bản {store.version}, is_active={store.current.is_active}")
+    print("="*70)
+
+def run_signal_scheduler_test():
+    print("🚦 BỘ LẬP LỊCH LỆNH ĐÈN: RANH GIỚI CHU KỲ VÀ CHỈ ÁP DỤNG THAY ĐỔI (traci giả lập)")
+    print("="*70)
+
+    # main.py import theo gốc src (như khi chạy mô phỏng); sumosim chỉ cần SUMO_HOME được khai báo
+    os.environ.setdefault('SUMO_HOME', tempfile.gettempdir())
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+    import main
+    from signal_programs import SignalProgramCache, FIXED_PROGRAM_ID, CONTROLLED_PROGRAM_ID
+
+    trafficlight = main.traci.trafficlight
+    stubbed = ('getPhase', 'getNextSwitch', 'setProgramLogic', 'setProgram')
+    originals = {name: getattr(trafficlight, name) for name in stubbed}
+    calls = []
+    # Mọi đèn đang ở pha 1, lần chuyển pha kế tiếp tại clock['next_switch']
+    clock = {'next_switch': 50.0}
+    trafficlight.getPhase = lambda tl_id: 1
+    trafficlight.getNextSwitch = lambda tl_id: clock['next_switch']
+    trafficlight.setProgramLogic = lambda tl_id, logic: calls.append(('logic', tl_id, logic.programID, tuple(p.duration for p in logic.phases)))
+    trafficlight.setProgram = lambda tl_id, program_id: calls.append(('program', tl_id, program_id))
+    try:
+        config_manager = IntersectionConfigManager(CONFIG_FILE)
+        intersection_ids = config_manager.get_intersection_ids()
+        program_cache = SignalProgramCache(config_manager)
+        program_cache.register_programs()
+        calls.clear()
+
+        store = main.PlanStore()
+        scheduler = main.SignalScheduler(store, config_manager, program_cache)
+        first_id = intersection_ids[0]
+        tl_id = config_manager.get_traffic_light_id(first_id)
+        fixed = program_cache.fixed_durations(tl_id)
+        boundary = 50.0 + sum(fixed[2:])
+
+        # Phương án đầu tiên: chưa áp dụng gì trước ranh giới chu kỳ, áp dụng mọi giao lộ tại ranh giới
+        green_times = config_manager.get_initial_green_times()
+        green_times[first_id] = {'p': 30, 's': [40]}
+        store.publish(is_active=True, green_times=green_times)
+        scheduler.poll(10.0)
+        assert scheduler.next_event_time() == boundary
+        scheduler.poll(boundary - 1)
+        assert calls == [] and scheduler.stats['applied'] == 0
+        scheduler.poll(boundary)
+        assert scheduler.stats['applied'] == len(intersection_ids) and scheduler.next_event_time() == float('inf')
+        assert ('program', tl_id, CONTROLLED_PROGRAM_ID) in calls
+        assert ('logic', tl_id, CONTROLLED_PROGRAM_ID, program_cache.plan_durations(first_id, {'p': 30, 's': [40]})) in calls
+        calls.clear()
+
+        # Phương án chỉ đổi một giao lộ: chỉ giao lộ đó được lập lịch, không chuyển chương trình lần nữa
+        changed_id = intersection_ids[-1]
+        green_times = dict(green_times)
+        green_times[changed_id] = {'p': 50, 's': [30]}
+        store.publish(green_times=green_times)
+        clock['next_switch'] = 250.0
+        scheduler.poll(200.0)
+        assert list(scheduler.pending) == [changed_id]
+        assert scheduler.stats['unchanged'] == len(intersection_ids) - 1
+        scheduler.poll(scheduler.next_event_time())
+        changed_tl = config_manager.get_traffic_light_id(changed_id)
+        assert [call[:3] for call in calls] == [('logic', changed_tl, CONTROLLED_PROGRAM_ID)]
+        calls.clear()
+
+        # Phương án mới đè lên lệnh đang chờ: chỉ phương án mới nhất được áp dụng
+        green_times = dict(green_times)
+        green_times[first_id] = {'p': 35, 's': [35]}
+        store.publish(green_times=green_times)
+        clock['next_switch'] = 350.0
+        scheduler.poll(300.0)
+        green_times = dict(green_times)
+        green_times[first_id] = {'p': 45, 's': [25]}
+        store.publish(green_times=green_times)
+        scheduler.poll(301.0)
+        scheduler.poll(scheduler.next_event_time())
+        assert calls == [('logic', tl_id, CONTROLLED_PROGRAM_ID, program_cache.plan_durations(first_id, {'p': 45, 's': [25]}))]
+        calls.clear()
+
+        # Hủy kích hoạt: mọi giao lộ quay về chương trình chu kỳ cố định tại ranh giới chu kỳ
+        store.publish(is_active=False)
+        clock['next_switch'] = 450.0
+        scheduler.poll(400.0)
+        assert calls == [] and len(scheduler.pending) == len(intersection_ids)
+        # Ranh giới tính theo chương trình đang chạy của từng đèn: đèn có chu kỳ ngắn hơn được khôi phục trước
+        assert scheduler.boundaries[first_id] == 450.0 + sum(program_cache.plan_durations(first_id, {'p': 45, 's': [25]})[2:])
+        scheduler.poll(max(scheduler.boundaries.values()))
+        assert scheduler.stats['restored'] == len(intersection_ids) and scheduler.applied == {}
+        assert all(program_cache.active_program[config_manager.get_traffic_light_id(int_id)] == FIXED_PROGRAM_ID
+                   for int_id in intersection_ids)
+    finally:
+        for name, original in originals.items():
+            setattr(trafficlight, name, original)
+
+    print(f"   • {scheduler.stats}, chương trình đèn: {program_cache.stats()}")
+    print("="*70)
+
+def legacy_accumulation(detector_ids, occupancy, num_lanes=None):
+    """Vòng lặp tính tích lũy theo từng detector như trước khi có DetectorRegistry (80 m, xe 3 m, 1 làn)."""
+    total_accumulation = 0
+    for det_id in detector_ids:
+        road_length = 80.00
+        average_length_of_vehicles = 3
+        num_lane = (num_lanes or {}).get(det_id, 1)
+        total_accumulation += road_length * (num_lane / (100 * average_length_of_vehicles)) * occupancy[det_id]
+    return total_accumulation
+
+def run_detector_registry_test():
+    print("🚦 MA TRẬN TRỌNG SỐ DETECTOR SO VỚI VÒNG LẶP THEO TỪNG DETECTOR")
+    print("="*70)
+
+    detector_config = DetectorConfigManager("src/config/detector_config.json")
+    registry = DetectorRegistry.from_additional_file("src/network_test/detector.add.xml",
+                                                     geometry=detector_config.get_detector_geometry(),
+                                                     net_file="src/network_test/grid.net.xml")
+    groups = [detector_config.get_algorithm_input_detectors()]
+    for details in detector_config.get_solver_input_detectors().values():
+        phases = details.get('phases', {})
+        groups.append(phases.get('p', {}).get('queue_detectors', []))
+        groups.extend(s_phase.get('queue_detectors', []) for s_phase in phases.get('s', []))
+    weight_matrix = registry.weight_matrix(groups)
+    num_detectors = len(registry.detector_ids)
+    assert weight_matrix.shape == (len(groups), len(registry.detector_ids))
+
+    # Mạng thử nghiệm chỉ có đường một làn: kết quả phải trùng vòng lặp cũ
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        occupancy_vector = rng.uniform(0, 100, len(registry.detector_ids))
+        occupancy = dict(zip(registry.detector_ids, occupancy_vector))
+        accumulations = weight_matrix @ occupancy_vector
+        for group, accumulation in zip(groups, accumulations):
+            assert abs(accumulation - legacy_accumulation(group, occupancy)) < 1e-9
+
+    # Đường ba làn có hai detector cùng nhóm: hai detector chia đều ba làn; num_lanes ghi đè được dùng nguyên giá trị
+    registry = DetectorRegistry(['a', 'b', 'c', 'd'], {det_id: 80.0 for det_id in 'abcd'},
+                                {'vehicle_length': 3.0, 'detectors': {'d': {'num_lanes': 2}}},
+                                edges={det_id: 'E' for det_id in 'abcd'}, edge_lanes={'E': 3})
+    occupancy = {'a': 10.0, 'b': 20.0, 'c': 30.0, 'd': 40.0}
+    occupancy_vector = np.array([occupancy[det_id] for det_id in registry.detector_ids])
+    groups = [['a', 'b'], ['c'], ['a', 'b', 'd']]
+    expected = [legacy_accumulation(['a', 'b'], occupancy, {'a': 1.5, 'b': 1.5}),
+                legacy_accumulation(['c'], occupancy, {'c': 3}),
+                legacy_accumulation(['a', 'b', 'd'], occupancy, {'a': 1.5, 'b': 1.5, 'd': 2})]
+    assert np.allclose(registry.weight_matrix(groups) @ occupancy_vector, expected)
+
+    print(f"   • {num_detectors} detector, {weight_matrix.shape[0]} nhóm khớp vòng lặp cũ")
+    print("="*70)
+
+def run_multi_region_test():
+    print("🚦 BỘ ĐIỀU KHIỂN CHU VI NHIỀU VÙNG")
+    print("="*70)
+
+    regions = [
+        {'id': 'west', 'intersections': ['B3', 'B2', 'B1'], 'n_hat': 120, 'kp': 20, 'ki': 5},
+        {'id': 'east', 'intersections': ['C3', 'C1', 'D3', 'D2', 'D1'], 'n_hat': 200, 'kp': 12, 'ki': 3,
+         'activation_factor': 0.9, 'deactivation_factor': 0.6}
+    ]
+    controller = MultiRegionPerimeterController(config_file=CONFIG_FILE, regions=regions)
+
+    # PI và trễ vector hóa khớp R bộ điều khiển một vùng độc lập (lần đo đầu tiên làm n(k-1), Δn = 0)
+    singles = [PerimeterController(kp=region['kp'], ki=region['ki'], n_hat=region['n_hat'], config_file=CONFIG_FILE,
+                                   backend='dp', activation_factor=region.get('activation_factor', 0.85),
+                                   deactivation_factor=region.get('deactivation_factor', 0.70)) for region in regions]
+    trajectory = np.array([[110.0, 150.0], [130.0, 185.0], [125.0, 195.0], [90.0, 170.0], [70.0, 140.0], [60.0, 110.0]])
+    n_previous, qg_previous = trajectory[0].copy(), np.zeros(len(regions))
+    for n_current in trajectory:
+        result = controller.update(n_current)
+        for r, single in enumerate(singles):
+            single.check_activation_status(n_current[r])
+            expected_qg = (single.calculate_target_inflow(n_current[r], n_previous[r], qg_previous[r])
+                           if single.is_active else qg_previous[r])
+            assert result.is_active[r] == single.is_active
+            assert abs(result.qg_new[r] - expected_qg) < 1e-9, (r, result.qg_new[r], expected_qg)
+        n_previous, qg_previous = n_current, result.qg_new
+    # Vùng 'west' kích hoạt ngay ở bước đầu (110 > 0.85·120): qg = Ki·(n̂ - n) > 0, không bị chặn về 0
+    fresh = MultiRegionPerimeterController(config_file=CONFIG_FILE, regions=regions)
+    first = fresh.update(trajectory[0])
+    assert first.activated[0] and first.qg_new[0] > 0
+    fresh.close()
+    for single in singles:
+        single.close()
+    controller.close()
+
+    # Một nút giao không được thuộc hai vùng
+    try:
+        MultiRegionPerimeterController(config_file=CONFIG_FILE,
+                                       regions=[{'id': 'a', 'intersections': ['B3', 'B2']}, {'id': 'b', 'intersections': ['B2']}])
+        raise AssertionError("nút giao thuộc hai vùng phải gây ValueError")
+    except ValueError:
+        pass
+
+    # Mỗi vùng chỉ thay đổi thời gian xanh của các nút giao của mình
+    controller = MultiRegionPerimeterController(config_file=CONFIG_FILE, regions=regions)
+    initial = {int_id: dict(times) for int_id, times in controller.initial_green_times.items()}
+    west, east = set(regions[0]['intersections']), set(regions[1]['intersections'])
+    queues = live_queues(controller.config_manager, seed=6)
+
+    controller.run_simulation_step(np.array([110.0, 100.0]), queues)          # chỉ 'west' hoạt động
+    changed = {int_id for int_id, times in controller.previous_green_times.items() if times != initial[int_id]}
+    assert changed and changed <= west, changed
+
+    controller.run_simulation_step(np.array([50.0, 190.0]), queues)           # 'west' hủy, 'east' hoạt động
+    changed = {int_id for int_id, times in controller.previous_green_times.items() if times != initial[int_id]}
+    assert changed and changed <= east, changed
+    assert all(controller.previous_green_times[int_id] == initial[int_id] for int_id in west)
+    controller.close()
+
+    print(f"   • {len(regions)} vùng, {len(trajectory)} bước khớp bộ điều khiển một vùng")
+    print("="*70)
+
+def run_mpc_test():
+    print("🚦 LUẬT ĐIỀU KHIỂN DỰ BÁO (MPC)")
+    print("="*70)
+
+    surrogate = MFDSurrogate(g_max=3000.0, n_crit=280.0)
+    planner = MPCPlanner(surrogate=surrogate, n_hat=280.0, horizon=6, num_levels=21)
+    interval_h = surrogate.control_interval_s / 3600.0
+
+    # Mô phỏng vector hóa khớp vòng lặp vô hướng trên từng chuỗi ứng viên
+    n_current, demand, qg_previous = 330.0, 1500.0, 1200.0
+    costs = planner.rollout_costs(n_current, demand, qg_previous)
+    for c in (0, 17, len(planner.candidates) // 2, len(planner.candidates) - 1):
+        n, cost, u_previous = n_current, 0.0, qg_previous
+        for u in planner.candidates[c]:
+            n = max(n + interval_h * (demand + u - float(surrogate.outflow(np.asarray(n)))), 0.0)
+            error = (n - planner.n_hat) / planner.n_hat
+            cost += error ** 2 + planner.overshoot_weight * max(error, 0.0) ** 2
+            cost += planner.move_weight * ((u - u_previous) / surrogate.g_max) ** 2
+            u_previous = u
+        assert abs(costs[c] - cost) < 1e-9, (c, costs[c], cost)
+
+    # Vòng kín trên chính MFD đã khớp: qg được chọn đưa n về n̂
+    n_previous, n, qg = 360.0, 360.0, 0.0
+    errors = []
+    for k in range(30):
+        qg_new = planner.plan(n, n_previous, qg, was_active=k > 0)
+        n_previous, qg = n, qg_new
+        n = max(n + interval_h * (demand + qg - float(surrogate.outflow(np.asarray(n)))), 0.0)
+        errors.append(abs(n - planner.n_hat) / planner.n_hat)
+    assert errors[-1] < 0.03 and max(errors[-10:]) < 0.05, errors
+    assert errors[-1] < errors[0]
+
+    # control_law='mpc' giữ nguyên kích hoạt/hủy và phân bổ cho bộ giải như 'pi'
+    mpc_params = {'mfd_g_max': 3000.0, 'mfd_n_crit': 280.0, 'horizon': 6, 'num_levels': 21}
+    controllers = {law: PerimeterController(config_file=CONFIG_FILE, backend='dp', control_law=law,
+                                            mpc_params=mpc_params if law == 'mpc' else None)
+                   for law in ('pi', 'mpc')}
+    reference = MPCPlanner(surrogate=MFDSurrogate(g_max=3000.0, n_crit=280.0), n_hat=280.0, horizon=6, num_levels=21)
+    solved = {law: [] for law in controllers}
+    for law, controller in controllers.items():
+        solve = controller.solver.solve
+        def recording_solve(target_inflow, *args, _law=law, _solve=solve, **kwargs):
+            solved[_law].append(target_inflow)
+            return _solve(target_inflow, *args, **kwargs)
+        controller.solver.solve = recording_solve
+
+    trajectory = [200.0, 250.0, 300.0, 320.0, 290.0, 230.0, 180.0, 240.0]
+    state = {law: (0.0, 0.0) for law in controllers}
+    for n_current in trajectory:
+        was_active = controllers['mpc'].is_active
+        n_previous, qg_previous = state['mpc']
+        expected_qg = reference.plan(n_current, n_previous, qg_previous, was_active)
+        results = {}
+        for law, controller in controllers.items():
+            results[law] = controller.run_simulation_step(n_current, *state[law])
+            state[law] = (results[law].n_current, results[law].qg_new)
+        assert results['mpc'].is_active == results['pi'].is_active
+        assert len(solved['mpc']) == len(solved['pi'])
+        if results['mpc'].is_active:
+            # Bộ giải nhận đúng qg của MPC ở bước hoạt động, giống như nhận qg của luật PI
+            assert solved['mpc'][-1] == results['mpc'].qg_new == expected_qg
+            assert solved['pi'][-1] == results['pi'].qg_new
+        else:
+            assert results['mpc'].qg_new == qg_previous
+    assert 0 < len(solved['mpc']) < len(trajectory)
+    for controller in controllers.values():
+        controller.close()
+
+    try:
+        PerimeterController(config_file=CONFIG_FILE, backend='dp', control_law='lqr')
+        raise AssertionError("control_law không hợp lệ phải gây ValueError")
+    except ValueError:
+        pass
+
+    print(f"   • sai số cuối |n - n̂|/n̂ = {errors[-1]:.2%}, {len(solved['mpc'])} lần giải như luật PI")
+    print("="*70)
+
+def surrogate_metrics(params, surrogate, demand, gated_share=0.5, settling_band=0.05):
+    """Quỹ đạo mô hình hồ chứa của một bộ tham số, tính từng bước bằng số vô hướng."""
+    T = surrogate.control_interval_s / 3600.0
+    n = n_previous = qg = gate_queue = 0.0
+    is_active = False
+    history = []
+    for d in demand:
+        if n > params['activation_factor'] * params['n_hat']:
+            is_active = True
+        elif n < params['deactivation_factor'] * params['n_hat']:
+            is_active = False
+        if is_active:
+            qg = max(qg - params['kp'] * (n - n_previous) + params['ki'] * (params['n_hat'] - n), 0.0)
+        history.append((n, is_active))
+        available = gated_share * d + gate_queue / T
+        inflow = min(qg, available) if is_active else available
+        gate_queue = max(gate_queue + T * (gated_share * d - inflow), 0.0)
+        G = 4 * surrogate.g_max * min(n / (2 * surrogate.n_crit), 1.0) * (1 - min(n / (2 * surrogate.n_crit), 1.0))
+        n_previous, n = n, max(n + T * ((1 - gated_share) * d + inflow - G), 0.0)
+
+    active_steps = [k for k, (_, active) in enumerate(history) if active]
+    if not active_steps:
+        return 0.0, 0.0
+    first = active_steps[0]
+    after = [n for n, _ in history[first:]]
+    overshoot = max(max(after) - params['n_hat'], 0.0) / params['n_hat']
+    violations = [k for k, n in enumerate(after) if n - params['n_hat'] > settling_band * params['n_hat']]
+    if not violations:
+        settling_time = 0.0
+    elif violations[-1] == len(after) - 1:
+        settling_time = float('inf')
+    else:
+        settling_time = (violations[-1] + 1) * surrogate.control_interval_s
+    return settling_time, overshoot
+
+def run_gain_sweep_test():
+    print("🚦 QUÉT THAM SỐ PI TRÊN MÔ HÌNH THAY THẾ MFD")
+    print("="*70)
+
+    surrogate = MFDSurrogate(g_max=3000.0, n_crit=280.0)
+    demand = peak_demand_profile(120, base=1500.0, peak=4200.0)
+    parameter_sets = grid_parameter_sets({'kp': [5, 20, 60], 'ki': [1, 5, 15], 'deactivation_factor': [0.7, 0.9]})
+    results = run_sweep(parameter_sets, surrogate, demand, num_workers=2, batch_size=4)
+
+    # Bộ tham số không có vùng trễ (deactivation_factor >= activation_factor) bị loại
+    assert len(results) == 9 and all(r['deactivation_factor'] == 0.7 for r in results)
+    for r in results:
+        settling_time, overshoot = surrogate_metrics(r, surrogate, demand)
+        assert r['settling_time_s'] == settling_time, (r, settling_time)
+        assert abs(r['overshoot'] - overshoot) < 1e-9, (r, overshoot)
+
+    # Xếp hạng theo thời gian ổn định, rồi độ vọt lố, rồi số lần giải
+    keys = [(r['settling_time_s'], round(r['overshoot'], 4), r['solves']) for r in results]
+    assert keys == sorted(keys)
+    assert len({r['settling_time_s'] for r in results}) > 1
+
+    best = results[0]
+    print(f"   • tốt nhất: kp={best['kp']}, ki={best['ki']}, ổn định {best['settling_time_s']:.0f}s, vọt lố {best['overshoot']:.2%}")
+    print("="*70)
+
+class FakeSimulation:
+    """Đồng hồ mô phỏng giả cho traci/libsumo: simulationStep(t) chạy tới t, simulationStep() chạy một bước."""
+
+    def __init__(self, step_length: float):
+        self.step_length = step_length
+        self.time = 0.0
+        self.loaded = True
+        self.calls = 0
+
+    def simulationStep(self, time: float = 0.):
+        self.calls += 1
+        self.time = round(max(time, self.time + self.step_length) if time else self.time + self.step_length, 6)
+
+    def getTime(self) -> float:
+        return self.time
+
+    def isLoaded(self) -> bool:
+        return self.loaded
+
+def run_sumo_engine_test():
+    print("🚦 CHỌN ENGINE MÔ PHỎNG: traci HOẶC libsumo (module giả lập)")
+    print("="*70)
+
+    os.environ.setdefault('SUMO_HOME', tempfile.gettempdir())
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+    import sumosim
+    traci = sumosim.traci
+    rebound = tuple(traci.__all__) + sumosim._TRACI_EXTRA_NAMES
+    originals = {name: getattr(traci, name) for name in rebound if hasattr(traci, name)}
+    original_libsumo = sys.modules.get('libsumo')
+    config = {'gui': True, 'step_length': 0.1, 'port': 8814}
+
+    def check_stepping(sim, clock):
+        assert sim.is_running()
+        assert abs(sim.step_to(5.0) - 5.0) < 1e-9 and sim.get_step_counts() == 50 and clock.calls == 1
+        sim.step_to(5.0)                      # đã tới mốc: vẫn chạy đúng một bước
+        assert abs(clock.time - 5.1) < 1e-9 and sim.get_step_counts() == 51
+        clock.loaded = False
+        assert not sim.is_running()
+
+    try:
+        # libsumo có mặt: API công khai của traci được gán lại sang libsumo
+        clock = FakeSimulation(config['step_length'])
+        libsumo = types.ModuleType('libsumo')
+        libsumo.simulation = clock
+        libsumo.simulationStep = clock.simulationStep
+        libsumo.isLoaded = clock.isLoaded
+        libsumo.trafficlight = types.SimpleNamespace(getPhase=lambda tl_id: 0)
+        libsumo.TraCIException = type('TraCIException', (Exception,), {})
+        sys.modules['libsumo'] = libsumo
+        sim = sumosim.SumoSim({**config, 'engine': 'libsumo'})
+        assert sim.engine == 'libsumo' and sim.gui is False
+        assert traci.simulation is clock and traci.trafficlight is libsumo.trafficlight
+        assert traci.TraCIException is libsumo.TraCIException
+        assert traci.constants is originals['constants'] and traci.vehicle is originals['vehicle']
+        check_stepping(sim, clock)
+        for name, value in originals.items():
+            setattr(traci, name, value)
+
+        # libsumo không import được: quay về traci, module traci giữ nguyên
+        sys.modules['libsumo'] = None
+        sim = sumosim.SumoSim({**config, 'engine': 'libsumo'})
+        assert sim.engine == 'traci' and sim.gui is True
+        assert all(getattr(traci, name) is value for name, value in originals.items())
+
+        # Engine traci (kết nối giả lập)
+        clock = FakeSimulation(config['step_length'])
+        traci.simulation = clock
+        traci.simulationStep = clock.simulationStep
+        traci.isLoaded = clock.isLoaded
+        sim = sumosim.SumoSim({**config, 'engine': 'traci'})
+        check_stepping(sim, clock)
+
+        try:
+            sumosim.SumoSim({**config, 'engine': 'sumo-rpc'})
+            raise AssertionError("engine không hợp lệ phải gây ValueError")
+        except ValueError:
+            pass
+    finally:
+        for name, value in originals.items():
+            setattr(traci, name, value)
+        if original_libsumo is None:
+            sys.modules.pop('libsumo', None)
+        else:
+            sys.modules['libsumo'] = original_libsumo
+
+    print("   • libsumo: gán lại traci.*, không có libsumo: dùng traci; step_to/is_running đúng với cả hai")
+    print("="*70)
+
 if __name__ == '__main__':
     run_perimeter_control_mock_test()
+    run_perimeter_control_replay_test()
+    run_perimeter_control_checkpoint_test()
+    run_snapshot_replay_test()
+    run_solver_backends_test()
+    run_presolve_infeasibility_test()
+    run_rounded_inflow_test()
+    run_dp_fallback_test()
+    run_decomposition_config_test()
+    run_plan_table_test()
+    run_solver_cache_test()
+    run_plan_store_test()
+    run_signal_scheduler_test()
+    run_detector_registry_test()
+    run_multi_region_test()
+    run_mpc_test()
+    run_gain_sweep_test()
+    run_sumo_engine_test()
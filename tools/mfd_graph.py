@@ -27,6 +27,7 @@ project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
 from src.sumosim import SumoSim
+from src.detector_sampler import DetectorSampler
 
 # Check SUMO_HOME
 if 'SUMO_HOME' not in os.environ:
@@ -67,6 +68,12 @@ def collect_data(sim_config, detector_config):
     
     try:
         sumo_sim.start() 
+
+        # Đăng ký một lần mọi detector; giá trị được trả về cùng mỗi bước mô phỏng.
+        # Cùng hệ số quy đổi với main.py, để n_crit của MFD cùng đơn vị với n(k) của bộ điều khiển
+        sampler = DetectorSampler(lanearea_ids=e2_detectors, inductionloop_ids=e1_detectors,
+                                  geometry=detector_config.get('detector_geometry'))
+        sampler.subscribe()
         
         # Simulation parameters
         simulation_time = 6000
@@ -84,30 +91,17 @@ def collect_data(sim_config, detector_config):
         
         for step in range(total_steps):
             sumo_sim.step()
+            sampler.refresh()
             
             # Luôn thu thập dữ liệu ở mỗi bước để tổng hợp
             # Lấy số xe hiện tại trong khu vực
-            current_accumulation = 0
-            for det_id in e2_detectors:
-                try:
-                    space_occupy = traci.lanearea.getLastIntervalOccupancy(det_id)
-                    road_length = 80
-                    num_lane = 1
-                    average_length_of_vehicles = 2.5
-                    accumulation = road_length * (num_lane / (100 * average_length_of_vehicles)) * space_occupy
-                    current_accumulation += accumulation
-                except traci.exceptions.TraCIException:
-                    pass
-            accumulation_samples.append(current_accumulation)
+            # (chiều dài, số làn của từng detector lấy từ mô phỏng, xem DetectorRegistry)
+            accumulation_samples.append(sampler.accumulation(e2_detectors))
             
             # Cộng dồn lưu lượng xe đi qua
-            for det_id in e1_detectors:
-                try:
-                    # Dù detector có chu kỳ 10s, việc cộng dồn mỗi step vẫn đảm bảo không mất dữ liệu
-                    if (step + 1) % 10 == 0 and step > 0:
-                        accumulated_flow += traci.inductionloop.getLastIntervalVehicleNumber(det_id)
-                except traci.exceptions.TraCIException:
-                    pass
+            # Dù detector có chu kỳ 10s, việc cộng dồn mỗi step vẫn đảm bảo không mất dữ liệu
+            if (step + 1) % 10 == 0 and step > 0:
+                accumulated_flow += sampler.total_vehicle_number(e1_detectors)
             
             # Sau mỗi 50 giây, tổng hợp và ghi lại một điểm dữ liệu
             if (step + 1) % steps_per_sample == 0 and step > 0:
@@ -177,6 +171,10 @@ def create_mfd_graph(data_points, output_dir):
         p = np.poly1d(z)
         x_trend = np.linspace(df['avg_accumulation'].min(), df['avg_accumulation'].max(), 100)
         plt.plot(x_trend, p(x_trend), 'r-', linewidth=2, label='Trend Line')
+        if z[0] < 0:
+            # Đỉnh của đường xu hướng: tham số MFD cho chế độ MPC (controller.mpc trong simulation.yml)
+            n_crit = -z[1] / (2 * z[0])
+            print(f"Fitted MFD: mfd_n_crit={n_crit:.0f} vehicles, mfd_g_max={p(n_crit):.0f} veh/h")
     
     # Customize graph with updated labels
     plt.title('Macroscopic Fundamental Diagram (MFD)', fontsize=16, fontweight='bold')
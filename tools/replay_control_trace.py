@@ -0,0 +1,52 @@
+import os
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+# Thiết lập logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Các module trong src import lẫn nhau theo dạng 'algorithm.*' / 'data.*'
+PROJECT_ROOT_PATH = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT_PATH / 'src'))
+
+from algorithm.algo import PerimeterController, KP_H, KI_H, N_HAT
+from algorithm.replay import ControlTrace, replay_trace
+
+def replay(trace_file: str, config_file: str, backend=None, output_file=None):
+    """
+    Phát lại chuỗi đo lường n(k)/hàng đợi (ghi với 'control_trace_file' hoặc file CSV) qua bộ điều khiển
+    và bộ giải, không cần SUMO. Quỹ đạo qg(k) và thời gian xanh được lưu ra output_file (.npz) nếu có.
+    """
+    if not os.path.exists(trace_file):
+        logging.error(f"❌ Không tìm thấy file chuỗi đo lường: {trace_file}")
+        return None
+
+    trace = ControlTrace.load(trace_file)
+    logging.info(f"Đã đọc {len(trace)} bước đo lường từ {trace_file}")
+    controller = PerimeterController(kp=KP_H, ki=KI_H, n_hat=N_HAT, config_file=config_file, backend=backend)
+    trajectory = replay_trace(controller, trace)
+
+    logging.info(f"✅ Phát lại {len(trace)} bước trong {trajectory.wall_time_s:.2f}s "
+                 f"({trajectory.steps_per_second:.0f} bước/s, thời gian giải {trajectory.solve_time.sum():.2f}s)")
+    logging.info(f"Số bước hoạt động: {int(trajectory.is_active.sum())}, "
+                 f"qg trung bình khi hoạt động: {trajectory.qg[trajectory.is_active].mean() if trajectory.is_active.any() else 0:.1f} xe/giờ")
+    if output_file:
+        trajectory.save(output_file)
+        logging.info(f"Đã lưu quỹ đạo vào {output_file}")
+    return trajectory
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Phát lại chuỗi đo lường qua bộ điều khiển chu vi (không cần SUMO).')
+    parser.add_argument('--trace-file', type=str, default=str(PROJECT_ROOT_PATH / 'output' / 'control_trace.npz'),
+                        help='File chuỗi đo lường (.npz ghi bởi main.py hoặc .csv với cột time, n và hàng đợi theo pha)')
+    parser.add_argument('--config-file', type=str, default=str(PROJECT_ROOT_PATH / 'src' / 'config' / 'intersection_config.json'),
+                        help='File cấu hình intersection')
+    parser.add_argument('--backend', type=str, default=None,
+                        help="Backend bộ giải (mặc định 'solver_backend' trong cấu hình; 'dp' cho tốc độ cao nhất)")
+    parser.add_argument('--output-file', type=str, default=None,
+                        help='File .npz lưu quỹ đạo qg(k) và thời gian xanh')
+    args = parser.parse_args()
+
+    replay(args.trace_file, args.config_file, args.backend, args.output_file)
@@ -0,0 +1,69 @@
+import os
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+# Thiết lập logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Các module trong src import lẫn nhau theo dạng 'algorithm.*' / 'data.*'
+PROJECT_ROOT_PATH = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT_PATH / 'src'))
+
+from data.intersection_config_manager import IntersectionConfigManager
+from algorithm.snapshot import load_snapshots, replay_snapshots
+
+def replay(log_file: str, config_file: str, backends, reference=None, limit=None):
+    """
+    Phát lại các ảnh chụp bài toán (ghi bởi PerimeterController với 'solver_snapshot_file')
+    qua các backend và in bảng so sánh độ trễ, giá trị mục tiêu và chênh lệch phương án
+    (Δrec, Δstatus: so với giá trị mục tiêu và trạng thái ghi lúc chạy, nếu có).
+    """
+    if not os.path.exists(log_file):
+        logging.error(f"❌ Không tìm thấy file ảnh chụp: {log_file}")
+        return None
+
+    snapshots = load_snapshots(log_file)
+    if limit:
+        snapshots = snapshots[:limit]
+    logging.info(f"Đã đọc {len(snapshots)} ảnh chụp từ {log_file}")
+
+    # Ẩn các dòng print chi tiết của bộ giải trong lúc phát lại
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            reports = replay_snapshots(snapshots, IntersectionConfigManager(config_file), backends, reference)
+        finally:
+            sys.stdout = stdout
+
+    reference = reference or backends[0]
+    print(f"\nTham chiếu: {reference}")
+    header = (f"{'backend':<16}{'solved':>8}{'p50 [s]':>10}{'p90 [s]':>10}{'max [s]':>10}{'mean obj':>14}{'max Δobj':>12}"
+              f"{'Δplan':>8}{'max ΔG':>8}{'max Δrec':>10}{'Δstatus':>9}")
+    print(header)
+    print('-' * len(header))
+    for report in reports.values():
+        summary = report.summary()
+        print(f"{summary['backend']:<16}{summary['solved']:>4}/{summary['snapshots']:<3}"
+              f"{summary['latency_p50_s']:>10.4f}{summary['latency_p90_s']:>10.4f}{summary['latency_max_s']:>10.4f}"
+              f"{summary['objective_mean']:>14.3f}{summary['objective_diff_max']:>12.3f}"
+              f"{summary['plans_changed']:>8}{summary['plan_diff_max_s']:>8.0f}"
+              f"{summary['recorded_diff_max']:>10.3f}{summary['status_changes']:>9}")
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Phát lại ảnh chụp bài toán của bộ giải qua các backend (benchmark hồi quy).')
+    parser.add_argument('--log-file', type=str, default=str(PROJECT_ROOT_PATH / 'output' / 'solver_snapshots.jsonl.gz'),
+                        help='File ảnh chụp (.jsonl.gz) ghi trong lúc chạy mô phỏng')
+    parser.add_argument('--config-file', type=str, default=str(PROJECT_ROOT_PATH / 'src' / 'config' / 'intersection_config.json'),
+                        help='File cấu hình intersection của mạng lưới đã ghi')
+    parser.add_argument('--backends', nargs='+', default=['scip', 'dp'],
+                        help='Các backend cần so sánh')
+    parser.add_argument('--reference', type=str, default=None,
+                        help='Backend tham chiếu (mặc định backend đầu tiên)')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Chỉ phát lại N ảnh chụp đầu tiên')
+    args = parser.parse_args()
+
+    replay(args.log_file, args.config_file, args.backends, args.reference, args.limit)
@@ -0,0 +1,81 @@
+import os
+import sys
+import csv
+import argparse
+import logging
+from pathlib import Path
+
+# Thiết lập logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Các module trong src import lẫn nhau theo dạng 'algorithm.*' / 'data.*'
+PROJECT_ROOT_PATH = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT_PATH / 'src'))
+
+from algorithm.algo import KP_H, KI_H, N_HAT, ACTIVATION_FACTOR, DEACTIVATION_FACTOR
+from algorithm.replay import ControlTrace
+from algorithm.tuning import MFDSurrogate, grid_parameter_sets, random_parameter_sets, run_sweep
+
+def sweep(args):
+    """
+    Quét Kp, Ki, n̂ và hệ số ngưỡng trên mô hình thay thế MFD, in các bộ tham số tốt nhất
+    và (tùy chọn) ghi toàn bộ kết quả ra CSV.
+    """
+    surrogate = MFDSurrogate(g_max=args.g_max, n_crit=args.n_crit)
+    demand = None
+    if args.trace_file:
+        if not os.path.exists(args.trace_file):
+            logging.error(f"❌ Không tìm thấy file chuỗi đo lường: {args.trace_file}")
+            return None
+        demand = surrogate.demand_from_trace(ControlTrace.load(args.trace_file))
+        logging.info(f"Nhu cầu suy ra từ {args.trace_file}: {len(demand)} bước")
+
+    if args.random:
+        bounds = {'kp': (min(args.kp), max(args.kp)), 'ki': (min(args.ki), max(args.ki)),
+                  'n_hat': (min(args.n_hat), max(args.n_hat)),
+                  'activation_factor': (min(args.activation_factor), max(args.activation_factor)),
+                  'deactivation_factor': (min(args.deactivation_factor), max(args.deactivation_factor))}
+        parameter_sets = random_parameter_sets(bounds, args.random, seed=args.seed)
+    else:
+        parameter_sets = grid_parameter_sets({'kp': args.kp, 'ki': args.ki, 'n_hat': args.n_hat,
+                                              'activation_factor': args.activation_factor,
+                                              'deactivation_factor': args.deactivation_factor})
+    logging.info(f"Đánh giá {len(parameter_sets)} bộ tham số trên {args.workers} tiến trình")
+    results = run_sweep(parameter_sets, surrogate, demand, gated_share=args.gated_share, num_workers=args.workers)
+
+    print(f"\n{'kp':>8}{'ki':>8}{'n_hat':>8}{'act':>7}{'deact':>7}{'settle [s]':>12}{'overshoot':>11}{'solves':>8}{'churn':>10}{'gate [xe·h]':>13}")
+    for r in results[:args.top]:
+        print(f"{r['kp']:>8.2f}{r['ki']:>8.2f}{r['n_hat']:>8.0f}{r['activation_factor']:>7.2f}{r['deactivation_factor']:>7.2f}"
+              f"{r['settling_time_s']:>12.0f}{r['overshoot']:>11.2%}{r['solves']:>8}{r['plan_churn']:>10.0f}{r['gate_delay_veh_h']:>13.1f}")
+
+    if args.output_file and results:
+        with open(args.output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+        logging.info(f"Đã ghi {len(results)} kết quả vào {args.output_file}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Quét tham số bộ điều khiển PI trên mô hình thay thế MFD (không cần SUMO).')
+    parser.add_argument('--kp', type=float, nargs='+', default=[5, 10, KP_H, 40], help='Các giá trị Kp [1/giờ]')
+    parser.add_argument('--ki', type=float, nargs='+', default=[1, 2, KI_H, 10], help='Các giá trị Ki [1/giờ]')
+    parser.add_argument('--n-hat', type=float, nargs='+', default=[N_HAT], help='Các giá trị n̂ [xe]')
+    parser.add_argument('--activation-factor', type=float, nargs='+', default=[0.8, ACTIVATION_FACTOR, 0.9],
+                        help='Hệ số ngưỡng kích hoạt (theo n̂)')
+    parser.add_argument('--deactivation-factor', type=float, nargs='+', default=[0.6, DEACTIVATION_FACTOR, 0.8],
+                        help='Hệ số ngưỡng hủy kích hoạt (theo n̂)')
+    parser.add_argument('--random', type=int, default=0,
+                        help='Số mẫu tìm kiếm ngẫu nhiên trong khoảng [min, max] của các giá trị trên (0 = lưới)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed cho tìm kiếm ngẫu nhiên')
+    parser.add_argument('--trace-file', type=str, default=None,
+                        help='Chuỗi đo lường đã ghi (.npz/.csv) để suy ra nhu cầu (mặc định: hồ sơ giờ cao điểm)')
+    parser.add_argument('--g-max', type=float, default=3000.0, help='Lưu lượng ra cực đại của MFD [xe/giờ]')
+    parser.add_argument('--n-crit', type=float, default=N_HAT, help='Tích lũy tới hạn của MFD [xe]')
+    parser.add_argument('--gated-share', type=float, default=0.5, help='Tỉ lệ nhu cầu đi qua các nút giao chắn')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Số tiến trình con')
+    parser.add_argument('--top', type=int, default=10, help='Số bộ tham số tốt nhất được in')
+    parser.add_argument('--output-file', type=str, default=None, help='File CSV ghi toàn bộ kết quả đã xếp hạng')
+    args = parser.parse_args()
+
+    sweep(args)